@@ -0,0 +1,79 @@
+import os
+import io
+import zipfile
+import hashlib
+from flat_opc import DEFAULT_OUTPUT_FORMAT, iter_flat_package
+
+# 可重現輸出模式，可透過環境變數預設啟用
+DEFAULT_DETERMINISTIC = os.environ.get("QUOTE_DETERMINISTIC", "0").lower() in ("1", "true", "yes")
+
+# ZIP 格式可表示的最早時間，作為所有項目的固定時間戳
+FIXED_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+CONTENT_TYPES_ENTRY = "[Content_Types].xml"
+
+def _entry_order(name):
+    """[Content_Types].xml 置於最前，其餘依名稱排序"""
+    return (name != CONTENT_TYPES_ENTRY, name)
+
+def normalize_package(data):
+    """
+    重新封裝 docx 的 ZIP 容器使其位元組可重現
+
+    固定每個項目的時間戳、權限、建立系統與順序；XML 內容由 lxml 依相同的
+    元素樹序列化，本身已是穩定的，因此不需重新序列化
+
+    參數:
+    data -- docx 檔案內容
+
+    返回:
+    bytes -- 重新封裝後的 docx 內容
+    """
+    output = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(data)) as source, zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as target:
+        for name in sorted(source.namelist(), key=_entry_order):
+            info = zipfile.ZipInfo(name, date_time=FIXED_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.create_system = 0
+            info.external_attr = 0o644 << 16
+            target.writestr(info, source.read(name))
+    return output.getvalue()
+
+def save_flat_document(doc, file_path):
+    """
+    以 Flat OPC 單一 XML 檔保存文檔，邊產生邊寫入並計算 SHA-256
+
+    不經過 ZIP 封裝，內容本身即可重現
+
+    返回:
+    str -- 檔案內容的 SHA-256 (十六進位)
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'wb') as f:
+        for chunk in iter_flat_package(doc):
+            f.write(chunk)
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def save_document(doc, file_path, deterministic=False, output_format=DEFAULT_OUTPUT_FORMAT):
+    """
+    保存文檔並返回內容的 SHA-256
+
+    參數:
+    doc -- Document 對象
+    file_path -- 輸出路徑
+    deterministic -- 是否以固定時間戳與順序重新封裝
+    output_format -- 輸出格式 (docx 或 flat_xml)
+
+    返回:
+    str -- 檔案內容的 SHA-256 (十六進位)
+    """
+    if output_format == "flat_xml":
+        return save_flat_document(doc, file_path)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    data = buffer.getvalue()
+    if deterministic:
+        data = normalize_package(data)
+    with open(file_path, 'wb') as f:
+        f.write(data)
+    return hashlib.sha256(data).hexdigest()
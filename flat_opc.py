@@ -0,0 +1,84 @@
+import re
+import base64
+from xml.sax.saxutils import quoteattr
+from lxml import etree
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.opc.packuri import PACKAGE_URI
+from docx.opc.part import XmlPart
+
+# 輸出格式: docx 為一般 ZIP 封裝；flat_xml 為 Word 2003 XML 形式的單一 XML 檔 (Flat OPC)
+OUTPUT_FORMATS = ("docx", "flat_xml")
+DEFAULT_OUTPUT_FORMAT = "docx"
+OUTPUT_EXTENSIONS = {"docx": ".docx", "flat_xml": ".xml"}
+
+PKG_NAMESPACE = "http://schemas.microsoft.com/office/2006/xmlPackage"
+# mso-application 處理指令讓 Windows 與 Word 將檔案辨識為 Word 文件
+PACKAGE_HEADER = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<?mso-application progid="Word.Document"?>\n'
+    b'<pkg:package xmlns:pkg="' + PKG_NAMESPACE.encode() + b'">'
+)
+PACKAGE_FOOTER = b'</pkg:package>'
+
+XML_DECLARATION = re.compile(rb'^\s*<\?xml[^>]*\?>\s*')
+# Word 產生的 Flat OPC 以 76 字元換行 base64 內容
+BASE64_LINE_LENGTH = 76
+
+def output_extension(output_format):
+    """輸出格式對應的副檔名"""
+    return OUTPUT_EXTENSIONS[output_format]
+
+def _xml_part(name, content_type, xml, padding=None):
+    """組成內嵌 XML 內容的 pkg:part"""
+    attrs = f'pkg:name={quoteattr(name)} pkg:contentType={quoteattr(content_type)}'
+    if padding:
+        attrs += f' pkg:padding="{padding}"'
+    return b''.join((f'<pkg:part {attrs}><pkg:xmlData>'.encode(), xml, b'</pkg:xmlData></pkg:part>'))
+
+def _binary_part(name, content_type, blob):
+    """組成 base64 內容的 pkg:part (圖片等二進位項目)"""
+    encoded = base64.b64encode(blob)
+    lines = b'\n'.join(encoded[i:i + BASE64_LINE_LENGTH] for i in range(0, len(encoded), BASE64_LINE_LENGTH))
+    attrs = f'pkg:name={quoteattr(name)} pkg:contentType={quoteattr(content_type)} pkg:compression="store"'
+    return b''.join((f'<pkg:part {attrs}><pkg:binaryData>'.encode(), lines, b'</pkg:binaryData></pkg:part>'))
+
+def _strip_declaration(xml):
+    """移除 XML 宣告，內嵌於 pkg:xmlData 的內容不能帶有宣告"""
+    if isinstance(xml, str):
+        xml = xml.encode("utf-8")
+    return XML_DECLARATION.sub(b'', xml, count=1)
+
+def _part_xml(part):
+    """取得項目的 XML 內容; XmlPart 直接序列化元素樹，不需先產生帶宣告的 blob"""
+    if isinstance(part, XmlPart):
+        return etree.tostring(part.element, encoding="UTF-8", xml_declaration=False)
+    return _strip_declaration(part.blob)
+
+def iter_flat_package(doc):
+    """
+    以 Flat OPC 格式逐段產生文檔內容
+
+    每個封裝項目 (含關聯 .rels) 成為一個 pkg:part；XML 項目直接內嵌，
+    其他項目以 base64 保存，不做 ZIP 壓縮
+
+    參數:
+    doc -- Document 對象
+
+    返回:
+    generator -- bytes 片段
+    """
+    package = doc.part.package
+    parts = list(package.iter_parts())
+    for part in parts:
+        part.before_marshal()
+
+    yield PACKAGE_HEADER
+    yield _xml_part(PACKAGE_URI.rels_uri, CT.OPC_RELATIONSHIPS, _strip_declaration(package.rels.xml), padding=512)
+    for part in parts:
+        if part.content_type.endswith("xml"):
+            yield _xml_part(part.partname, part.content_type, _part_xml(part))
+        else:
+            yield _binary_part(part.partname, part.content_type, part.blob)
+        if len(part.rels):
+            yield _xml_part(part.partname.rels_uri, CT.OPC_RELATIONSHIPS, _strip_declaration(part.rels.xml), padding=256)
+    yield PACKAGE_FOOTER
@@ -1,32 +1,66 @@
 import os
+import io
 import json
 import re
 import binascii
 import time
+import copy
+import logging
+import functools
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
 from docx import Document
 from docx.shared import Pt, Inches, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.enum.table import WD_ALIGN_VERTICAL, WD_TABLE_ALIGNMENT
 from docx.oxml.ns import qn
-from docx.table import _Cell
+from docx.table import Table, _Cell
+from lxml import etree
 from datetime import datetime
+from quote_pricing import DEFAULT_PRICING_MODE, reconcile_quotes, round_half_up, summarize_issues, to_number
+from memory_budget import MemoryBudget
+from deterministic_docx import DEFAULT_DETERMINISTIC, save_document
+from flat_opc import DEFAULT_OUTPUT_FORMAT, OUTPUT_FORMATS, output_extension
+from quote_variants import expand_variants
+from line_items import LineItemStream, has_items_file
+from row_cache import row_fragment_cache, row_layout_key
+from price_catalog import CATALOG_PATH, fill_missing_prices, get_catalog, summarize_fills
+from render_plan import ITEM_PLACEHOLDERS, PLACEHOLDER_PATTERN, load_render_plan, plan_row_prototype, plan_template_info
 
-# 全局進度回調函數
-_progress_callback = None
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 預設模板，可透過環境變數改用其他模板 (例如 optimize_template.py 產生的精簡模板)
+TEMPLATE_PATH = os.environ.get("QUOTE_TEMPLATE_PATH") or os.path.join(PROJECT_DIR, "報價單.docx")
+DEFAULT_OUTPUT_DIR = os.path.join(PROJECT_DIR, "temp")
+
+# 目前執行緒 (或協程) 中正在生成的渲染器，進度與日誌都送往該渲染器
+_active_renderer = contextvars.ContextVar("active_renderer", default=None)
+
+# 進行中的生成 (輸出目錄 -> 數量)；目錄中仍有其他生成時不清理舊檔案，避免刪除對方剛寫出的輸出
+_active_outputs = Counter()
+_active_outputs_lock = threading.Lock()
+
+# 不在生成中 (例如驗證工具單獨標準化輸入) 的訊息走 logging；STDIO 伺服器的 stdout 是 JSON-RPC 通道，不能直接印出
+logger = logging.getLogger("generate-quote-docs")
+
+class RenderCancelled(Exception):
+    """生成工作在報價單之間被取消或逾時"""
 
 def set_progress_callback(callback):
     """
-    設置進度回調函數
+    設置預設渲染器 (模組層級函數使用) 的進度回調函數
+
+    需要各自回調的並發生成請改用各自的 QuoteRenderer
 
     參數:
     callback -- 回調函數 (step, message, progress, result)
     """
-    global _progress_callback
-    _progress_callback = callback
+    _default_renderer.progress_callback = callback
 
 def report_progress(step, message, progress=None, result=None):
     """
-    報告處理進度
+    報告處理進度 (送往目前正在生成的渲染器)
 
     參數:
     step -- 處理步驟
@@ -34,9 +68,17 @@ def report_progress(step, message, progress=None, result=None):
     progress -- 完成百分比 (0-100)
     result -- 處理結果
     """
-    global _progress_callback
-    if _progress_callback:
-        _progress_callback(step, message, progress, result)
+    renderer = _active_renderer.get()
+    if renderer is not None:
+        renderer.report_progress(step, message, progress, result)
+
+def log(message):
+    """輸出生成過程的訊息到目前渲染器的日誌，不在生成中時寫入模組的 logger"""
+    renderer = _active_renderer.get()
+    if renderer is None:
+        logger.info(message)
+    else:
+        renderer.log(message)
 
 def set_cell_border(cell, **kwargs):
     """
@@ -100,10 +142,10 @@ from docx.oxml import parse_xml
 from docx.oxml import OxmlElement
 
 def format_number(value):
-    """將數字格式化為整數"""
+    """將數字四捨五入格式化為整數"""
     try:
         if isinstance(value, (int, float)):
-            return str(int(value))
+            return str(round_half_up(value))
         return value
     except:
         return value
@@ -120,16 +162,16 @@ def analyze_template(template_path):
     
     try:
         doc = Document(template_path)
-        print(f"分析模板: {template_path}")
-        print(f"段落數: {len(doc.paragraphs)}")
-        print(f"表格數: {len(doc.tables)}")
+        log(f"分析模板: {template_path}")
+        log(f"段落數: {len(doc.paragraphs)}")
+        log(f"表格數: {len(doc.tables)}")
         
         # 尋找所有段落中的佔位符
         for i, para in enumerate(doc.paragraphs):
             # 顯示段落的原始內容
             text = para.text
             if "{" in text or "}" in text:
-                print(f"段落 {i+1} 內容: '{text}'")
+                log(f"段落 {i+1} 內容: '{text}'")
                 
             # 使用正則表達式尋找佔位符 - 適用於{fieldName}格式
             matches = re.findall(r'{([^{}]+)}', text)
@@ -137,7 +179,7 @@ def analyze_template(template_path):
                 for match in matches:
                     clean_match = match.strip()
                     template_info["placeholders"].add(clean_match)
-                print(f"段落 {i+1}: 找到佔位符 {matches}")
+                log(f"段落 {i+1}: 找到佔位符 {matches}")
         
         # 分析所有表格
         for i, table in enumerate(doc.tables):
@@ -156,7 +198,7 @@ def analyze_template(template_path):
                         
                         # 顯示含有大括號的單元格內容
                         if "{" in cell_text or "}" in cell_text:
-                            print(f"表格 {i+1}, 行 {r+1}, 列 {c+1}, 段落 {p+1} 內容: '{cell_text}'")
+                            log(f"表格 {i+1}, 行 {r+1}, 列 {c+1}, 段落 {p+1} 內容: '{cell_text}'")
                         
                         # 使用正則表達式尋找佔位符 - 適用於{fieldName}格式
                         matches = re.findall(r'{([^{}]+)}', cell_text)
@@ -164,7 +206,7 @@ def analyze_template(template_path):
                             for match in matches:
                                 clean_match = match.strip()
                                 table_info["placeholders"].add(clean_match)
-                            print(f"表格 {i+1}, 行 {r+1}, 列 {c+1}: 找到佔位符 {matches}")
+                            log(f"表格 {i+1}, 行 {r+1}, 列 {c+1}: 找到佔位符 {matches}")
             
             # 判斷是否為項目表格 (含有類別、項目、單價、數量、金額等表頭)
             if len(table.rows) > 0:
@@ -173,21 +215,21 @@ def analyze_template(template_path):
                 if any(keyword in header_text for keyword in ["類別", "項目", "單價", "數量", "金額"]):
                     table_info["is_item_table"] = True
                     template_info["item_table_index"] = i
-                    print(f"表格 {i+1} 被識別為項目表格, 表頭: {headers}")
+                    log(f"表格 {i+1} 被識別為項目表格, 表頭: {headers}")
             
             template_info["tables_info"].append(table_info)
         
         # 總結發現的佔位符
         if template_info["placeholders"]:
-            print("\n模板中的所有佔位符:")
+            log("\n模板中的所有佔位符:")
             for p in sorted(template_info["placeholders"]):
-                print(f"- {p}")
+                log(f"- {p}")
         
         report_progress('analyzing', '模板分析完成', 10)
         return template_info
     except Exception as e:
         error_message = f"分析模板時發生錯誤: {str(e)}"
-        print(error_message)
+        log(error_message)
         report_progress('error', error_message, 0)
         return template_info
 
@@ -206,8 +248,7 @@ def replace_text_with_field_value(paragraph, field_mapping):
     changed = False
     
     # 不處理 {#items} 和 {/items} 標籤，以及項目表格相關的佔位符
-    skip_placeholders = ["{#items}", "{/items}", "{category}", "{items}", "{unit}", "{quantity}", "{amount}"]
-    for skip in skip_placeholders:
+    for skip in ITEM_PLACEHOLDERS:
         if skip in text:
             return False
         
@@ -239,16 +280,16 @@ def replace_text_with_field_value(paragraph, field_mapping):
             placeholder = f"{{{clean_field}}}"
             replacement = field_mapping[clean_field]
             new_text = new_text.replace(placeholder, str(replacement))
-            print(f"替換: '{placeholder}' → '{replacement}'")
+            log(f"替換: '{placeholder}' → '{replacement}'")
             changed = True
         else:
             # 只有當不是項目表格相關的佔位符時才顯示警告
             if clean_field not in ["category", "items", "unit", "quantity", "amount"]:
-                print(f"警告: 佔位符 '{clean_field}' 在欄位對應中不存在")
+                log(f"警告: 佔位符 '{clean_field}' 在欄位對應中不存在")
     
     if changed:
-        print(f"替換前: '{text}'")
-        print(f"替換後: '{new_text}'")
+        log(f"替換前: '{text}'")
+        log(f"替換後: '{new_text}'")
         
         # 清空段落
         paragraph.clear()
@@ -320,7 +361,7 @@ def cleanup_temp_files(temp_dir, file_prefix="quote_"):
                 try:
                     file_path = os.path.join(temp_dir, file_name)
                     os.remove(file_path)
-                    print(f"已刪除舊檔案: {file_path}")
+                    log(f"已刪除舊檔案: {file_path}")
                 except:
                     pass
     except:
@@ -362,9 +403,9 @@ def create_field_mapping(quote):
         header = quote["header"]
         
         # 添加調試日誌
-        print(f"處理報價單: {header.get('quoteNumber', 'Unknown')}")
-        print(f"Header 內容: {header}")
-        print(f"Quote 其他欄位: {[k for k in quote.keys() if k != 'header']}")
+        log(f"處理報價單: {header.get('quoteNumber', 'Unknown')}")
+        log(f"Header 內容: {header}")
+        log(f"Quote 其他欄位: {[k for k in quote.keys() if k != 'header']}")
         
         # 創建欄位映射 (佔位符名稱 -> 值)
         field_mapping = {
@@ -390,9 +431,9 @@ def create_field_mapping(quote):
             
             # 總計資訊（動態計算）
             "subtotal": format_number(quote.get('total_without_tax', 0)),
-            "discountPercentage": str(int((quote.get('discount', 0) / quote.get('total_without_tax', 1)) * 100)) if quote.get('total_without_tax', 0) > 0 else "0", 
+            "discountPercentage": str(round_half_up((quote.get('discount', 0) / quote.get('total_without_tax', 1)) * 100)) if quote.get('total_without_tax', 0) > 0 else "0", 
             "discount": format_number(quote.get('discount', 0)),
-            "taxRate": str(int((quote.get('tax_rate', 0) / (quote.get('total_without_tax', 1) - quote.get('discount', 0))) * 100)) if (quote.get('total_without_tax', 0) - quote.get('discount', 0)) > 0 else "5", 
+            "taxRate": str(round_half_up((quote.get('tax_rate', 0) / (quote.get('total_without_tax', 1) - quote.get('discount', 0))) * 100)) if (quote.get('total_without_tax', 0) - quote.get('discount', 0)) > 0 else "5", 
             "tax": format_number(quote.get('tax_rate', 0)),
             "total": format_number(quote.get('total_with_tax', 0)),
             
@@ -403,176 +444,330 @@ def create_field_mapping(quote):
         
         return field_mapping
     except KeyError as e:
-        print(f"欄位映射錯誤: {str(e)}")
+        log(f"欄位映射錯誤: {str(e)}")
         raise
     except Exception as e:
-        print(f"創建欄位映射時發生未知錯誤: {str(e)}")
+        log(f"創建欄位映射時發生未知錯誤: {str(e)}")
         raise
 
-def format_items_table(doc, items_table, details, quote):
+# 項目行各欄的格式 (文字欄垂直置中，數字欄另外靠右)
+ITEM_TEXT_STYLE = {"vertical_align": "center"}
+ITEM_NUMBER_STYLE = {"align": "right", "vertical_align": "center"}
+
+def item_row_values(item, col_count):
+    """
+    依表格欄數返回項目行各欄的文字
+
+    參數:
+    item -- 項目數據
+    col_count -- 項目表格欄數
+
+    返回:
+    list -- 各欄文字，不支援的欄數返回空列表
+    """
+    if col_count >= 5:  # 標準五列表格 (類別, 項目, 單價, 數量, 金額)
+        return [
+            item.get("category", ""),
+            item.get("items", ""),
+            format_number(item.get('unit', 0)),
+            format_number(item.get('quantity', 0)),
+            format_number(item.get('amount', 0)),
+        ]
+    if col_count == 4:  # 四列表格 (項目, 單價, 數量, 金額)
+        return [
+            item.get("items", ""),
+            format_number(item.get('unit', 0)),
+            format_number(item.get('quantity', 0)),
+            format_number(item.get('amount', 0)),
+        ]
+    return []
+
+def fill_item_row(row, values):
+    """設置項目行每個單元格的值和對齊方式"""
+    for cell, value in zip(row.cells, values):
+        cell.text = value
+    text_cols = len(values) - 3
+    for i, cell in enumerate(row.cells[:len(values)]):
+        apply_cell_style(cell, ITEM_TEXT_STYLE if i < text_cols else ITEM_NUMBER_STYLE)
+
+def build_item_row_prototype(items_table):
+    """
+    建立已套用格式的空白項目行，供生成時直接複製
+
+    以 add_row 加上 fill_item_row 建立後從表格移除，
+    複製後只需填入文字，結果與逐格設置相同
+    """
+    row = items_table.add_row()
+    fill_item_row(row, [""] * len(item_row_values({}, len(row.cells))))
+    items_table._tbl.remove(row._tr)
+    return row._tr
+
+def clone_item_row(prototype, values, layout=None):
+    """
+    複製項目行原型並填入各欄文字
+
+    指定 layout (row_layout_key 的結果) 時先查詢行片段快取，
+    相同版面與內容的項目行直接複製已完成的片段
+    """
+    use_cache = layout is not None and row_fragment_cache.enabled
+    if use_cache:
+        tr = row_fragment_cache.get(layout, values)
+        if tr is not None:
+            return tr
+    tr = copy.deepcopy(prototype)
+    for tc, value in zip(tr.tc_lst, values):
+        tc.p_lst[0].r_lst[0].text = value
+    if use_cache:
+        row_fragment_cache.put(layout, values, tr)
+    return tr
+
+# 類別小計行的格式
+CATEGORY_SUBTOTAL_STYLE = {"align": "right", "bold": True}
+
+def build_category_prototypes(items_table, row_prototype=None):
+    """
+    建立依類別分組時使用的行原型
+
+    五欄表格的類別欄在同一類別內垂直合併 (首行開始合併、後續行與小計行延續合併)，
+    小計行的 項目~數量 欄水平合併為標籤；四欄表格沒有類別欄，小計行標籤註明類別
+
+    參數:
+    items_table -- 項目表格對象
+    row_prototype -- 渲染計畫中的項目行原型 (可選，未提供時從表格建立)
+
+    返回:
+    dict -- first、rest (項目行原型) 與其版面鍵 first_layout、rest_layout、subtotal (小計行原型)、
+            label_index、amount_index (小計行標籤與金額欄位置) 與 has_category
+    """
+    if row_prototype is None:
+        row_prototype = build_item_row_prototype(items_table)
+    has_category = len(row_prototype.tc_lst) >= 5
+    first, rest = copy.deepcopy(row_prototype), copy.deepcopy(row_prototype)
+    
+    row = items_table.add_row()
+    cells = row.cells
+    if has_category:
+        first.tc_lst[0].vMerge = "restart"
+        rest.tc_lst[0].vMerge = "continue"
+        cells[0].text = ""
+        cells[0]._tc.vMerge = "continue"
+        label, amount = cells[1].merge(cells[3]), cells[4]
+    else:
+        label, amount = cells[0].merge(cells[2]), cells[3]
+    label.text = ""
+    amount.text = ""
+    apply_cell_style(label, CATEGORY_SUBTOTAL_STYLE)
+    apply_cell_style(amount, CATEGORY_SUBTOTAL_STYLE)
+    items_table._tbl.remove(row._tr)
+    
+    return {
+        "first": first,
+        "rest": rest,
+        "first_layout": row_layout_key(first),
+        "rest_layout": row_layout_key(rest),
+        "subtotal": row._tr,
+        "label_index": 1 if has_category else 0,
+        "amount_index": 2 if has_category else 1,
+        "has_category": has_category,
+    }
+
+def append_grouped_item_rows(items_table, details, prototypes):
+    """
+    依類別分組寫入項目行，每個類別之後加上類別小計行
+
+    只走訪項目一次：每個項目直接複製為行並放進所屬類別的分組 (依類別第一次出現的順序)，
+    同時累計類別小計，走訪完再依序接到表格
+
+    參數:
+    items_table -- 項目表格對象
+    details -- 項目列表或 LineItemStream
+    prototypes -- build_category_prototypes 的結果
+
+    返回:
+    int -- 寫入的項目數
+    """
+    groups = {}
+    col_count = len(prototypes["first"].tc_lst)
+    count = 0
+    for item in details:
+        category = item.get("category") or ""
+        values = item_row_values(item, col_count)
+        group = groups.get(category)
+        if group is None:
+            group = groups[category] = {"rows": [], "subtotal": 0.0}
+            kind = "first"
+        else:
+            kind = "rest"
+            # 合併後只顯示首行的類別
+            if prototypes["has_category"]:
+                values[0] = ""
+        group["rows"].append(clone_item_row(prototypes[kind], values, prototypes[f"{kind}_layout"]))
+        group["subtotal"] += to_number(item.get("amount")) or 0.0
+        count += 1
+    
+    tbl = items_table._tbl
+    for category, group in groups.items():
+        for tr in group["rows"]:
+            tbl.append(tr)
+        subtotal_tr = copy.deepcopy(prototypes["subtotal"])
+        tcs = subtotal_tr.tc_lst
+        label = "小計" if prototypes["has_category"] or not category else f"{category} 小計"
+        tcs[prototypes["label_index"]].p_lst[0].r_lst[0].text = label
+        tcs[prototypes["amount_index"]].p_lst[0].r_lst[0].text = format_number(group["subtotal"])
+        tbl.append(subtotal_tr)
+    return count
+
+# 合計行的標籤與格式: 種類 -> (標籤, 標籤欄格式, 金額欄格式)
+SUMMARY_ROWS = {
+    "subtotal": ("小計", {"align": "right", "bold": True}, {"align": "right", "bold": True}),
+    "discount": ("折扣", {"align": "right"}, {"align": "right"}),
+    "tax": ("稅金 (5%)", {"align": "right"}, {"align": "right"}),
+    "total": ("總計", {"align": "right", "bold": True}, {"align": "right", "bold": True, "fill_color": "E6E6E6"}),
+}
+
+def add_summary_row(items_table, kind, value):
+    """
+    在項目表格末端加上合計行
+
+    五欄表格合併 類別~數量 欄、四欄表格合併 項目~數量 欄作為標籤，最後的金額欄填入 value；
+    欄數更少的表格只加上空白行
+    """
+    row = items_table.add_row()
+    cells = row.cells
+    if len(cells) < 4:
+        return row
+    label, label_style, value_style = SUMMARY_ROWS[kind]
+    value_index = 4 if len(cells) >= 5 else 3
+    cells[0].merge(cells[value_index - 1])
+    cells = row.cells
+    cells[0].text = label
+    cells[value_index].text = value
+    apply_cell_style(cells[0], label_style)
+    apply_cell_style(cells[value_index], value_style)
+    return row
+
+# 合計行原型 (表格屬性與格線 -> 原型)，原型只供複製、不會被修改，可跨執行緒共用
+_summary_prototypes = {}
+_summary_prototypes_lock = threading.Lock()
+SUMMARY_PROTOTYPE_LIMIT = 32
+
+def build_summary_prototypes(items_table):
+    """
+    建立已合併儲存格並套用格式的合計行原型 (金額欄留空)
+
+    合併儲存格與設定格式佔了合計行大部分的成本；新行只依表格屬性與格線決定，
+    因此同一模板的原型只建立一次，各份報價單 (例如同一組方案) 只需複製並填入金額
+
+    返回:
+    dict -- 種類 -> 行原型 (w:tr)
+    """
+    tbl = items_table._tbl
+    key = etree.tostring(tbl.tblPr) + etree.tostring(tbl.tblGrid)
+    with _summary_prototypes_lock:
+        prototypes = _summary_prototypes.get(key)
+        if prototypes is not None:
+            return prototypes
+
+        # 在只有表格屬性與格線的空白表格上合併，不需走訪既有的行
+        scratch = tbl.makeelement(tbl.tag, {})
+        scratch.append(copy.deepcopy(tbl.tblPr))
+        scratch.append(copy.deepcopy(tbl.tblGrid))
+        scratch_table = Table(scratch, items_table._parent)
+        prototypes = {}
+        for kind in SUMMARY_ROWS:
+            row = add_summary_row(scratch_table, kind, "")
+            scratch.remove(row._tr)
+            prototypes[kind] = row._tr
+
+        if len(_summary_prototypes) >= SUMMARY_PROTOTYPE_LIMIT:
+            _summary_prototypes.clear()
+        _summary_prototypes[key] = prototypes
+        return prototypes
+
+def append_summary_row(items_table, kind, value, prototypes=None):
+    """加上合計行，有原型時複製原型並填入金額，否則逐格建立"""
+    if prototypes is None:
+        add_summary_row(items_table, kind, value)
+        return
+    tr = copy.deepcopy(prototypes[kind])
+    # 合併後的行為 標籤欄、金額欄 (及其後的欄位)；未合併的窄表格沒有金額
+    if len(tr.tc_lst) < len(items_table.columns):
+        tr.tc_lst[1].p_lst[0].r_lst[0].text = value
+    items_table._tbl.append(tr)
+
+def format_items_table(doc, items_table, details, quote, row_prototype=None, prefilled=0, group_by_category=False, summary_rows=None):
     """
     格式化項目表格
     
     參數:
     doc -- Document對象
     items_table -- 項目表格對象
-    details -- 項目詳情列表
-    quote -- 報價單數據
+    details -- 項目詳情列表，或由項目檔串流讀取的 LineItemStream
+    quote -- 報價單數據 (串流項目時會補上缺少的合計欄位)
+    row_prototype -- 渲染計畫中的項目行原型 (可選)
+    prefilled -- 表格中已預先填入的項目行數 (方案共用的前段項目)
+    group_by_category -- 是否依類別分組並加上各類別小計行 (不可與 prefilled 併用)
+    summary_rows -- build_summary_prototypes 建立的合計行原型 (可選)
     """
     report_progress('processing', '正在處理項目表格', 40)
     
-    # 保留標題行，刪除其他範例行
-    if len(items_table.rows) > 1:
-        # 刪除第一行以外的所有行
-        for i in range(len(items_table.rows) - 1, 0, -1):
+    # 保留標題行與預先填入的項目行，刪除其他範例行
+    if len(items_table.rows) > 1 + prefilled:
+        for i in range(len(items_table.rows) - 1, prefilled, -1):
             try:
                 items_table._element.remove(items_table.rows[i]._element)
             except Exception as e:
-                print(f"刪除行時出錯: {e}")
-    
-    # 添加項目行
-    total_items = len(details)
-    for idx, item in enumerate(details):
-        row = items_table.add_row()
-        col_count = len(row.cells)
-        
-        # 設置每個單元格的值和格式
-        if col_count >= 5:  # 標準五列表格 (類別, 項目, 單價, 數量, 金額)
-            row.cells[0].text = item.get("category", "")
-            row.cells[1].text = item.get("items", "")
-            row.cells[2].text = format_number(item.get('unit', 0))
-            row.cells[3].text = format_number(item.get('quantity', 0))
-            row.cells[4].text = format_number(item.get('amount', 0))
-            
-            # 設置對齊方式
-            apply_cell_style(row.cells[0], {"vertical_align": "center"})
-            apply_cell_style(row.cells[1], {"vertical_align": "center"})
-            apply_cell_style(row.cells[2], {"align": "right", "vertical_align": "center"})
-            apply_cell_style(row.cells[3], {"align": "right", "vertical_align": "center"})
-            apply_cell_style(row.cells[4], {"align": "right", "vertical_align": "center"})
-            
-        elif col_count == 4:  # 四列表格 (項目, 單價, 數量, 金額)
-            row.cells[0].text = item.get("items", "")
-            row.cells[1].text = format_number(item.get('unit', 0))
-            row.cells[2].text = format_number(item.get('quantity', 0))
-            row.cells[3].text = format_number(item.get('amount', 0))
+                log(f"刪除行時出錯: {e}")
+    
+    # 添加項目行 (有原型時直接複製，否則逐格設置)
+    streamed = isinstance(details, LineItemStream)
+    total_items = None if streamed else len(details)
+    col_count = len(row_prototype.tc_lst) if row_prototype is not None else None
+    layout = row_layout_key(row_prototype) if row_prototype is not None else None
+    if group_by_category:
+        count = append_grouped_item_rows(items_table, details, build_category_prototypes(items_table, row_prototype))
+        log(f"已依類別分組添加 {count} 個項目")
+        report_progress('processing', f'已依類別分組添加 {count} 個項目', 50)
+    else:
+        for idx, item in enumerate(details):
+            if idx < prefilled:
+                continue
+            if row_prototype is not None:
+                items_table._tbl.append(clone_item_row(row_prototype, item_row_values(item, col_count), layout))
+            else:
+                row = items_table.add_row()
+                fill_item_row(row, item_row_values(item, len(row.cells)))
             
-            # 設置對齊方式
-            apply_cell_style(row.cells[0], {"vertical_align": "center"})
-            apply_cell_style(row.cells[1], {"align": "right", "vertical_align": "center"})
-            apply_cell_style(row.cells[2], {"align": "right", "vertical_align": "center"})
-            apply_cell_style(row.cells[3], {"align": "right", "vertical_align": "center"})
-        
-        print(f"已添加項目: {item.get('items', '')}")
-        # 報告進度 (從40%開始，每個項目佔10%，到50%)
-        progress = 40 + int((idx + 1) * 10 / total_items)
-        report_progress('processing', f'處理項目 {idx+1}/{total_items}', progress)
+            # 串流項目數量未知且通常很多，不逐項記錄
+            if streamed:
+                continue
+            log(f"已添加項目: {item.get('items', '')}")
+            # 報告進度 (從40%開始，每個項目佔10%，到50%)
+            progress = 40 + int((idx + 1) * 10 / total_items)
+            report_progress('processing', f'處理項目 {idx+1}/{total_items}', progress)
+    
+    if streamed:
+        details.fill_totals(quote)
+        log(f"已從 {details.path} 串流添加 {details.count} 個項目，小計 {format_number(quote.get('total_without_tax', 0))}")
+        report_progress('processing', f'已添加 {details.count} 個項目', 50)
     
     # 添加小計行
     report_progress('processing', '正在添加小計資訊', 55)
-    subtotal_row = items_table.add_row()
-    if len(subtotal_row.cells) >= 5:
-        subtotal_row.cells[0].merge(subtotal_row.cells[3])
-        subtotal_row.cells[0].text = "小計"
-        subtotal_row.cells[4].text = format_number(quote.get('total_without_tax', 0))
-        apply_cell_style(subtotal_row.cells[0], {"align": "right", "bold": True})
-        apply_cell_style(subtotal_row.cells[4], {"align": "right", "bold": True})
-    elif len(subtotal_row.cells) == 4:
-        subtotal_row.cells[0].merge(subtotal_row.cells[2])
-        subtotal_row.cells[0].text = "小計"
-        subtotal_row.cells[3].text = format_number(quote.get('total_without_tax', 0))
-        apply_cell_style(subtotal_row.cells[0], {"align": "right", "bold": True})
-        apply_cell_style(subtotal_row.cells[3], {"align": "right", "bold": True})
+    append_summary_row(items_table, "subtotal", format_number(quote.get('total_without_tax', 0)), summary_rows)
     
     # 添加折扣行 (如果有)
     if quote.get("discount", 0) > 0:
         report_progress('processing', '正在添加折扣資訊', 60)
-        discount_row = items_table.add_row()
-        if len(discount_row.cells) >= 5:
-            discount_row.cells[0].merge(discount_row.cells[3])
-            discount_row.cells[0].text = "折扣"
-            discount_row.cells[4].text = f"-{format_number(quote.get('discount', 0))}"
-            apply_cell_style(discount_row.cells[0], {"align": "right"})
-            apply_cell_style(discount_row.cells[4], {"align": "right"})
-        elif len(discount_row.cells) == 4:
-            discount_row.cells[0].merge(discount_row.cells[2])
-            discount_row.cells[0].text = "折扣"
-            discount_row.cells[3].text = f"-{format_number(quote.get('discount', 0))}"
-            apply_cell_style(discount_row.cells[0], {"align": "right"})
-            apply_cell_style(discount_row.cells[3], {"align": "right"})
+        append_summary_row(items_table, "discount", f"-{format_number(quote.get('discount', 0))}", summary_rows)
     
     # 添加稅金行 (如果有)
     if quote.get("tax_rate", 0) > 0:
         report_progress('processing', '正在添加稅金資訊', 65)
-        tax_row = items_table.add_row()
-        if len(tax_row.cells) >= 5:
-            tax_row.cells[0].merge(tax_row.cells[3])
-            tax_row.cells[0].text = "稅金 (5%)"
-            tax_row.cells[4].text = format_number(quote.get('tax_rate', 0))
-            apply_cell_style(tax_row.cells[0], {"align": "right"})
-            apply_cell_style(tax_row.cells[4], {"align": "right"})
-        elif len(tax_row.cells) == 4:
-            tax_row.cells[0].merge(tax_row.cells[2])
-            tax_row.cells[0].text = "稅金 (5%)"
-            tax_row.cells[3].text = format_number(quote.get('tax_rate', 0))
-            apply_cell_style(tax_row.cells[0], {"align": "right"})
-            apply_cell_style(tax_row.cells[3], {"align": "right"})
+        append_summary_row(items_table, "tax", format_number(quote.get('tax_rate', 0)), summary_rows)
     
     # 添加總計行
     report_progress('processing', '正在添加總計資訊', 70)
-    total_row = items_table.add_row()
-    if len(total_row.cells) >= 5:
-        total_row.cells[0].merge(total_row.cells[3])
-        total_row.cells[0].text = "總計"
-        total_row.cells[4].text = format_number(quote.get('total_with_tax', 0))
-        apply_cell_style(total_row.cells[0], {"align": "right", "bold": True})
-        apply_cell_style(total_row.cells[4], {"align": "right", "bold": True, "fill_color": "E6E6E6"})
-    elif len(total_row.cells) == 4:
-        total_row.cells[0].merge(total_row.cells[2])
-        total_row.cells[0].text = "總計"
-        total_row.cells[3].text = format_number(quote.get('total_with_tax', 0))
-        apply_cell_style(total_row.cells[0], {"align": "right", "bold": True})
-        apply_cell_style(total_row.cells[3], {"align": "right", "bold": True, "fill_color": "E6E6E6"})
-
-def generate_docs(data):
-    """
-    生成報價單 Word 文檔
-    
-    參數:
-    data -- 包含報價資訊的字典
-    
-    返回:
-    list -- 生成的文檔本機路徑列表
-    """
-    try:
-        # 轉換不同格式的輸入為標準格式
-        standardized_data = standardize_input_data(data)
-        
-        # 驗證輸入數據格式
-        if not isinstance(standardized_data, dict):
-            raise ValueError(f"輸入數據必須是字典格式，實際類型: {type(standardized_data)}")
-            
-        if "quotes" not in standardized_data:
-            raise ValueError("輸入數據缺少 'quotes' 字段")
-            
-        if not isinstance(standardized_data["quotes"], list) or len(standardized_data["quotes"]) == 0:
-            raise ValueError("'quotes' 必須是非空列表")
-            
-        for idx, quote in enumerate(standardized_data["quotes"]):
-            if not isinstance(quote, dict):
-                raise ValueError(f"quote[{idx}] 必須是字典格式，實際類型: {type(quote)}")
-                
-            if "header" not in quote:
-                raise ValueError(f"quote[{idx}] 缺少 'header' 字段")
-                
-            if "details" not in quote:
-                raise ValueError(f"quote[{idx}] 缺少 'details' 字段")
-        
-        # 使用標準化後的數據生成文檔
-        return generate_docs_from_template(standardized_data)
-    except Exception as e:
-        print(f"生成報價單時發生錯誤: {str(e)}")
-        raise
+    append_summary_row(items_table, "total", format_number(quote.get('total_with_tax', 0)), summary_rows)
 
 def standardize_input_data(data):
     """
@@ -585,34 +780,34 @@ def standardize_input_data(data):
     返回:
     dict -- 標準化後的數據
     """
-    print(f"原始輸入數據類型: {type(data)}")
+    log(f"原始輸入數據類型: {type(data)}")
     
     # 如果輸入為空，拋出錯誤
     if not data:
-        print("輸入數據為空")
+        log("輸入數據為空")
         raise ValueError("輸入數據為空")
     
     # 打印一下輸入數據的部分內容
     if isinstance(data, dict):
-        print(f"輸入數據包含以下鍵: {list(data.keys())}")
+        log(f"輸入數據包含以下鍵: {list(data.keys())}")
         for key in data.keys():
             value_type = type(data[key])
-            print(f"鍵 '{key}' 的值類型: {value_type}")
+            log(f"鍵 '{key}' 的值類型: {value_type}")
             if key == "quotes":
                 # 處理特殊情況：quotes 是字典而不是列表（Langflow 可能的格式）
                 if isinstance(data[key], dict):
-                    print("檢測到 quotes 是字典而不是列表，將其轉換為標準格式")
+                    log("檢測到 quotes 是字典而不是列表，將其轉換為標準格式")
                     # 將 quotes 值視為單個 quote
                     quote_dict = data[key]
                     # 檢查是否有 header 字段
                     if "header" in quote_dict:
-                        print("quotes 字典中有 header 字段，將其視為單個 quote")
+                        log("quotes 字典中有 header 字段，將其視為單個 quote")
                         # 創建標準格式
                         data = {"quotes": [quote_dict]}
-                        print(f"轉換後的數據: {data}")
+                        log(f"轉換後的數據: {data}")
                         return data
                     else:
-                        print("quotes 字典中沒有 header 字段，創建缺省 header")
+                        log("quotes 字典中沒有 header 字段，創建缺省 header")
                         # 從字典中提取可能的 header 字段
                         header = {}
                         for possible_header in ["Title", "quoteNumber", "recipient", "companyName", "companyContact", "companyEmail", "start_date", "end_date", "key", "staff"]:
@@ -638,54 +833,54 @@ def standardize_input_data(data):
                                 standardized_quote[k] = v
                         
                         data = {"quotes": [standardized_quote]}
-                        print(f"轉換後的數據: {data}")
+                        log(f"轉換後的數據: {data}")
                         return data
                 
                 elif isinstance(data[key], list):
-                    print(f"quotes 列表長度: {len(data[key])}")
+                    log(f"quotes 列表長度: {len(data[key])}")
                     # 檢查列表中的每個項目是否為空
                     empty_quotes = True
                     for i, quote in enumerate(data[key]):
                         if isinstance(quote, dict):
-                            print(f"quote[{i}] 包含的鍵: {list(quote.keys())}")
+                            log(f"quote[{i}] 包含的鍵: {list(quote.keys())}")
                             if quote and quote.keys():
                                 empty_quotes = False
                     
                     # 如果所有 quote 都是空的，嘗試從本地文件加載預設數據
                     if empty_quotes:
-                        print("檢測到所有 quotes 都是空的，嘗試加載備用數據")
+                        log("檢測到所有 quotes 都是空的，嘗試加載備用數據")
                         backup_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "input.json")
                         if os.path.exists(backup_path):
                             try:
                                 with open(backup_path, 'r', encoding='utf-8') as f:
                                     backup_data = json.load(f)
-                                    print(f"已從 {backup_path} 載入備用數據")
+                                    log(f"已從 {backup_path} 載入備用數據")
                                     return backup_data
                             except Exception as e:
-                                print(f"載入備用數據失敗: {str(e)}")
+                                log(f"載入備用數據失敗: {str(e)}")
                         else:
-                            print(f"未找到備用數據文件: {backup_path}")
+                            log(f"未找到備用數據文件: {backup_path}")
     
     # 如果數據已經是標準格式，直接返回
     if isinstance(data, dict) and "quotes" in data and isinstance(data["quotes"], list):
-        print("輸入數據已經是標準格式")
+        log("輸入數據已經是標準格式")
         # 檢查每個 quote 是否有 header 和 details
         for i, quote in enumerate(data["quotes"]):
             if not isinstance(quote, dict):
-                print(f"quote[{i}] 不是字典類型")
+                log(f"quote[{i}] 不是字典類型")
                 continue
                 
             if "header" not in quote:
-                print(f"quote[{i}] 缺少 header 字段，嘗試創建")
+                log(f"quote[{i}] 缺少 header 字段，嘗試創建")
                 # 從 quote 的頂層屬性構建 header
                 quote["header"] = {}
                 for key in list(quote.keys()):
                     if key not in ["details", "header", "total_without_tax", "discount", "tax_rate", "total_with_tax", "notes"]:
                         quote["header"][key] = quote.pop(key)
-                print(f"為 quote[{i}] 創建的 header: {quote['header']}")
+                log(f"為 quote[{i}] 創建的 header: {quote['header']}")
                 
             if "details" not in quote:
-                print(f"quote[{i}] 缺少 details 字段，設置為空列表")
+                log(f"quote[{i}] 缺少 details 字段，設置為空列表")
                 quote["details"] = []
         
         # 檢查數據是否有效 - 如果所有 quotes 的 header 都是空的
@@ -696,22 +891,22 @@ def standardize_input_data(data):
                 break
                 
         if all_empty_headers:
-            print("所有 quotes 的 header 都是空的，嘗試載入備用數據")
+            log("所有 quotes 的 header 都是空的，嘗試載入備用數據")
             backup_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "input.json")
             if os.path.exists(backup_path):
                 try:
                     with open(backup_path, 'r', encoding='utf-8') as f:
                         backup_data = json.load(f)
-                        print(f"已從 {backup_path} 載入備用數據")
+                        log(f"已從 {backup_path} 載入備用數據")
                         return backup_data
                 except Exception as e:
-                    print(f"載入備用數據失敗: {str(e)}")
+                    log(f"載入備用數據失敗: {str(e)}")
         
         return data
     
     # 處理 Langflow 輸入格式：檢查是否為單個報價單數據（沒有外層 quotes 包裝）
     if isinstance(data, dict) and "header" not in data and "quotes" not in data:
-        print("檢測到可能的非標準格式，嘗試從輸入構建標準格式")
+        log("檢測到可能的非標準格式，嘗試從輸入構建標準格式")
         
         # 嘗試從輸入中構建標準格式
         # 情況1: 如果已有 Title, quoteNumber 等字段，將其視為 header
@@ -727,15 +922,15 @@ def standardize_input_data(data):
         for field in header_fields:
             if field in data:
                 header[field] = data[field]
-                print(f"從輸入中找到 header 字段: {field} = {data[field]}")
+                log(f"從輸入中找到 header 字段: {field} = {data[field]}")
         
         # 識別可能的 details 字段
         if "details" in data and isinstance(data["details"], list):
             details = data["details"]
-            print(f"從輸入中找到 details 字段，包含 {len(details)} 項")
+            log(f"從輸入中找到 details 字段，包含 {len(details)} 項")
         elif "items" in data and isinstance(data["items"], list):
             details = data["items"]
-            print(f"從輸入中找到 items 字段，包含 {len(details)} 項")
+            log(f"從輸入中找到 items 字段，包含 {len(details)} 項")
         
         # 其他可能的字段直接複製到 quote 根級別
         quote = {
@@ -747,31 +942,31 @@ def standardize_input_data(data):
         for key, value in data.items():
             if key not in ["header", "details", "items"] + header_fields:
                 quote[key] = value
-                print(f"從輸入中複製其他字段: {key}")
+                log(f"從輸入中複製其他字段: {key}")
         
-        print(f"構建的標準格式 quote: {quote}")
+        log(f"構建的標準格式 quote: {quote}")
         return {"quotes": [quote]}
     
     # 特殊情況：純文本或已經包含 header 字段，但沒有外層 quotes 包裝
     if isinstance(data, dict) and "header" in data:
-        print("檢測到單個 quote 格式（含 header 但無 quotes 包裝）")
+        log("檢測到單個 quote 格式（含 header 但無 quotes 包裝）")
         return {"quotes": [data]}
     
     # 處理 Langflow 可能發送的其他格式
     try:
         # 嘗試以字符串形式解析 JSON
         if isinstance(data, str):
-            print("輸入為字符串，嘗試解析 JSON")
+            log("輸入為字符串，嘗試解析 JSON")
             import json
             parsed_data = json.loads(data)
-            print(f"解析後的數據類型: {type(parsed_data)}")
+            log(f"解析後的數據類型: {type(parsed_data)}")
             return standardize_input_data(parsed_data)
     except Exception as e:
-        print(f"解析 JSON 字符串失敗: {str(e)}")
+        log(f"解析 JSON 字符串失敗: {str(e)}")
     
     # 最後嘗試：將整個數據視為單個報價單
     try:
-        print("嘗試將整個輸入視為單個報價單")
+        log("嘗試將整個輸入視為單個報價單")
         
         standardized_data = {
             "quotes": [{
@@ -797,147 +992,754 @@ def standardize_input_data(data):
         
         # 如果數據是字典，嘗試將其合併到第一個報價單中
         if isinstance(data, dict):
-            print("將原始字典數據合併到標準格式中")
+            log("將原始字典數據合併到標準格式中")
             for key, value in data.items():
                 if key == "header" and isinstance(value, dict):
-                    print(f"合併 header: {list(value.keys())}")
+                    log(f"合併 header: {list(value.keys())}")
                     standardized_data["quotes"][0]["header"].update(value)
                 elif key == "details" or key == "items":
                     if isinstance(value, list):
-                        print(f"設置 details: {len(value)} 項")
+                        log(f"設置 details: {len(value)} 項")
                         standardized_data["quotes"][0]["details"] = value
                 else:
-                    print(f"複製字段: {key}")
+                    log(f"複製字段: {key}")
                     standardized_data["quotes"][0][key] = value
         
-        print(f"最終構建的標準格式: {standardized_data}")
+        log(f"最終構建的標準格式: {standardized_data}")
         return standardized_data
     except Exception as e:
-        print(f"無法將輸入數據轉換為標準格式: {str(e)}")
+        log(f"無法將輸入數據轉換為標準格式: {str(e)}")
         raise ValueError(f"無法將輸入數據轉換為標準格式: {str(e)}")
 
-def generate_docs_from_template(data):
+def load_template_info(template_path):
     """
-    使用模板生成報價單 Word 文檔
-    
+    載入模板的渲染計畫 (模板變更時自動重新編譯)，失敗時改為逐次分析模板
+
+    返回:
+    tuple -- (渲染計畫或 None, 模板資訊, 項目行原型或 None)
+    """
+    try:
+        plan = load_render_plan(template_path)
+        return plan, plan_template_info(plan), plan_row_prototype(plan)
+    except Exception as e:
+        log(f"載入渲染計畫失敗，改為分析模板: {e}")
+        return None, analyze_template(template_path), None
+
+def fill_table_placeholders(tables, field_mapping, locations=None):
+    """
+    替換表格中的佔位符
+
     參數:
-    data -- 包含報價資訊的字典
-    
+    tables -- 表格列表
+    field_mapping -- 欄位映射字典
+    locations -- 渲染計畫記錄的 (表格, 行, 列, 段落) 位置 (可選，未指定時走訪所有儲存格)
+    """
+    if locations is not None:
+        # 只走訪渲染計畫記錄的佔位符位置
+        for t, r, c, p in locations:
+            paragraph = tables[t].rows[r].cells[c].paragraphs[p]
+            if replace_text_with_field_value(paragraph, field_mapping):
+                log(f"表格 {t+1}, 行 {r+1}, 列 {c+1}, 段落 {p+1} 已完成替換")
+        return
+    for t, table in enumerate(tables):
+        for r, row in enumerate(table.rows):
+            for c, cell in enumerate(row.cells):
+                for p, paragraph in enumerate(cell.paragraphs):
+                    if "{" in paragraph.text and not ("{#items}" in paragraph.text or "{/items}" in paragraph.text):
+                        log(f"表格 {t+1}, 行 {r+1}, 列 {c+1}, 段落 {p+1} 原始內容: '{paragraph.text}'")
+                        if replace_text_with_field_value(paragraph, field_mapping):
+                            log(f"表格 {t+1}, 行 {r+1}, 列 {c+1}, 段落 {p+1} 已完成替換")
+
+def fill_paragraph_placeholders(paragraphs, field_mapping, locations=None):
+    """
+    替換內文段落中的佔位符，跳過{#items}和{/items}標籤
+
+    參數:
+    paragraphs -- 段落列表
+    field_mapping -- 欄位映射字典
+    locations -- 渲染計畫記錄的段落索引 (可選，未指定時走訪所有段落)
+    """
+    for i in (locations if locations is not None else range(len(paragraphs))):
+        paragraph = paragraphs[i]
+        if "{" in paragraph.text and not ("{#items}" in paragraph.text or "{/items}" in paragraph.text):
+            log(f"段落 {i+1} 原始內容: '{paragraph.text}'")
+            if replace_text_with_field_value(paragraph, field_mapping):
+                log(f"段落 {i+1} 已完成替換")
+
+def common_prefix_length(lists):
+    """多個列表共同前段的長度"""
+    length = 0
+    for items in zip(*lists):
+        if any(item != items[0] for item in items[1:]):
+            break
+        length += 1
+    return length
+
+def prepare_variant_base(open_template, plan, row_prototype, group, quotes):
+    """
+    為同一組方案建立共用的基底文檔
+
+    只替換各方案值都相同的佔位符所在段落，含有不同值的段落整段保留給各方案
+    替換 (避免部分替換改變段落格式)；各方案共同的前段項目行也先填入項目表格，
+    合計行也只合併儲存格一次並保留為原型。
+    生成各方案時只需還原保留的段落 (其餘項目行由 format_items_table 刪除後重建)
+
+    參數:
+    open_template -- 無參數函數，返回新的模板 Document
+    plan -- 渲染計畫
+    row_prototype -- 項目行原型 (可選)
+    group -- 方案組的報價單索引
+    quotes -- 全部報價單列表
+
     返回:
-    list -- 生成的文檔本機路徑列表
+    dict -- 基底文檔、保留段落的原始內容、待替換位置、預先填入的項目行數與合計行原型；
+            建立失敗時 doc 為 None，改為逐份生成
     """
-    outputs = []
-    
-    # 確保 temp 目錄存在
-    report_progress('preparing', '準備處理環境', 0)
-    temp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "temp")
-    if not os.path.exists(temp_dir):
+    try:
+        members = [quotes[i] for i in group]
+        mappings = [create_field_mapping(quote) for quote in members]
+        shared = {key for key, value in mappings[0].items() if all(m.get(key) == value for m in mappings[1:])}
+        log(f"方案組 {[i + 1 for i in group]} 共用欄位: {len(shared)}/{len(mappings[0])}")
+
+        def is_shared(paragraph):
+            return {m.strip() for m in PLACEHOLDER_PATTERN.findall(paragraph.text)} <= shared
+
+        doc = open_template()
+        tables = doc.tables
+        table_locations = []
+        deferred = []
+        for location in plan["table_locations"]:
+            t, r, c, p = location
+            paragraph = tables[t].rows[r].cells[c].paragraphs[p]
+            if is_shared(paragraph):
+                replace_text_with_field_value(paragraph, mappings[0])
+            else:
+                table_locations.append(location)
+                deferred.append((paragraph._p, copy.deepcopy(paragraph._p)))
+
+        paragraphs = doc.paragraphs
+        paragraph_locations = []
+        for i in plan["paragraph_locations"]:
+            if is_shared(paragraphs[i]):
+                replace_text_with_field_value(paragraphs[i], mappings[0])
+            else:
+                paragraph_locations.append(i)
+                deferred.append((paragraphs[i]._p, copy.deepcopy(paragraphs[i]._p)))
+
+        # 預先填入各方案共同的前段項目行
+        prefilled = 0
+        summary_rows = None
+        item_index = plan["item_table"]["index"] if plan["item_table"] else -1
+        if 0 <= item_index < len(tables):
+            summary_rows = build_summary_prototypes(tables[item_index])
+        if row_prototype is not None and 0 <= item_index < len(tables):
+            items_table = tables[item_index]
+            prefilled = common_prefix_length([quote.get("details", []) for quote in members])
+            for i in range(len(items_table.rows) - 1, 0, -1):
+                items_table._tbl.remove(items_table.rows[i]._tr)
+            col_count = len(row_prototype.tc_lst)
+            layout = row_layout_key(row_prototype)
+            for item in members[0]["details"][:prefilled]:
+                items_table._tbl.append(clone_item_row(row_prototype, item_row_values(item, col_count), layout))
+
+        return {
+            "group": group,
+            "doc": doc,
+            "deferred": deferred,
+            "table_locations": table_locations,
+            "paragraph_locations": paragraph_locations,
+            "prefilled": prefilled,
+            "summary_rows": summary_rows,
+        }
+    except Exception as e:
+        log(f"建立方案基底文檔失敗，改為逐份生成: {str(e)}")
+        return {"group": group, "doc": None}
+
+def restore_variant_base(variant_base):
+    """還原上一個方案替換過的段落 (保留元素本身，位置索引不變)，返回可供單一方案使用的文檔"""
+    for element, original in variant_base["deferred"]:
+        element[:] = [copy.deepcopy(child) for child in original]
+    return variant_base["doc"]
+
+W14_PARA_ID = qn("w14:paraId")
+W14_TEXT_ID = qn("w14:textId")
+
+def renumber_section_ids(elements, next_drawing_id):
+    """
+    調整複製的模板內容中必須唯一的 id
+
+    移除重複的 w14:paraId / w14:textId (選用屬性，Word 會自行補上)，
+    並重新編號繪圖物件的 wp:docPr id
+
+    返回:
+    int -- 下一個可用的繪圖物件 id
+    """
+    for element in elements:
+        for node in element.iter():
+            node.attrib.pop(W14_PARA_ID, None)
+            node.attrib.pop(W14_TEXT_ID, None)
+        for doc_pr in element.iter(qn("wp:docPr")):
+            doc_pr.set("id", str(next_drawing_id))
+            next_drawing_id += 1
+    return next_drawing_id
+
+def add_section_break(elements, section_properties):
+    """在一份報價單內容的最後加上分節符號 (下一頁)，沿用模板的版面設定"""
+    last = elements[-1]
+    if last.tag != qn("w:p"):
+        last = OxmlElement("w:p")
+        elements[-1].addnext(last)
+    last.get_or_add_pPr()._insert_sectPr(copy.deepcopy(section_properties))
+
+def _in_render_context(method):
+    """在方法執行期間將進度與日誌導向該渲染器"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.activate():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class QuoteRenderer:
+    """
+    可重入的報價單渲染器
+
+    每個實例持有自己的模板與模板快取、預設輸出目錄、日誌函數與進度回調，
+    生成期間以 context variable 標記目前的渲染器，輔助函數的進度與日誌都送往該實例。
+    所有實例共用模組層級的狀態: 項目行片段快取 (row_fragment_cache)、合計行原型
+    (_summary_prototypes) 與進行中的輸出目錄 (_active_outputs)，三者都以鎖保護，
+    快取的 XML 只供複製不會被修改，因此多個實例，或同一實例在多個執行緒中，可以同時生成。
+    同時寫入同一輸出目錄的生成不會清除彼此的檔案，但報價單編號相同時後寫出的會覆蓋先寫出的，
+    生成結束後的下一次生成也會清除先前的檔案，需保留各請求的輸出時請為各請求指定不同的輸出目錄
+
+    參數:
+    template_path -- 模板檔案路徑 (預設為專案下的 報價單.docx)
+    output_dir -- 預設輸出目錄 (預設為專案下的 temp/)
+    log -- 日誌函數，接收一個字串 (預設 print)
+    progress_callback -- 進度回調函數 (step, message, progress, result)，可選
+    cleanup -- 生成前是否刪除輸出目錄中舊的 quote_ 檔案 (目錄中沒有其他進行中的生成時)
+    """
+
+    def __init__(self, template_path=None, output_dir=None, log=print, progress_callback=None, cleanup=True):
+        self.template_path = template_path or TEMPLATE_PATH
+        self.output_dir = output_dir or DEFAULT_OUTPUT_DIR
+        self.log = log
+        self.progress_callback = progress_callback
+        self.cleanup = cleanup
+        # 模板快取 (mtime, size, 渲染計畫, 模板資訊, 模板內容)，模板變更時重新載入
+        self._template_cache = None
+        self._template_lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        """在此區塊內將目前執行緒的進度與日誌導向此渲染器 (可巢狀)"""
+        token = _active_renderer.set(self)
+        try:
+            yield self
+        finally:
+            _active_renderer.reset(token)
+
+    def report_progress(self, step, message, progress=None, result=None):
+        """報告處理進度"""
+        if self.progress_callback:
+            self.progress_callback(step, message, progress, result)
+
+    @_in_render_context
+    def load_template(self):
+        """
+        載入模板的渲染計畫與模板內容，同一版本的模板只載入一次
+
+        項目行原型每次都從渲染計畫重新解析，各次生成不共用可變的 XML 元素
+
+        返回:
+        tuple -- (渲染計畫或 None, 模板資訊, 項目行原型或 None)
+        """
+        stat = os.stat(self.template_path)
+        with self._template_lock:
+            cached = self._template_cache
+            if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+                plan, template_info, _ = load_template_info(self.template_path)
+                with open(self.template_path, 'rb') as f:
+                    content = f.read()
+                cached = (stat.st_mtime_ns, stat.st_size, plan, template_info, content)
+                self._template_cache = cached
+        plan, template_info = cached[2], cached[3]
+        return plan, template_info, plan_row_prototype(plan) if plan is not None else None
+
+    def open_template(self):
+        """以快取的模板內容建立新的 Document，不需每份報價單都讀取模板檔"""
+        if self._template_cache is None:
+            self.load_template()
+        return Document(io.BytesIO(self._template_cache[4]))
+
+    @contextmanager
+    def claim_output(self, output_dir=None):
+        """
+        在區塊期間將輸出目錄登記為生成中，返回實際使用的輸出目錄
+
+        cleanup=True 時只在目錄中沒有其他進行中的生成時清理舊檔案；
+        登記與清理在同一把鎖內完成，清理不會刪除同時生成中的其他請求寫出的檔案
+        """
+        temp_dir = output_dir or self.output_dir
+        key = os.path.abspath(temp_dir)
+        with _active_outputs_lock:
+            os.makedirs(temp_dir, exist_ok=True)
+            # 清理舊檔案，避免權限衝突
+            if self.cleanup and not _active_outputs[key]:
+                cleanup_temp_files(temp_dir)
+            _active_outputs[key] += 1
+        try:
+            yield temp_dir
+        finally:
+            with _active_outputs_lock:
+                _active_outputs[key] -= 1
+                if not _active_outputs[key]:
+                    del _active_outputs[key]
+
+    def prepare_output(self, output_dir=None):
+        """
+        準備輸出目錄並確認模板存在
+
+        返回:
+        str -- 輸出目錄
+        """
+        # 確保輸出目錄存在
+        self.report_progress('preparing', '準備處理環境', 0)
+        temp_dir = output_dir or self.output_dir
         os.makedirs(temp_dir, exist_ok=True)
-    
-    # 清理舊檔案，避免權限衝突
-    cleanup_temp_files(temp_dir)
-    
-    template_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "報價單.docx")
-    
-    if not os.path.exists(template_path):
-        error_message = f"找不到模板檔案: {template_path}"
-        report_progress('error', error_message, 0)
-        raise FileNotFoundError(error_message)
-    
-    # 詳細分析模板結構
-    template_info = analyze_template(template_path)
-    
-    total_quotes = len(data["quotes"])
-    for idx, quote in enumerate(data["quotes"]):
+        
+        if not os.path.exists(self.template_path):
+            error_message = f"找不到模板檔案: {self.template_path}"
+            self.report_progress('error', error_message, 0)
+            raise FileNotFoundError(error_message)
+        return temp_dir
+
+    @_in_render_context
+    def render(self, data, output_dir=None, should_cancel=None, pricing_mode=DEFAULT_PRICING_MODE, report=None, memory_budget=None, deterministic=DEFAULT_DETERMINISTIC, history=None, combine=False, group_by_category=False, fill_from_catalog=False, output_format=DEFAULT_OUTPUT_FORMAT):
+        """
+        生成報價單 Word 文檔
+        
+        參數:
+        data -- 包含報價資訊的字典
+        output_dir -- 輸出目錄 (可選，預設為渲染器的 output_dir)
+        should_cancel -- 取消檢查函數 (可選)，返回 True 時於下一份報價單前中止
+        pricing_mode -- 價格核對模式: 'off'、'flag' 或 'correct'
+        report -- 生成報告字典 (可選)，會填入價格核對結果等資訊
+        memory_budget -- MemoryBudget 物件 (可選，預設依環境變數設定)
+        deterministic -- 是否輸出位元組可重現的文檔 (固定 ZIP 時間戳與順序)
+        history -- QuoteHistory 物件 (可選)，指定時將生成結果記入歷史紀錄
+        combine -- 是否將整批報價單合併為單一文檔 (每份報價單一節)
+        group_by_category -- 是否依類別分組項目並加上各類別小計行
+        fill_from_catalog -- 是否以價目表補上項目缺少的單價與金額
+        output_format -- 輸出格式: docx 或 flat_xml (單一 XML 檔，不做 ZIP 壓縮)
+        
+        返回:
+        list -- 生成的文檔本機路徑列表
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"output_format 必須是 {', '.join(OUTPUT_FORMATS)} 之一")
         try:
-            # 報告進度 - 每個報價單佔90%總進度的一部分
-            progress_base = idx * 90 / total_quotes
-            report_progress('processing', f'開始處理第 {idx+1}/{total_quotes} 份報價單', int(progress_base))
+            # 轉換不同格式的輸入為標準格式
+            standardized_data = standardize_input_data(data)
             
-            # 載入模板
-            doc = Document(template_path)
+            # 驗證輸入數據格式
+            if not isinstance(standardized_data, dict):
+                raise ValueError(f"輸入數據必須是字典格式，實際類型: {type(standardized_data)}")
             
-            # 確保必要字段存在
-            if "header" not in quote:
-                raise KeyError("報價單數據缺少 'header' 字段")
+            if "quotes" not in standardized_data:
+                raise ValueError("輸入數據缺少 'quotes' 字段")
+            
+            if not isinstance(standardized_data["quotes"], list) or len(standardized_data["quotes"]) == 0:
+                raise ValueError("'quotes' 必須是非空列表")
+            
+            for idx, quote in enumerate(standardized_data["quotes"]):
+                if not isinstance(quote, dict):
+                    raise ValueError(f"quote[{idx}] 必須是字典格式，實際類型: {type(quote)}")
                 
-            if "details" not in quote:
-                raise KeyError("報價單數據缺少 'details' 字段")
+                if "header" not in quote:
+                    raise ValueError(f"quote[{idx}] 缺少 'header' 字段")
                 
-            header = quote["header"]
-            details = quote.get("details", [])
-            quote_number = header.get("quoteNumber", "unknown")
-            print(f"生成報價單: {quote_number}")
+                if "details" not in quote:
+                    raise ValueError(f"quote[{idx}] 缺少 'details' 字段")
+            
+            # 以價目表補上缺少的單價與金額 (在展開方案與價格核對之前，方案合計依補上後的項目計算)
+            if fill_from_catalog:
+                catalog = get_catalog()
+                if catalog is None:
+                    raise ValueError(f"找不到價目表: {CATALOG_PATH}")
+                filled, missing = fill_missing_prices(standardized_data["quotes"], catalog)
+                self.log(summarize_fills(filled, missing))
+                if report is not None:
+                    report["catalog_fills"] = filled
+                    report["catalog_missing"] = missing
             
-            # 創建欄位映射
-            report_progress('processing', '準備欄位映射', int(progress_base + 15))
-            field_mapping = create_field_mapping(quote)
+            # 展開多方案報價單 (共用基底 + 各方案覆寫)
+            quotes, variant_groups = expand_variants(standardized_data["quotes"])
+            standardized_data = {**standardized_data, "quotes": quotes, "variant_groups": variant_groups}
+            if variant_groups:
+                self.log(f"已展開 {len(variant_groups)} 組方案，共 {len(quotes)} 份報價單")
             
-            print(f"\n欄位對應:")
-            for key, value in field_mapping.items():
-                print(f"  {key} → {value}")
+            # 生成前批次核對項目金額與合計
+            pricing, issues = reconcile_quotes(standardized_data["quotes"], pricing_mode)
+            if issues:
+                self.log(summarize_issues(issues, pricing_mode))
+            if report is not None:
+                report["pricing_mode"] = pricing_mode
+                report["pricing"] = pricing
+                report["pricing_issues"] = issues
             
-            # 處理所有表格中的文字
-            report_progress('processing', '處理表格佔位符', int(progress_base + 20))
-            print("\n處理表格:")
-            for t, table in enumerate(doc.tables):
-                for r, row in enumerate(table.rows):
-                    for c, cell in enumerate(row.cells):
-                        for p, paragraph in enumerate(cell.paragraphs):
-                            if "{" in paragraph.text and not ("{#items}" in paragraph.text or "{/items}" in paragraph.text):
-                                print(f"表格 {t+1}, 行 {r+1}, 列 {c+1}, 段落 {p+1} 原始內容: '{paragraph.text}'")
-                                if replace_text_with_field_value(paragraph, field_mapping):
-                                    print(f"表格 {t+1}, 行 {r+1}, 列 {c+1}, 段落 {p+1} 已完成替換")
+            # 使用標準化後的數據生成文檔
+            if report is None:
+                report = {}
+            render_batch = self.render_combined if combine else self.render_separate
+            outputs = render_batch(standardized_data, output_dir, should_cancel, report, memory_budget, deterministic, group_by_category, output_format)
             
-            # 尋找並填充項目表格
-            if template_info["item_table_index"] >= 0 and template_info["item_table_index"] < len(doc.tables):
-                items_table = doc.tables[template_info["item_table_index"]]
-                print(f"處理項目表格 (索引 {template_info['item_table_index']})")
+            # 記入歷史紀錄，失敗時不影響已生成的文檔
+            if history is not None and report["rendered"]:
+                try:
+                    ids = history.record(standardized_data["quotes"], report["rendered"])
+                    for entry, record_id in zip(report["rendered"], ids):
+                        entry["history_id"] = record_id
+                except Exception as e:
+                    self.log(f"記錄歷史紀錄時發生錯誤: {str(e)}")
+            return outputs
+        except Exception as e:
+            self.log(f"生成報價單時發生錯誤: {str(e)}")
+            raise
+
+    @_in_render_context
+    def render_separate(self, data, output_dir=None, should_cancel=None, report=None, memory_budget=None, deterministic=False, group_by_category=False, output_format=DEFAULT_OUTPUT_FORMAT):
+        """
+        使用模板生成報價單 Word 文檔
+        
+        參數:
+        data -- 包含報價資訊的字典
+        output_dir -- 輸出目錄 (可選，預設為渲染器的 output_dir)
+        should_cancel -- 取消檢查函數 (可選)，返回 True 時於下一份報價單前中止
+        report -- 生成報告字典 (可選)，會填入每份文檔的路徑與 SHA-256，啟用記憶體追蹤時另填入每份報價單的用量
+        memory_budget -- MemoryBudget 物件 (可選，預設依環境變數設定)
+        deterministic -- 是否輸出位元組可重現的文檔
+        group_by_category -- 是否依類別分組項目並加上各類別小計行
+        output_format -- 輸出格式 (docx 或 flat_xml)
+        
+        返回:
+        list -- 生成的文檔本機路徑列表
+        """
+        budget = memory_budget or MemoryBudget()
+        try:
+            with self.claim_output(output_dir) as temp_dir:
+                return self._render_separate(data, temp_dir, should_cancel, report, budget, deterministic, group_by_category, output_format)
+        finally:
+            # 停止本批為追蹤而啟動的 tracemalloc，之後未追蹤的生成不必承擔追蹤成本
+            budget.finish()
+
+    def _render_separate(self, data, output_dir, should_cancel, report, budget, deterministic, group_by_category, output_format):
+        """render_separate 的本體，budget 由呼叫端結束"""
+        outputs = []
+        rendered = []
+        
+        temp_dir = self.prepare_output(output_dir)
+        extension = output_extension(output_format)
+        
+        # 記憶體上限：先以最大的報價單預估，超過時在載入模板前就失敗
+        budget.check_batch(data["quotes"])
+        
+        # 載入預先編譯的渲染計畫
+        plan, template_info, row_prototype = self.load_template()
+        
+        # 方案組: 報價單索引 -> 所屬方案組 (需要渲染計畫的位置資訊；分組項目會重新排列，無法共用前段項目行)
+        group_of = {}
+        if plan is not None and not group_by_category:
+            for group in data.get("variant_groups", []):
+                # 由項目檔提供項目的方案在生成時才讀取項目，無法預先共用
+                if any(has_items_file(data["quotes"][member]) for member in group):
+                    continue
+                for member in group:
+                    group_of[member] = group
+        variant_base = None
+        
+        total_quotes = len(data["quotes"])
+        for idx, quote in enumerate(data["quotes"]):
+            # 在報價單邊界檢查是否已被取消
+            if should_cancel and should_cancel():
+                error_message = f"生成已取消，完成 {len(outputs)}/{total_quotes} 份報價單"
+                self.report_progress('error', error_message, 0)
+                raise RenderCancelled(error_message)
+            
+            budget.check(quote, f"quote[{idx}]")
+            tracking = budget.begin(idx, quote.get("header", {}).get("quoteNumber", "") if isinstance(quote, dict) else "")
+            doc = None
+            try:
+                # 報告進度 - 每個報價單佔90%總進度的一部分
+                progress_base = idx * 90 / total_quotes
+                self.report_progress('processing', f'開始處理第 {idx+1}/{total_quotes} 份報價單', int(progress_base))
+                
+                # 載入模板 (同一組方案從共用的基底文檔還原)
+                group = group_of.get(idx)
+                if group is not None and (variant_base is None or variant_base["group"] is not group):
+                    variant_base = prepare_variant_base(self.open_template, plan, row_prototype, group, data["quotes"])
+                if group is not None and variant_base["doc"] is not None:
+                    doc = restore_variant_base(variant_base)
+                    table_locations = variant_base["table_locations"]
+                    paragraph_locations = variant_base["paragraph_locations"]
+                    prefilled = variant_base["prefilled"]
+                    summary_rows = variant_base["summary_rows"]
+                else:
+                    doc = self.open_template()
+                    table_locations = plan["table_locations"] if plan is not None else None
+                    paragraph_locations = plan["paragraph_locations"] if plan is not None else None
+                    prefilled = 0
+                    summary_rows = None
+                
+                # 確保必要字段存在
+                if "header" not in quote:
+                    raise KeyError("報價單數據缺少 'header' 字段")
+                
+                if "details" not in quote:
+                    raise KeyError("報價單數據缺少 'details' 字段")
+                
+                header = quote["header"]
+                details = quote.get("details", [])
+                quote_number = header.get("quoteNumber", "unknown")
+                self.log(f"生成報價單: {quote_number}")
+                
+                tables = doc.tables
+                items_table = None
+                if template_info["item_table_index"] >= 0 and template_info["item_table_index"] < len(tables):
+                    items_table = tables[template_info["item_table_index"]]
+                
+                # 項目檔的合計在串流寫入項目行時才得知，需先處理項目表格再建立欄位映射
+                if has_items_file(quote) and items_table is not None:
+                    self.log(f"處理項目表格 (索引 {template_info['item_table_index']})")
+                    format_items_table(doc, items_table, LineItemStream(quote), quote, row_prototype, group_by_category=group_by_category)
+                    items_table = None
                 
-                # 格式化項目表格
-                format_items_table(doc, items_table, details, quote)
+                # 創建欄位映射
+                self.report_progress('processing', '準備欄位映射', int(progress_base + 15))
+                field_mapping = create_field_mapping(quote)
+                
+                self.log(f"\n欄位對應:")
+                for key, value in field_mapping.items():
+                    self.log(f"  {key} → {value}")
+                
+                # 處理所有表格中的文字
+                self.report_progress('processing', '處理表格佔位符', int(progress_base + 20))
+                self.log("\n處理表格:")
+                fill_table_placeholders(tables, field_mapping, table_locations)
+                
+                # 尋找並填充項目表格
+                if items_table is not None:
+                    self.log(f"處理項目表格 (索引 {template_info['item_table_index']})")
+                    
+                    # 格式化項目表格
+                    format_items_table(doc, items_table, details, quote, row_prototype, prefilled, group_by_category, summary_rows)
+                
+                # 最後處理段落，跳過{#items}和{/items}標籤
+                self.report_progress('processing', '處理文本佔位符', int(progress_base + 75))
+                self.log("\n處理段落:")
+                fill_paragraph_placeholders(doc.paragraphs, field_mapping, paragraph_locations)
+                
+                # 保存文件前嘗試刪除同名檔案
+                self.report_progress('finalizing', '準備保存文檔', int(progress_base + 85))
+                file_name = f"quote_{quote_number}{extension}"
+                file_path = os.path.join(temp_dir, file_name)
+                
+                try:
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+                        self.log(f"已刪除舊檔案: {file_path}")
+                        time.sleep(0.5)  # 等待一下以確保檔案被釋放
+                except Exception as e:
+                    self.log(f"刪除舊檔案時出錯: {e}")
+                    # 使用時間戳來避免檔案名衝突
+                    file_name = f"quote_{quote_number}_{int(time.time())}{extension}"
+                    file_path = os.path.join(temp_dir, file_name)
+                
+                # 保存文件
+                digest = save_document(doc, file_path, deterministic, output_format)
+                outputs.append(file_path)
+                rendered.append({
+                    "index": idx,
+                    "quoteNumber": quote_number,
+                    "path": file_path,
+                    "sha256": digest,
+                    "deterministic": deterministic,
+                })
+                self.report_progress('finalizing', f'已生成報價單: {quote_number}', int(progress_base + 90))
+                self.log(f"已成功生成報價單: {file_path}")
+            except KeyError as e:
+                error_message = f"處理報價單時發生欄位錯誤: {str(e)}"
+                self.log(error_message)
+                self.report_progress('error', error_message, 0)
+            except Exception as e:
+                error_message = f"處理報價單時發生錯誤: {str(e)}"
+                self.log(error_message)
+                self.report_progress('error', error_message, 0)
+            
+            # 記錄用量並釋放本份 Document 後再處理下一份
+            budget.end(tracking)
+            doc = None
+            if variant_base is not None and idx == variant_base["group"][-1]:
+                variant_base = None
+            budget.release()
+        
+        if report is not None:
+            report["rendered"] = rendered
+            if budget.tracking:
+                report["memory"] = budget.records
+        
+        self.report_progress('completed', f'已完成所有報價單處理, 共 {len(outputs)} 份', 100)
+        return outputs
+
+    @_in_render_context
+    def render_combined(self, data, output_dir=None, should_cancel=None, report=None, memory_budget=None, deterministic=False, group_by_category=False, output_format=DEFAULT_OUTPUT_FORMAT):
+        """
+        將整批報價單生成為單一 Word 文檔，每份報價單各自一節並從新頁開始
+
+        模板只載入一次、文檔只寫出一次；每份報價單複製一份模板內文後依渲染計畫
+        的相對位置替換，處理失敗的報價單會被移除而不影響其他報價單
+
+        參數:
+        data -- 標準格式的報價資訊字典
+        output_dir -- 輸出目錄 (可選，預設為渲染器的 output_dir)
+        should_cancel -- 取消檢查函數 (可選)，返回 True 時於下一份報價單前中止
+        report -- 生成報告字典 (可選)，每份報價單都記錄合併後文檔的路徑與 SHA-256
+        memory_budget -- MemoryBudget 物件 (可選，預設依環境變數設定)
+        deterministic -- 是否輸出位元組可重現的文檔
+        group_by_category -- 是否依類別分組項目並加上各類別小計行
+        output_format -- 輸出格式 (docx 或 flat_xml)
+
+        返回:
+        list -- 合併後的文檔本機路徑 (沒有任何報價單成功時為空列表)
+        """
+        budget = memory_budget or MemoryBudget()
+        try:
+            with self.claim_output(output_dir) as temp_dir:
+                return self._render_combined(data, temp_dir, should_cancel, report, budget, deterministic, group_by_category, output_format)
+        finally:
+            # 停止本批為追蹤而啟動的 tracemalloc，之後未追蹤的生成不必承擔追蹤成本
+            budget.finish()
+
+    def _render_combined(self, data, output_dir, should_cancel, report, budget, deterministic, group_by_category, output_format):
+        """render_combined 的本體，budget 由呼叫端結束"""
+        temp_dir = self.prepare_output(output_dir)
+        
+        budget.check_batch(data["quotes"])
+        
+        plan, template_info, row_prototype = self.load_template()
+        item_index = template_info["item_table_index"]
+        
+        # 模板內文 (不含最後的版面設定) 作為每份報價單的原型
+        doc = self.open_template()
+        body = doc.element.body
+        section_properties = body.sectPr
+        template_elements = [copy.deepcopy(child) for child in body if child is not section_properties]
+        for child in list(body):
+            if child is not section_properties:
+                body.remove(child)
+        next_drawing_id = 1 + max((int(el.get("id", 0)) for child in template_elements for el in child.iter(qn("wp:docPr"))), default=0)
+        
+        sections = []
+        rendered = []
+        total_quotes = len(data["quotes"])
+        for idx, quote in enumerate(data["quotes"]):
+            if should_cancel and should_cancel():
+                error_message = f"生成已取消，完成 {len(sections)}/{total_quotes} 份報價單"
+                self.report_progress('error', error_message, 0)
+                raise RenderCancelled(error_message)
             
-            # 最後處理段落，跳過{#items}和{/items}標籤
-            report_progress('processing', '處理文本佔位符', int(progress_base + 75))
-            print("\n處理段落:")
-            for i, paragraph in enumerate(doc.paragraphs):
-                if "{" in paragraph.text and not ("{#items}" in paragraph.text or "{/items}" in paragraph.text):
-                    print(f"段落 {i+1} 原始內容: '{paragraph.text}'")
-                    if replace_text_with_field_value(paragraph, field_mapping):
-                        print(f"段落 {i+1} 已完成替換")
+            budget.check(quote, f"quote[{idx}]")
+            tracking = budget.begin(idx, quote.get("header", {}).get("quoteNumber", "") if isinstance(quote, dict) else "")
             
-            # 保存文件前嘗試刪除同名檔案
-            report_progress('finalizing', '準備保存文檔', int(progress_base + 85))
-            file_name = f"quote_{quote_number}.docx"
-            file_path = os.path.join(temp_dir, file_name)
+            # 複製一份模板內文加到文檔最後，並記錄此段內容的表格與段落起點
+            table_offset = len(doc.tables)
+            paragraph_offset = len(doc.paragraphs)
+            elements = [copy.deepcopy(child) for child in template_elements]
+            if sections:
+                next_drawing_id = renumber_section_ids(elements, next_drawing_id)
+            for element in elements:
+                section_properties.addprevious(element)
             
             try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    print(f"已刪除舊檔案: {file_path}")
-                    time.sleep(0.5)  # 等待一下以確保檔案被釋放
+                progress_base = idx * 90 / total_quotes
+                self.report_progress('processing', f'開始處理第 {idx+1}/{total_quotes} 份報價單', int(progress_base))
+                if "header" not in quote:
+                    raise KeyError("報價單數據缺少 'header' 字段")
+                if "details" not in quote:
+                    raise KeyError("報價單數據缺少 'details' 字段")
+                
+                quote_number = quote["header"].get("quoteNumber", "unknown")
+                self.log(f"生成報價單: {quote_number} (第 {len(sections) + 1} 節)")
+                tables = doc.tables[table_offset:]
+                items_table = tables[item_index] if 0 <= item_index < len(tables) else None
+                
+                # 項目檔的合計在串流寫入項目行時才得知，先處理項目表格
+                if has_items_file(quote) and items_table is not None:
+                    format_items_table(doc, items_table, LineItemStream(quote), quote, row_prototype, group_by_category=group_by_category)
+                    items_table = None
+                
+                field_mapping = create_field_mapping(quote)
+                fill_table_placeholders(tables, field_mapping, plan["table_locations"] if plan is not None else None)
+                if items_table is not None:
+                    format_items_table(doc, items_table, quote.get("details", []), quote, row_prototype, group_by_category=group_by_category)
+                fill_paragraph_placeholders(
+                    doc.paragraphs[paragraph_offset:], field_mapping, plan["paragraph_locations"] if plan is not None else None
+                )
+                
+                sections.append(elements)
+                rendered.append({"index": idx, "quoteNumber": quote_number})
             except Exception as e:
-                print(f"刪除舊檔案時出錯: {e}")
-                # 使用時間戳來避免檔案名衝突
-                file_name = f"quote_{quote_number}_{int(time.time())}.docx"
-                file_path = os.path.join(temp_dir, file_name)
+                # 移除這份報價單的內容，其他報價單照常輸出
+                for element in elements:
+                    body.remove(element)
+                error_message = f"處理報價單時發生錯誤: {str(e)}"
+                self.log(error_message)
+                self.report_progress('error', error_message, 0)
             
-            # 保存文件
-            doc.save(file_path)
-            outputs.append(file_path)
-            report_progress('finalizing', f'已生成報價單: {quote_number}', int(progress_base + 90))
-            print(f"已成功生成報價單: {file_path}")
-        except KeyError as e:
-            error_message = f"處理報價單時發生欄位錯誤: {str(e)}"
-            print(error_message)
-            report_progress('error', error_message, 0)
-        except Exception as e:
-            error_message = f"處理報價單時發生錯誤: {str(e)}"
-            print(error_message)
-            report_progress('error', error_message, 0)
-    
-    report_progress('completed', f'已完成所有報價單處理, 共 {len(outputs)} 份', 100)
-    return outputs
+            budget.end(tracking)
+            budget.release()
+        
+        if not sections:
+            self.report_progress('completed', '沒有可輸出的報價單', 100)
+            if report is not None:
+                report["rendered"] = []
+            return []
+        
+        # 除最後一份外，每份報價單結尾加上分節符號
+        for elements in sections[:-1]:
+            add_section_break(elements, section_properties)
+        
+        self.report_progress('finalizing', '準備保存文檔', 95)
+        file_path = os.path.join(temp_dir, f"quote_bundle_{rendered[0]['quoteNumber']}_{len(rendered)}{output_extension(output_format)}")
+        digest = save_document(doc, file_path, deterministic, output_format)
+        for entry in rendered:
+            entry.update({"path": file_path, "sha256": digest, "deterministic": deterministic})
+        self.log(f"已成功生成合併報價單 ({len(rendered)} 份): {file_path}")
+        
+        if report is not None:
+            report["rendered"] = rendered
+            if budget.tracking:
+                report["memory"] = budget.records
+        
+        self.report_progress('completed', f'已完成所有報價單處理, 共 {len(rendered)} 份', 100)
+        return [file_path]
+
+# 模組層級函數使用的預設渲染器
+_default_renderer = QuoteRenderer()
+
+def generate_docs(data, output_dir=None, should_cancel=None, pricing_mode=DEFAULT_PRICING_MODE, report=None, memory_budget=None, deterministic=DEFAULT_DETERMINISTIC, history=None, combine=False, group_by_category=False, fill_from_catalog=False, output_format=DEFAULT_OUTPUT_FORMAT):
+    """以預設渲染器生成報價單，參數與返回值同 QuoteRenderer.render"""
+    return _default_renderer.render(
+        data, output_dir, should_cancel, pricing_mode, report, memory_budget, deterministic,
+        history, combine, group_by_category, fill_from_catalog, output_format
+    )
+
+def generate_docs_from_template(data, output_dir=None, should_cancel=None, report=None, memory_budget=None, deterministic=False, group_by_category=False, output_format=DEFAULT_OUTPUT_FORMAT):
+    """以預設渲染器逐份生成標準格式的報價單，參數與返回值同 QuoteRenderer.render_separate"""
+    return _default_renderer.render_separate(data, output_dir, should_cancel, report, memory_budget, deterministic, group_by_category, output_format)
+
+def generate_combined_doc(data, output_dir=None, should_cancel=None, report=None, memory_budget=None, deterministic=False, group_by_category=False, output_format=DEFAULT_OUTPUT_FORMAT):
+    """以預設渲染器將標準格式的報價單合併為單一文檔，參數與返回值同 QuoteRenderer.render_combined"""
+    return _default_renderer.render_combined(data, output_dir, should_cancel, report, memory_budget, deterministic, group_by_category, output_format)
 
 def main():
     # 讀取 JSON 資料檔
@@ -0,0 +1,148 @@
+import os
+import csv
+from quote_pricing import to_number, totals_from_subtotal
+
+# openpyxl 為選用依賴，只有讀取 XLSX 項目檔時需要
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# 報價單中指定項目檔的欄位
+ITEMS_FILE_FIELD = "items_file_path"
+
+LINE_ITEM_FIELDS = ("category", "items", "unit", "quantity", "amount")
+NUMERIC_FIELDS = ("unit", "quantity", "amount")
+
+# 標題列可使用的中文欄名
+COLUMN_ALIASES = {
+    "類別": "category",
+    "項目": "items",
+    "單價": "unit",
+    "數量": "quantity",
+    "金額": "amount",
+}
+
+CSV_EXTENSIONS = (".csv", ".tsv", ".txt")
+XLSX_EXTENSIONS = (".xlsx", ".xlsm")
+
+def has_items_file(quote):
+    """報價單是否由項目檔提供項目"""
+    return isinstance(quote, dict) and bool(quote.get(ITEMS_FILE_FIELD))
+
+def _column_fields(header_row):
+    """將標題列對應到項目欄位，無法辨識的欄位為 None"""
+    fields = []
+    for name in header_row:
+        name = str(name or "").strip().lstrip("﻿")
+        name = COLUMN_ALIASES.get(name, name.lower())
+        fields.append(name if name in LINE_ITEM_FIELDS else None)
+    if "items" not in fields:
+        raise ValueError(f"項目檔標題列缺少 items 欄位，可用欄位: {', '.join(LINE_ITEM_FIELDS)}")
+    return fields
+
+def _build_item(fields, values):
+    """將一列數值組成項目字典，空白列返回 None"""
+    item = {}
+    for field, value in zip(fields, values):
+        if field is None or value is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+            if not value:
+                continue
+        if field in NUMERIC_FIELDS:
+            number = to_number(value)
+            if number is not None:
+                value = int(number) if number.is_integer() else number
+        item[field] = value
+    if not item:
+        return None
+    # 未提供金額時以 單價 × 數量 計算
+    if "amount" not in item:
+        unit, quantity = to_number(item.get("unit")), to_number(item.get("quantity"))
+        if unit is not None and quantity is not None:
+            amount = unit * quantity
+            item["amount"] = int(amount) if amount.is_integer() else amount
+    return item
+
+def _iter_csv_rows(path):
+    """逐列讀取 CSV (TSV 以副檔名判斷分隔字元)"""
+    delimiter = "\t" if path.lower().endswith(".tsv") else ","
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        yield from csv.reader(f, delimiter=delimiter)
+
+def _iter_xlsx_rows(path):
+    """以唯讀模式逐列讀取 XLSX 的第一個工作表"""
+    if openpyxl is None:
+        raise ValueError("讀取 XLSX 項目檔需要安裝 openpyxl (pip install openpyxl)")
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def iter_line_items(path):
+    """
+    逐列讀取項目檔，不會一次載入整個檔案
+
+    第一列為標題列，欄位為 category、items、unit、quantity、amount
+    (或 類別、項目、單價、數量、金額)；數字欄位接受含千分位逗點的文字
+
+    參數:
+    path -- CSV 或 XLSX 檔案路徑
+
+    返回:
+    generator -- 項目字典
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in XLSX_EXTENSIONS:
+        rows = _iter_xlsx_rows(path)
+    elif extension in CSV_EXTENSIONS:
+        rows = _iter_csv_rows(path)
+    else:
+        raise ValueError(f"不支援的項目檔格式: {extension or path}，請使用 CSV 或 XLSX")
+
+    fields = None
+    for row in rows:
+        if fields is None:
+            fields = _column_fields(row)
+            continue
+        item = _build_item(fields, row)
+        if item is not None:
+            yield item
+
+class LineItemStream:
+    """
+    報價單的串流項目來源
+
+    先依序產生項目檔的每一列，再接著產生 JSON 中的 details，
+    走訪時同時累計項目數與金額，寫完項目行即可得到合計而不需保留項目列表
+
+    參數:
+    quote -- 指定了 items_file_path 的報價單
+    """
+
+    def __init__(self, quote):
+        self.path = quote[ITEMS_FILE_FIELD]
+        self.extra = quote.get("details") or []
+        self.count = 0
+        self.subtotal = 0.0
+
+    def __iter__(self):
+        self.count = 0
+        self.subtotal = 0.0
+        for source in (iter_line_items(self.path), self.extra):
+            for item in source:
+                if not isinstance(item, dict):
+                    continue
+                self.count += 1
+                self.subtotal += to_number(item.get("amount")) or 0.0
+                yield item
+
+    def fill_totals(self, quote):
+        """以累計的小計補上報價單缺少的合計欄位 (已指定的欄位沿用輸入值)"""
+        totals = totals_from_subtotal(self.subtotal, quote.get("discount", 0))
+        for field, value in totals.items():
+            if quote.get(field) is None:
+                quote[field] = value
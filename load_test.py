@@ -0,0 +1,303 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+from datetime import datetime
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
+from quote_pricing import compute_totals
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(PROJECT_DIR, "load_tests")
+TRANSPORTS = ("stdio", "http", "sse")
+
+# 成功回應的開頭 (其餘視為錯誤)
+SUCCESS_PREFIX = "已生成報價單文檔"
+
+def parse_mix(text):
+    """
+    解析項目數組合，例如 "5:6,30:3,200:1" 表示 60% 5 項、30% 30 項、10% 200 項
+
+    返回:
+    tuple -- (項目數列表, 權重列表)
+    """
+    counts, weights = [], []
+    for part in text.split(","):
+        count, _, weight = part.partition(":")
+        counts.append(int(count))
+        weights.append(float(weight or 1))
+    return counts, weights
+
+def build_quote(rng, number, item_count):
+    """產生一份合成報價單，金額與合計都一致 (不會觸發價格核對差異)"""
+    details = []
+    for i in range(item_count):
+        unit = rng.choice([500, 1000, 2500, 8000, 15000])
+        quantity = rng.randint(1, 10)
+        details.append({
+            "category": rng.choice(["前端開發", "後端開發", "設計", "測試", "維護"]),
+            "items": f"合成項目 {i + 1}",
+            "unit": unit,
+            "quantity": quantity,
+            "amount": unit * quantity,
+        })
+    discount = rng.choice([0, 0, 1000, 5000])
+    quote = {
+        "header": {
+            "companyName": "亦式數位互動有限公司",
+            "companyContact": "0988363357",
+            "companyEmail": "istudiodesign.tw@gmail.com",
+            "quoteNumber": f"Q-LOAD-{number:06d}",
+            "start_date": "2024/05/23",
+            "end_date": "2024/06/23",
+            "staff": "壓力測試",
+            "key": "96790278",
+            "recipient": f"測試客戶 {number}",
+            "Title": "壓力測試報價單",
+        },
+        "details": details,
+        "discount": discount,
+        "notes": "load test",
+    }
+    quote.update(compute_totals(details, discount))
+    return quote
+
+def build_payloads(args):
+    """依設定產生每個請求的工具參數，部分請求可重複先前的內容以測試請求合併"""
+    rng = random.Random(args.seed)
+    counts, weights = parse_mix(args.items)
+    payloads = []
+    number = 0
+    for _ in range(args.requests):
+        if payloads and rng.random() < args.duplicate_ratio:
+            payloads.append(rng.choice(payloads))
+            continue
+        quotes = []
+        for _ in range(args.quotes):
+            number += 1
+            quotes.append(build_quote(rng, number, rng.choices(counts, weights)[0]))
+        arguments = {"json_content": json.dumps({"quotes": quotes}, ensure_ascii=False)}
+        if args.combine:
+            arguments["combine"] = True
+        payloads.append(arguments)
+    return payloads
+
+def percentile(values, pct):
+    """以線性內插計算百分位數 (values 需已排序)"""
+    if not values:
+        return None
+    position = (len(values) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def summarize(results, elapsed, concurrency):
+    """彙整單一並發等級的延遲、吞吐量與錯誤率"""
+    latencies = sorted(r["ms"] for r in results if r["ok"])
+    errors = {}
+    for r in results:
+        if not r["ok"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    total = len(results)
+    ok = len(latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "succeeded": ok,
+        "failed": total - ok,
+        "error_rate": round((total - ok) / total, 4) if total else 0,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(ok / elapsed, 3) if elapsed > 0 else None,
+        "latency_ms": {
+            "min": round(latencies[0], 1) if latencies else None,
+            "mean": round(sum(latencies) / ok, 1) if ok else None,
+            "p50": round(percentile(latencies, 50), 1) if ok else None,
+            "p90": round(percentile(latencies, 90), 1) if ok else None,
+            "p99": round(percentile(latencies, 99), 1) if ok else None,
+            "max": round(latencies[-1], 1) if latencies else None,
+        },
+        "errors": errors,
+    }
+
+async def call_tool(session, arguments, timeout):
+    """呼叫一次 generate_quote_docs 並記錄延遲與結果"""
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(session.call_tool("generate_quote_docs", arguments), timeout)
+        text = result.content[0].text if result.content else ""
+        ok = not result.isError and text.startswith(SUCCESS_PREFIX)
+        error = None if ok else (text.splitlines()[0][:80] if text else "空白回應")
+    except asyncio.TimeoutError:
+        ok, error = False, f"客戶端逾時 ({timeout} 秒)"
+    except Exception as e:
+        ok, error = False, f"{type(e).__name__}: {str(e)[:80]}"
+    return {"ok": ok, "ms": (time.perf_counter() - start) * 1000, "error": error}
+
+def open_client(transport, url):
+    """建立對應傳輸方式的 MCP 客戶端連線"""
+    if transport == "sse":
+        return sse_client(f"{url}/sse")
+    return streamablehttp_client(f"{url}/mcp/")
+
+async def fetch_server_stats(session):
+    """取得伺服器端的佇列與合併統計"""
+    try:
+        result = await session.call_tool("get_server_stats", {})
+        return json.loads(result.content[0].text)
+    except Exception as e:
+        return {"error": str(e)}
+
+async def run_stdio_level(args, payloads, concurrency):
+    """STDIO: 啟動一個伺服器程序，所有並發請求共用同一個 session"""
+    env = {**os.environ, **dict(args.env)}
+    params = StdioServerParameters(command=sys.executable, args=["mcp_server_stdio.py"], cwd=PROJECT_DIR, env=env)
+    async with stdio_client(params, errlog=open(os.devnull, "w")) as (read_stream, write_stream):
+        async with ClientSession(read_stream, write_stream) as session:
+            await session.initialize()
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one(arguments):
+                async with semaphore:
+                    return await call_tool(session, arguments, args.timeout)
+
+            start = time.perf_counter()
+            results = await asyncio.gather(*[one(p) for p in payloads])
+            elapsed = time.perf_counter() - start
+            return results, elapsed, await fetch_server_stats(session)
+
+async def run_network_level(args, payloads, concurrency, transport, url):
+    """SSE / Streamable HTTP: 每個並發客戶端各自一個 session，依序送出分配到的請求"""
+    queue = asyncio.Queue()
+    for arguments in payloads:
+        queue.put_nowait(arguments)
+    results = []
+
+    async def client():
+        async with open_client(transport, url) as streams:
+            async with ClientSession(streams[0], streams[1]) as session:
+                await session.initialize()
+                while not queue.empty():
+                    results.append(await call_tool(session, queue.get_nowait(), args.timeout))
+
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*[client() for _ in range(concurrency)], return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            results.append({"ok": False, "ms": 0, "error": f"連線失敗: {type(outcome).__name__}: {str(outcome)[:80]}"})
+
+    async with open_client(transport, url) as streams:
+        async with ClientSession(streams[0], streams[1]) as session:
+            await session.initialize()
+            stats = await fetch_server_stats(session)
+    return results, elapsed, stats
+
+def start_http_server(args):
+    """啟動本機 HTTP 伺服器並等待健康檢查通過，返回 (程序, 基底網址)"""
+    env = {**os.environ, **dict(args.env)}
+    process = subprocess.Popen(
+        [sys.executable, "mcp_server_http.py", "--host", "127.0.0.1", "--port", str(args.port)],
+        cwd=PROJECT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{args.port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"HTTP 伺服器啟動失敗 (結束碼 {process.returncode})")
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=1):
+                return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("等待 HTTP 伺服器就緒逾時")
+
+async def run_transport(args, transport, levels):
+    """對單一傳輸方式依序執行各並發等級"""
+    payloads = build_payloads(args)
+    process, url = None, args.url
+    if transport != "stdio" and not url:
+        process, url = start_http_server(args)
+    try:
+        for concurrency in levels:
+            if transport == "stdio":
+                results, elapsed, stats = await run_stdio_level(args, payloads, concurrency)
+            else:
+                results, elapsed, stats = await run_network_level(args, payloads, concurrency, transport, url)
+            summary = summarize(results, elapsed, concurrency)
+            summary["server_stats"] = stats
+            yield summary
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+def print_summary(transport, summary):
+    """印出單一並發等級的結果"""
+    latency = summary["latency_ms"]
+    print(
+        f"[{transport}] 並發 {summary['concurrency']:>3}: "
+        f"{summary['succeeded']}/{summary['requests']} 成功，錯誤率 {summary['error_rate']:.1%}，"
+        f"吞吐量 {summary['throughput_rps']} req/s，"
+        f"p50 {latency['p50']} ms，p90 {latency['p90']} ms，p99 {latency['p99']} ms"
+    )
+    for error, count in summary["errors"].items():
+        print(f"    {count} × {error}")
+
+async def run(args):
+    """執行壓力測試並寫出結果"""
+    levels = [int(level) for level in args.concurrency.split(",")]
+    transports = TRANSPORTS if args.transport == "all" else (args.transport,)
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": {},
+    }
+    for transport in transports:
+        report["results"][transport] = []
+        async for summary in run_transport(args, transport, levels):
+            print_summary(transport, summary)
+            report["results"][transport].append(summary)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{args.transport}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"已寫出壓力測試結果: {output}")
+
+def parse_env(text):
+    """解析 --env KEY=VALUE"""
+    key, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"環境變數格式必須是 KEY=VALUE: {text}")
+    return key, value
+
+def main():
+    """以本機客戶端對 MCP Server 進行壓力測試"""
+    parser = argparse.ArgumentParser(description="報價單 MCP Server 壓力測試")
+    parser.add_argument("--transport", choices=TRANSPORTS + ("all",), default="stdio", help="傳輸方式")
+    parser.add_argument("--concurrency", default="5,20,50", help="並發數，以逗號分隔多個等級")
+    parser.add_argument("--requests", type=int, default=50, help="每個並發等級的請求數")
+    parser.add_argument("--items", default="5:6,30:3,200:1", help="每份報價單項目數的組合 (項目數:權重)")
+    parser.add_argument("--quotes", type=int, default=1, help="每個請求的報價單數")
+    parser.add_argument("--combine", action="store_true", help="請求合併輸出為單一文檔")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0, help="重複先前請求內容的比例 (測試請求合併)")
+    parser.add_argument("--timeout", type=float, default=600, help="每個請求的客戶端逾時秒數")
+    parser.add_argument("--seed", type=int, default=1, help="合成數據的亂數種子")
+    parser.add_argument("--port", type=int, default=8765, help="自動啟動 HTTP 伺服器時使用的埠號")
+    parser.add_argument("--url", help="改為測試已在執行的 HTTP 伺服器，例如 http://127.0.0.1:8000")
+    parser.add_argument("--env", type=parse_env, action="append", default=[("QUOTE_HISTORY", "0")],
+                        help="傳給伺服器程序的環境變數 KEY=VALUE，可重複 (預設停用歷史紀錄)")
+    parser.add_argument("--output", help="結果 JSON 路徑 (預設寫入 load_tests/)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
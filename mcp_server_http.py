@@ -0,0 +1,82 @@
+import os
+import argparse
+import contextlib
+import logging
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+from mcp.server.sse import SseServerTransport
+from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+
+# 與 STDIO 模式共用同一個 MCP Server 與工具定義
+from mcp_server_stdio import app_server, ensure_temp_dir
+
+logger = logging.getLogger("mcp-server-http")
+
+# 預設只監聽本機
+DEFAULT_HOST = os.environ.get("QUOTE_HTTP_HOST", "127.0.0.1")
+DEFAULT_PORT = int(os.environ.get("QUOTE_HTTP_PORT", "8000"))
+# HTTP keep-alive 秒數 (SSE 串流另由 sse-starlette 每 15 秒送出 ping)
+DEFAULT_KEEP_ALIVE = int(os.environ.get("QUOTE_HTTP_KEEP_ALIVE", "75"))
+
+def create_app():
+    """
+    建立同時提供 SSE 與 Streamable HTTP 傳輸的 Starlette 應用
+
+    端點:
+    /sse -- SSE 連線 (GET)
+    /messages/ -- SSE 模式的客戶端訊息 (POST)
+    /mcp -- Streamable HTTP 傳輸
+    /health -- 健康檢查
+
+    每個連線各自執行一個 MCP session，彼此的請求上下文與輸出目錄互不影響
+    """
+    sse = SseServerTransport("/messages/")
+    session_manager = StreamableHTTPSessionManager(app=app_server)
+
+    async def handle_sse(request):
+        async with sse.connect_sse(request.scope, request.receive, request._send) as (read_stream, write_stream):
+            await app_server.run(
+                read_stream,
+                write_stream,
+                app_server.create_initialization_options()
+            )
+        return Response()
+
+    async def handle_streamable_http(scope, receive, send):
+        await session_manager.handle_request(scope, receive, send)
+
+    async def handle_health(request):
+        return JSONResponse({"status": "ok", "server": app_server.name})
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        ensure_temp_dir()
+        async with session_manager.run():
+            logger.info("MCP Server (HTTP 模式) 已就緒")
+            yield
+
+    return Starlette(
+        routes=[
+            Route("/sse", endpoint=handle_sse, methods=["GET"]),
+            Mount("/messages/", app=sse.handle_post_message),
+            Mount("/mcp", app=handle_streamable_http),
+            Route("/health", endpoint=handle_health, methods=["GET"]),
+        ],
+        lifespan=lifespan,
+    )
+
+def main():
+    """運行 HTTP MCP server"""
+    parser = argparse.ArgumentParser(description="以 SSE / Streamable HTTP 提供報價單 MCP Server")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="監聽位址")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="監聽埠號")
+    parser.add_argument("--keep-alive", type=int, default=DEFAULT_KEEP_ALIVE, help="HTTP keep-alive 秒數")
+    args = parser.parse_args()
+
+    logger.info(f"啟動 MCP Server (HTTP 模式): http://{args.host}:{args.port}")
+    uvicorn.run(create_app(), host=args.host, port=args.port, timeout_keep_alive=args.keep_alive)
+
+if __name__ == "__main__":
+    main()
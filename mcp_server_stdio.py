@@ -1,7 +1,13 @@
 import os
+import re
 import json
+import time
+import shutil
 import asyncio
+import tempfile
+import hashlib
 import logging
+import contextvars
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
 from mcp import types
@@ -11,18 +17,437 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(level
 logger = logging.getLogger("mcp-server-stdio")
 
 # 導入報價單生成功能
-from generate_quote_docs import generate_docs
+from generate_quote_docs import QuoteRenderer, format_number
+from render_jobs import RenderQueue
+from quote_pricing import DEFAULT_PRICING_MODE, PRICING_MODES, summarize_issues
+from quote_inputs import expand_input_paths, is_multi_file_path, load_quote_files
+from quote_profiling import PROFILE_ENABLED, make_profile_id, profile_call
+from memory_budget import DEFAULT_LIMIT_MB, DEFAULT_TRACKING, MemoryBudget, MemoryBudgetExceeded, current_rss
+from deterministic_docx import DEFAULT_DETERMINISTIC
+from flat_opc import DEFAULT_OUTPUT_FORMAT, OUTPUT_FORMATS
+from quote_history import DEFAULT_SEARCH_LIMIT, HISTORY_ENABLED, QuoteHistory
+from quote_variants import count_rendered_quotes
+from line_items import ITEMS_FILE_FIELD
+from row_cache import row_fragment_cache
+from quote_validation import summarize_validation, validate_input
+from price_catalog import CATALOG_PATH, DEFAULT_LOOKUP_LIMIT, get_catalog, summarize_fills
+
+# 單次請求可包含的報價單數上限
+MAX_QUOTES_PER_JOB = int(os.environ.get("QUOTE_MAX_QUOTES_PER_JOB", "100"))
+
+# 每個請求的輸出子目錄保留秒數，之後的請求開始時清除過期的子目錄
+OUTPUT_TTL = int(os.environ.get("QUOTE_OUTPUT_TTL", "3600"))
+REQUEST_DIR_PREFIX = "req_"
+
+# 生成工作佇列：限制並發數、佇列深度與每個工作的期限
+render_queue = RenderQueue()
+
+# 已生成報價單的歷史紀錄 (QUOTE_HISTORY=0 時停用)
+quote_history = QuoteHistory() if HISTORY_ENABLED else None
+
+# 所有工作執行緒共用的渲染器 (可重入)；生成過程的訊息寫入日誌而非 stdout，避免干擾 STDIO 傳輸。
+# 每個請求寫入各自新建的子目錄，不需生成前清理，舊輸出由 prune_request_dirs 依保留時間清除
+renderer = QuoteRenderer(log=logger.info, cleanup=False)
 
 # 確保 temp 目錄存在
 def ensure_temp_dir():
     """確保臨時目錄存在"""
-    temp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "temp")
+    temp_dir = renderer.output_dir
     if not os.path.exists(temp_dir):
         os.makedirs(temp_dir, exist_ok=True)
     return temp_dir
 
+# 目前 MCP session 建立的輸出目錄 (QuoteServer.run 設定，session 內的請求處理共用同一個集合)
+_session_output_dirs = contextvars.ContextVar("session_output_dirs", default=None)
+
+def session_output_dir():
+    """
+    取得目前請求的輸出目錄
+
+    STDIO 模式只有單一 session，沿用 temp/；
+    網路傳輸 (SSE / Streamable HTTP) 下每個 session 使用各自的子目錄，session 結束時移除。
+    每次請求再於其下建立各自的子目錄 (request_output_dir)
+    """
+    temp_dir = ensure_temp_dir()
+    try:
+        request = app_server.request_context.request
+    except LookupError:
+        return temp_dir
+    if request is None:
+        return temp_dir
+
+    # Streamable HTTP 以標頭傳遞 session id，SSE 則放在查詢參數
+    session_id = request.headers.get("mcp-session-id") or request.query_params.get("session_id")
+    if not session_id:
+        return temp_dir
+
+    session_dir = os.path.join(temp_dir, "session_" + re.sub(r'[^A-Za-z0-9_-]', '', session_id))
+    os.makedirs(session_dir, exist_ok=True)
+    session_dirs = _session_output_dirs.get()
+    if session_dirs is not None:
+        session_dirs.add(session_dir)
+    return session_dir
+
+def request_output_dir(session_dir):
+    """
+    在 session 的輸出目錄下為單次請求建立新的子目錄
+
+    並發的請求各自寫入自己的子目錄，回應前檢查檔案時不會被其他請求清除
+    """
+    return tempfile.mkdtemp(prefix=REQUEST_DIR_PREFIX + time.strftime("%Y%m%d-%H%M%S_"), dir=session_dir)
+
+def prune_request_dirs(temp_dir, ttl=OUTPUT_TTL):
+    """清除 temp 目錄 (含各 session 子目錄) 中超過保留時間的請求子目錄"""
+    deadline = time.time() - ttl
+    parents = [temp_dir] + [entry.path for entry in os.scandir(temp_dir) if entry.is_dir() and entry.name.startswith("session_")]
+    for parent in parents:
+        try:
+            entries = list(os.scandir(parent))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir() and entry.name.startswith(REQUEST_DIR_PREFIX) and entry.stat().st_mtime < deadline:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    logger.info(f"已清除過期的輸出目錄: {entry.path}")
+            except OSError:
+                pass
+
+# 進行中的生成任務 (參數指紋 -> [asyncio.Task, 等待者數量])，用於合併重複請求
+_inflight_renders = {}
+coalesce_stats = {"renders": 0, "coalesced": 0}
+
+# 記憶體統計 (啟用追蹤時累計)
+memory_stats = {"tracked_quotes": 0, "max_python_peak_kb": 0, "max_rss_delta_kb": 0, "rejected": 0}
+
+def fingerprint_arguments(file_data, options=None, output_dir=None):
+    """
+    計算報價單數據、生成選項與輸出目錄的指紋
+
+    以排序鍵後的緊湊 JSON 計算 SHA-256，內容相同的請求會得到相同指紋；
+    指紋包含 session 的輸出目錄，合併只發生在同一 session 內，不同 session 不會共用輸出路徑
+    """
+    canonical = json.dumps([file_data, options or {}, output_dir], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+async def run_coalesced(key, render):
+    """
+    執行生成任務，若已有相同指紋的任務進行中則直接等待其結果
+
+    參數:
+    key -- 參數指紋
+    render -- 無參數函數，返回實際執行生成的 coroutine
+
+    返回:
+    生成結果，所有合併的呼叫者取得同一份結果
+    """
+    entry = _inflight_renders.get(key)
+    if entry is None:
+        task = asyncio.ensure_future(render())
+        entry = [task, 0]
+        _inflight_renders[key] = entry
+        coalesce_stats["renders"] += 1
+
+        def _release(finished):
+            if _inflight_renders.get(key) is entry:
+                del _inflight_renders[key]
+            # 避免所有呼叫者都已離開時出現未取回例外的警告
+            if not finished.cancelled():
+                finished.exception()
+
+        task.add_done_callback(_release)
+    else:
+        coalesce_stats["coalesced"] += 1
+        logger.info(f"合併重複的生成請求: {key[:12]}")
+
+    task = entry[0]
+    entry[1] += 1
+    try:
+        # shield 讓單一呼叫者離開時不會中斷其他人共用的任務
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        # 最後一位呼叫者也取消時，才真正取消共用的任務
+        if entry[1] == 1 and not task.done():
+            task.cancel()
+        raise
+    finally:
+        entry[1] -= 1
+
+def _generate_in_dir(file_data, output_dir, report, profile_id=None, should_cancel=None, track_memory=DEFAULT_TRACKING, **options):
+    """在工作執行緒中生成文檔 (輸出目錄為本次請求專用)；指定 profile_id 時以效能分析器包裹"""
+    budget = MemoryBudget(tracking=track_memory)
+    if profile_id is None:
+        return renderer.render(
+            file_data, output_dir, should_cancel=should_cancel, report=report,
+            memory_budget=budget, history=quote_history, **options
+        )
+    doc_paths, report["profile"] = profile_call(
+        profile_id, renderer.render, file_data, output_dir, should_cancel=should_cancel,
+        report=report, memory_budget=budget, history=quote_history, **options
+    )
+    return doc_paths
+
+def _record_memory(records):
+    """將單次生成的記憶體記錄併入累計統計"""
+    for record in records:
+        memory_stats["tracked_quotes"] += 1
+        memory_stats["max_python_peak_kb"] = max(memory_stats["max_python_peak_kb"], record["python_peak_kb"])
+        memory_stats["max_rss_delta_kb"] = max(memory_stats["max_rss_delta_kb"], record["rss_delta_kb"] or 0)
+
+async def render_quotes(file_data, output_dir, options, profile_id=None):
+    """
+    生成報價單並構建工具回傳內容
+
+    參數:
+    file_data -- 已驗證的報價單數據
+    output_dir -- session 的輸出目錄，文檔寫入其下為本次請求新建的子目錄
+    options -- 傳給 QuoteRenderer.render 的生成選項
+    profile_id -- 效能分析結果的檔名 (可選，未指定時不分析)
+
+    返回:
+    list -- MCP TextContent 列表
+    """
+    report = {}
+    prune_request_dirs(ensure_temp_dir())
+    request_dir = request_output_dir(output_dir)
+    
+    # 經由工作佇列在執行緒中生成，避免阻塞事件循環影響其他 session
+    try:
+        doc_paths = await render_queue.submit(_generate_in_dir, file_data, request_dir, report, profile_id, **options)
+    except MemoryBudgetExceeded as e:
+        memory_stats["rejected"] += 1
+        logger.error(f"超過記憶體上限: {e}")
+        return [types.TextContent(type="text", text=f"超過記憶體上限，未生成報價單: {e}")]
+    _record_memory(report.get("memory", []))
+    
+    # 確保生成的文檔存在
+    if not doc_paths or len(doc_paths) == 0:
+        logger.error("未能生成任何報價單文檔")
+        return [types.TextContent(type="text", text="未能生成任何報價單文檔")]
+    
+    # 構建結果 - STDIO 模式下只返回本地文件路徑
+    result_content = []
+    # 合併輸出時多份報價單共用同一個文件
+    rendered = {}
+    for entry in report.get("rendered", []):
+        rendered.setdefault(entry["path"], []).append(entry)
+    for path in doc_paths:
+        filename = os.path.basename(path)
+        
+        # 確認文件確實存在
+        if not os.path.exists(path):
+            logger.warning(f"生成的文件不存在: {path}")
+            continue
+        
+        logger.info(f"已生成報價單: {filename}, 文件路徑: {path}")
+        # 在 STDIO 模式下，只提供本地文件路徑
+        text = f"已生成報價單文檔: {filename}\n文件路徑: {path}"
+        entries = rendered.get(path, [])
+        if len(entries) > 1:
+            text += f"\n包含 {len(entries)} 份報價單: {', '.join(entry['quoteNumber'] for entry in entries)}"
+        if entries and entries[0]["deterministic"]:
+            text += f"\nSHA-256: {entries[0]['sha256']}"
+        history_ids = [str(entry["history_id"]) for entry in entries if entry.get("history_id")]
+        if history_ids:
+            text += f"\n歷史紀錄 id: {', '.join(history_ids)}"
+        result_content.append(types.TextContent(type="text", text=text))
+    
+    if not result_content:
+        return [types.TextContent(type="text", text="生成的報價單文件無法訪問")]
+    
+    # 附上價目表填入結果
+    if report.get("catalog_fills") or report.get("catalog_missing"):
+        result_content.append(types.TextContent(
+            type="text",
+            text=summarize_fills(report.get("catalog_fills", []), report.get("catalog_missing", []))
+        ))
+    
+    # 附上價格核對結果
+    if report.get("pricing_issues"):
+        result_content.append(types.TextContent(
+            type="text",
+            text=summarize_issues(report["pricing_issues"], report["pricing_mode"])
+        ))
+    
+    # 附上每份報價單的記憶體用量
+    if report.get("memory"):
+        lines = ["記憶體用量:"]
+        for record in report["memory"]:
+            lines.append(
+                f"- quote[{record['index']}] {record['quoteNumber']}: Python 峰值 {record['python_peak_kb']} KB，"
+                f"RSS {record['rss_mb']} MB (+{record['rss_delta_kb']} KB)，耗時 {record['seconds']} 秒"
+            )
+        result_content.append(types.TextContent(type="text", text="\n".join(lines)))
+    
+    # 附上效能分析結果
+    if report.get("profile"):
+        profile = report["profile"]
+        result_content.append(types.TextContent(
+            type="text",
+            text=f"效能分析 ({profile['seconds']} 秒): {profile['prof_path']}\n{profile['summary']}"
+        ))
+    
+    logger.info(f"=== MCP 工具調用完成，生成了 {len(result_content)} 個文檔 ===")
+    return result_content
+
+def current_request_id():
+    """取得目前 MCP 請求的 id，不在請求中時返回 None"""
+    try:
+        return app_server.request_context.request_id
+    except LookupError:
+        return None
+
+def _read_json_file(file_path):
+    """讀取單一 JSON 文件"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+async def load_request_data(arguments, use_backup=True):
+    """
+    依工具參數讀取報價單數據 (json_file_path 或 json_content)
+
+    參數:
+    arguments -- 工具參數
+    use_backup -- 未提供數據時是否改用專案下的 input.json
+
+    返回:
+    tuple -- (數據, 讀取失敗的文件列表, 錯誤訊息)，錯誤訊息不為 None 時應直接回報
+    """
+    # 初始化文件數據
+    file_data = None
+    file_errors = []
+
+    # 方法1：從文件路徑讀取 (單一文件、目錄或 glob 樣式)
+    if "json_file_path" in arguments and arguments["json_file_path"]:
+        file_path = arguments["json_file_path"]
+        logger.info(f"嘗試從文件路徑讀取: {file_path}")
+
+        if is_multi_file_path(file_path):
+            paths = expand_input_paths(file_path)
+            logger.info(f"找到 {len(paths)} 個JSON文件，開始平行讀取")
+            file_data, file_errors = await asyncio.to_thread(load_quote_files, paths)
+            for error in file_errors:
+                logger.error(f"讀取文件失敗: {error['file']}: {error['error']}")
+            if not file_data["quotes"]:
+                message = f"未能從 {file_path} 讀取任何報價單"
+                if file_errors:
+                    message += "\n" + "\n".join(f"- {e['file']}: {e['error']}" for e in file_errors)
+                return None, file_errors, message
+            logger.info(f"成功從 {len(paths) - len(file_errors)} 個文件讀取 {len(file_data['quotes'])} 份報價單")
+        elif os.path.exists(file_path):
+            try:
+                file_data = await asyncio.to_thread(_read_json_file, file_path)
+                logger.info(f"成功從文件讀取數據: {file_path}")
+            except Exception as e:
+                logger.error(f"讀取文件失敗: {e}")
+                return None, file_errors, f"讀取JSON文件失敗: {str(e)}"
+        else:
+            logger.warning(f"文件不存在: {file_path}")
+
+    # 方法2：從JSON內容讀取
+    elif "json_content" in arguments and arguments["json_content"]:
+        json_content = arguments["json_content"]
+        logger.info(f"嘗試解析JSON內容，長度: {len(json_content)} 字符")
+
+        try:
+            file_data = json.loads(json_content)
+            logger.info(f"成功解析JSON內容")
+        except json.JSONDecodeError as e:
+            logger.error(f"解析JSON內容失敗: {e}")
+            return None, file_errors, f"解析JSON內容失敗: {str(e)}"
+
+    # 方法3：如果沒有提供文件，使用備用數據
+    if file_data is None and not use_backup:
+        return None, file_errors, "請提供 json_content 或 json_file_path"
+    if file_data is None:
+        logger.info("未提供有效的JSON文件或內容，使用備用數據")
+        backup_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "input.json")
+        if os.path.exists(backup_path):
+            try:
+                file_data = await asyncio.to_thread(_read_json_file, backup_path)
+                logger.info(f"已從備用文件載入數據: {backup_path}")
+            except Exception as e:
+                logger.error(f"讀取備用文件失敗: {e}")
+                return None, file_errors, f"讀取備用數據失敗: {str(e)}"
+        else:
+            logger.error(f"無法找到備用數據文件: {backup_path}")
+            return None, file_errors, "未提供JSON文件且無備用數據"
+
+    return file_data, file_errors, None
+
+def apply_items_file(file_data, items_file_path):
+    """
+    將工具參數指定的項目檔套用到沒有自行指定項目檔的報價單
+
+    返回:
+    str -- 錯誤訊息，沒有錯誤時返回 None
+    """
+    items_file_path = os.path.abspath(items_file_path)
+    if not os.path.isfile(items_file_path):
+        return f"找不到項目檔: {items_file_path}"
+    for quote in file_data["quotes"]:
+        if isinstance(quote, dict) and not quote.get(ITEMS_FILE_FIELD):
+            quote[ITEMS_FILE_FIELD] = items_file_path
+    return None
+
+def collect_server_stats():
+    """彙整佇列、請求合併與記憶體的統計資訊"""
+    rss = current_rss()
+    return {
+        "queue": render_queue.snapshot(),
+        "max_quotes_per_job": MAX_QUOTES_PER_JOB,
+        "coalescing": {**coalesce_stats, "inflight": len(_inflight_renders)},
+        "row_cache": row_fragment_cache.snapshot(),
+        "memory": {
+            **memory_stats,
+            "rss_mb": round(rss / 1048576, 1) if rss is not None else None,
+            "limit_mb": DEFAULT_LIMIT_MB,
+        },
+    }
+
+def format_history_records(records):
+    """將歷史紀錄搜尋結果整理為給使用者閱讀的文字"""
+    if not records:
+        return "找不到符合條件的歷史報價單"
+    lines = [f"找到 {len(records)} 筆歷史報價單:"]
+    for record in records:
+        lines.append(
+            f"- id {record['id']}: {record['quote_number']} {record['title'] or ''} / {record['recipient'] or ''}，"
+            f"報價日期 {record['quote_date'] or '-'}，總計 {format_number(record['total_with_tax'])}，生成於 {record['created_at']}"
+        )
+    return "\n".join(lines)
+
+def format_history_record(record):
+    """將單筆歷史紀錄整理為文件路徑與標準化數據"""
+    text = (
+        f"歷史報價單 id {record['id']}: {record['quote_number']}\n"
+        f"生成於: {record['created_at']}\n"
+        f"文件路徑: {record['archive_path']}\n"
+        f"SHA-256: {record['sha256']}"
+    )
+    if not os.path.exists(record["archive_path"]):
+        text += "\n(歷史文件已不存在，可用下方數據重新生成)"
+    return [
+        types.TextContent(type="text", text=text),
+        types.TextContent(type="text", text=json.dumps({"quotes": [record["data"]]}, ensure_ascii=False, indent=2)),
+    ]
+
+class QuoteServer(Server):
+    """session 結束 (run 返回) 時移除該 session 的輸出目錄的 MCP Server"""
+
+    async def run(self, *args, **kwargs):
+        session_dirs = set()
+        token = _session_output_dirs.set(session_dirs)
+        try:
+            return await super().run(*args, **kwargs)
+        finally:
+            _session_output_dirs.reset(token)
+            for session_dir in session_dirs:
+                shutil.rmtree(session_dir, ignore_errors=True)
+                logger.info(f"session 已結束，移除輸出目錄: {session_dir}")
+
 # 建立 MCP Server
-app_server = Server("quote-bot-word")
+app_server = QuoteServer("quote-bot-word")
 
 # 註冊工具處理程序
 @app_server.call_tool()
@@ -39,52 +464,9 @@ async def handle_tool_call(name: str, arguments: dict | None) -> list[types.Text
             logger.info(f"原始參數類型: {type(arguments)}")
             logger.info(f"原始參數內容: {json.dumps(arguments, ensure_ascii=False, indent=2)}")
             
-            # 初始化文件數據
-            file_data = None
-            
-            # 方法1：從文件路徑讀取
-            if "json_file_path" in arguments and arguments["json_file_path"]:
-                file_path = arguments["json_file_path"]
-                logger.info(f"嘗試從文件路徑讀取: {file_path}")
-                
-                if os.path.exists(file_path):
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            file_data = json.load(f)
-                        logger.info(f"成功從文件讀取數據: {file_path}")
-                    except Exception as e:
-                        logger.error(f"讀取文件失敗: {e}")
-                        return [types.TextContent(type="text", text=f"讀取JSON文件失敗: {str(e)}")]
-                else:
-                    logger.warning(f"文件不存在: {file_path}")
-            
-            # 方法2：從JSON內容讀取
-            elif "json_content" in arguments and arguments["json_content"]:
-                json_content = arguments["json_content"]
-                logger.info(f"嘗試解析JSON內容，長度: {len(json_content)} 字符")
-                
-                try:
-                    file_data = json.loads(json_content)
-                    logger.info(f"成功解析JSON內容")
-                except json.JSONDecodeError as e:
-                    logger.error(f"解析JSON內容失敗: {e}")
-                    return [types.TextContent(type="text", text=f"解析JSON內容失敗: {str(e)}")]
-            
-            # 方法3：如果沒有提供文件，使用備用數據
-            if file_data is None:
-                logger.info("未提供有效的JSON文件或內容，使用備用數據")
-                backup_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "input.json")
-                if os.path.exists(backup_path):
-                    try:
-                        with open(backup_path, 'r', encoding='utf-8') as f:
-                            file_data = json.load(f)
-                        logger.info(f"已從備用文件載入數據: {backup_path}")
-                    except Exception as e:
-                        logger.error(f"讀取備用文件失敗: {e}")
-                        return [types.TextContent(type="text", text=f"讀取備用數據失敗: {str(e)}")]
-                else:
-                    logger.error(f"無法找到備用數據文件: {backup_path}")
-                    return [types.TextContent(type="text", text="未提供JSON文件且無備用數據")]
+            file_data, file_errors, error = await load_request_data(arguments)
+            if error is not None:
+                return [types.TextContent(type="text", text=error)]
             
             # 驗證數據格式
             if not isinstance(file_data, dict):
@@ -100,6 +482,18 @@ async def handle_tool_call(name: str, arguments: dict | None) -> list[types.Text
                 logger.error("'quotes'必須是非空列表")
                 return [types.TextContent(type="text", text="'quotes'必須是非空列表")]
             
+            # 項目檔: 套用到沒有自行指定項目檔的報價單
+            if arguments.get("items_file_path"):
+                error = apply_items_file(file_data, arguments["items_file_path"])
+                if error is not None:
+                    return [types.TextContent(type="text", text=error)]
+            
+            # 多方案報價單依展開後的份數計算
+            rendered_count = count_rendered_quotes(file_data["quotes"])
+            if rendered_count > MAX_QUOTES_PER_JOB:
+                logger.error(f"報價單數量 {rendered_count} 超過單次上限 {MAX_QUOTES_PER_JOB}")
+                return [types.TextContent(type="text", text=f"單次請求最多 {MAX_QUOTES_PER_JOB} 份報價單，請分批送出")]
+            
             # 記錄報價單信息
             logger.info(f"JSON文件包含 {len(file_data['quotes'])} 個報價單:")
             for i, quote in enumerate(file_data["quotes"]):
@@ -108,46 +502,134 @@ async def handle_tool_call(name: str, arguments: dict | None) -> list[types.Text
                     logger.info(f"Quote {i+1}: {header.get('quoteNumber', 'N/A')} - {header.get('Title', 'N/A')}")
                     logger.info(f"Quote {i+1}: recipient={header.get('recipient', 'N/A')}")
                     logger.info(f"Quote {i+1}: details count={len(quote.get('details', []))}")
+                    if quote.get(ITEMS_FILE_FIELD):
+                        logger.info(f"Quote {i+1}: items file={quote[ITEMS_FILE_FIELD]}")
                 else:
                     logger.warning(f"Quote {i+1}: 格式不正確或缺少header字段")
             
-            # 確保 temp 目錄存在
-            ensure_temp_dir()
+            # 生成選項
+            pricing_mode = arguments.get("pricing_mode") or DEFAULT_PRICING_MODE
+            if pricing_mode not in PRICING_MODES:
+                return [types.TextContent(type="text", text=f"pricing_mode 必須是 {', '.join(PRICING_MODES)} 之一")]
+            options = {"pricing_mode": pricing_mode}
+            output_format = arguments.get("output_format") or DEFAULT_OUTPUT_FORMAT
+            if output_format not in OUTPUT_FORMATS:
+                return [types.TextContent(type="text", text=f"output_format 必須是 {', '.join(OUTPUT_FORMATS)} 之一")]
+            if output_format != DEFAULT_OUTPUT_FORMAT:
+                options["output_format"] = output_format
+            if arguments.get("track_memory"):
+                options["track_memory"] = True
+            if arguments.get("deterministic", DEFAULT_DETERMINISTIC):
+                options["deterministic"] = True
+            if arguments.get("combine"):
+                options["combine"] = True
+            if arguments.get("group_by_category"):
+                options["group_by_category"] = True
+            if arguments.get("fill_from_catalog"):
+                options["fill_from_catalog"] = True
             
-            # 直接將文件數據傳遞給 generate_docs 函數
-            doc_paths = generate_docs(file_data)
+            # 效能分析以 MCP 請求 id 命名結果檔
+            profile_id = None
+            if arguments.get("profile", PROFILE_ENABLED):
+                profile_id = make_profile_id(current_request_id())
             
-            # 確保生成的文檔存在
-            if not doc_paths or len(doc_paths) == 0:
-                logger.error("未能生成任何報價單文檔")
-                return [types.TextContent(type="text", text="未能生成任何報價單文檔")]
+            # 同一 session 中相同內容的並發請求共用同一次生成 (需分析的請求不與一般請求合併)
+            output_dir = session_output_dir()
+            key = fingerprint_arguments(file_data, {**options, "profile": True} if profile_id else options, output_dir)
+            result_content = await run_coalesced(key, lambda: render_quotes(file_data, output_dir, options, profile_id))
             
-            # 構建結果 - STDIO 模式下只返回本地文件路徑
-            result_content = []
-            for path in doc_paths:
-                filename = os.path.basename(path)
-                
-                # 確認文件確實存在
-                if not os.path.exists(path):
-                    logger.warning(f"生成的文件不存在: {path}")
-                    continue
-                
-                logger.info(f"已生成報價單: {filename}, 文件路徑: {path}")
-                # 在 STDIO 模式下，只提供本地文件路徑
-                result_content.append(types.TextContent(
-                    type="text", 
-                    text=f"已生成報價單文檔: {filename}\n文件路徑: {path}"
-                ))
-            
-            if not result_content:
-                return [types.TextContent(type="text", text="生成的報價單文件無法訪問")]
-            
-            logger.info(f"=== MCP 工具調用完成，生成了 {len(result_content)} 個文檔 ===")
+            # 附上讀取失敗的文件
+            if file_errors:
+                result_content = result_content + [types.TextContent(
+                    type="text",
+                    text=f"{len(file_errors)} 個文件讀取失敗，已略過:\n" + "\n".join(f"- {e['file']}: {e['error']}" for e in file_errors)
+                )]
             return result_content
             
         except Exception as e:
             logger.error(f"工具執行失敗: {str(e)}", exc_info=True)
             return [types.TextContent(type="text", text=f"文件生成失敗: {str(e)}")]
+    elif name == "validate_quotes":
+        arguments = arguments or {}
+        file_data, file_errors, error = await load_request_data(arguments, use_backup=False)
+        if error is not None:
+            return [types.TextContent(type="text", text=error)]
+        if arguments.get("items_file_path") and isinstance(file_data, dict) and isinstance(file_data.get("quotes"), list):
+            error = apply_items_file(file_data, arguments["items_file_path"])
+            if error is not None:
+                return [types.TextContent(type="text", text=error)]
+        try:
+            catalog = None
+            if arguments.get("fill_from_catalog"):
+                catalog = await asyncio.to_thread(get_catalog)
+                if catalog is None:
+                    return [types.TextContent(type="text", text=f"找不到價目表: {CATALOG_PATH}，請設定 QUOTE_CATALOG_PATH")]
+            result = await asyncio.to_thread(validate_input, file_data, MAX_QUOTES_PER_JOB, catalog)
+        except Exception as e:
+            logger.error(f"驗證報價單失敗: {str(e)}", exc_info=True)
+            return [types.TextContent(type="text", text=f"驗證報價單失敗: {str(e)}")]
+        logger.info(f"驗證 {result['quotes']} 份報價單: {len(result['errors'])} 個錯誤、{len(result['warnings'])} 個警告")
+        result_content = [
+            types.TextContent(type="text", text=summarize_validation(result)),
+            types.TextContent(type="text", text=json.dumps(result, ensure_ascii=False)),
+        ]
+        if file_errors:
+            result_content.append(types.TextContent(
+                type="text",
+                text=f"{len(file_errors)} 個文件讀取失敗，已略過:\n" + "\n".join(f"- {e['file']}: {e['error']}" for e in file_errors)
+            ))
+        return result_content
+    elif name == "lookup_catalog":
+        arguments = arguments or {}
+        query = str(arguments.get("query") or "").strip()
+        if not query:
+            return [types.TextContent(type="text", text="請提供 query")]
+        try:
+            catalog = await asyncio.to_thread(get_catalog)
+            if catalog is None:
+                return [types.TextContent(type="text", text=f"找不到價目表: {CATALOG_PATH}，請設定 QUOTE_CATALOG_PATH")]
+            result = catalog.lookup(query, arguments.get("limit") or DEFAULT_LOOKUP_LIMIT)
+        except Exception as e:
+            logger.error(f"查詢價目表失敗: {str(e)}", exc_info=True)
+            return [types.TextContent(type="text", text=f"查詢價目表失敗: {str(e)}")]
+        if not result["results"]:
+            return [types.TextContent(type="text", text=f"價目表中找不到「{query}」")]
+        lines = [f"價目表查詢「{query}」({result['match']})，共 {len(result['results'])} 筆:"]
+        for entry in result["results"]:
+            score = f" (相似度 {entry['score']})" if result["match"] == "fuzzy" else ""
+            category = f" [{entry['category']}]" if entry["category"] else ""
+            lines.append(f"- {entry['items']}{category}: 單價 {entry['unit']}{score}")
+        return [
+            types.TextContent(type="text", text="\n".join(lines)),
+            types.TextContent(type="text", text=json.dumps(result, ensure_ascii=False)),
+        ]
+    elif name == "get_server_stats":
+        return [types.TextContent(type="text", text=json.dumps(collect_server_stats(), ensure_ascii=False, indent=2))]
+    elif name in ("search_quotes", "get_quote"):
+        if quote_history is None:
+            return [types.TextContent(type="text", text="歷史紀錄未啟用 (QUOTE_HISTORY=0)")]
+        arguments = arguments or {}
+        try:
+            if name == "search_quotes":
+                records = await asyncio.to_thread(
+                    quote_history.search,
+                    quote_number=arguments.get("quote_number"),
+                    recipient=arguments.get("recipient"),
+                    date_from=arguments.get("date_from"),
+                    date_to=arguments.get("date_to"),
+                    limit=arguments.get("limit") or DEFAULT_SEARCH_LIMIT,
+                )
+                return [types.TextContent(type="text", text=format_history_records(records))]
+            
+            if arguments.get("id") is None and not arguments.get("quote_number"):
+                return [types.TextContent(type="text", text="請提供 id 或 quote_number")]
+            record = await asyncio.to_thread(quote_history.get, arguments.get("id"), arguments.get("quote_number"))
+            if record is None:
+                return [types.TextContent(type="text", text="找不到指定的歷史報價單")]
+            return format_history_record(record)
+        except Exception as e:
+            logger.error(f"查詢歷史紀錄失敗: {str(e)}", exc_info=True)
+            return [types.TextContent(type="text", text=f"查詢歷史紀錄失敗: {str(e)}")]
     else:
         return [types.TextContent(type="text", text=f"不支援的工具: {name}")]
 
@@ -164,15 +646,154 @@ async def list_tools():
                 "properties": {
                     "json_file_path": {
                         "type": "string",
-                        "description": "包含報價單數據的JSON文件路徑"
+                        "description": "包含報價單數據的JSON文件路徑；也可以是目錄或 glob 樣式 (如 data/*.json)，所有文件會合併為一批生成"
                     },
                     "json_content": {
                         "type": "string", 
                         "description": "JSON文件的内容（如果无法传递文件路径）"
+                    },
+                    "pricing_mode": {
+                        "type": "string",
+                        "enum": list(PRICING_MODES),
+                        "description": "價格核對模式：off 不檢查、flag 回報差異、correct 依單價×數量與 5% 稅金自動修正"
+                    },
+                    "track_memory": {
+                        "type": "boolean",
+                        "description": "是否回報每份報價單的記憶體用量"
+                    },
+                    "profile": {
+                        "type": "boolean",
+                        "description": "是否以 cProfile 分析本次生成，結果寫入 profiles/ 並回報熱點函數"
+                    },
+                    "deterministic": {
+                        "type": "boolean",
+                        "description": "是否輸出位元組可重現的文檔 (相同輸入與模板產生相同檔案)，並回報 SHA-256"
+                    },
+                    "combine": {
+                        "type": "boolean",
+                        "description": "是否將所有報價單合併為單一 Word 文檔 (每份報價單一節，從新頁開始)"
+                    },
+                    "items_file_path": {
+                        "type": "string",
+                        "description": "項目檔路徑 (CSV 或 XLSX，欄位 category, items, unit, quantity, amount)；JSON 只需提供 header，項目逐列串流寫入表格，未指定的合計欄位自動計算"
+                    },
+                    "group_by_category": {
+                        "type": "boolean",
+                        "description": "是否依 category 分組項目：同類別的類別欄合併為一格，每個類別之後加上類別小計行"
+                    },
+                    "fill_from_catalog": {
+                        "type": "boolean",
+                        "description": "是否以本機價目表補上項目缺少的單價與金額 (依項目名稱精確、前綴或高相似度比對)"
+                    },
+                    "output_format": {
+                        "type": "string",
+                        "enum": list(OUTPUT_FORMATS),
+                        "description": "輸出格式：docx (預設) 或 flat_xml (單一 XML 檔 .xml，不做 ZIP 壓縮，Word 與 LibreOffice 可直接開啟，適合只需解析或封存的下游系統)"
                     }
                 },
                 "required": []  # 两个参数至少需要一个
             }
+        ),
+        types.Tool(
+            name="validate_quotes",
+            description="只驗證報價單數據而不生成文檔：一次回報整批報價單的所有錯誤 (含報價單索引與欄位路徑)",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "json_file_path": {
+                        "type": "string",
+                        "description": "包含報價單數據的JSON文件路徑；也可以是目錄或 glob 樣式"
+                    },
+                    "json_content": {
+                        "type": "string",
+                        "description": "JSON文件的内容"
+                    },
+                    "items_file_path": {
+                        "type": "string",
+                        "description": "項目檔路徑 (CSV 或 XLSX)，與 generate_quote_docs 相同"
+                    },
+                    "fill_from_catalog": {
+                        "type": "boolean",
+                        "description": "是否先以本機價目表補上缺少的單價與金額再驗證，與 generate_quote_docs 相同"
+                    }
+                },
+                "required": []
+            }
+        ),
+        types.Tool(
+            name="lookup_catalog",
+            description="查詢本機價目表：依項目名稱精確、前綴或模糊比對，返回單價與類別",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "項目名稱或名稱開頭"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": f"最多返回筆數，預設 {DEFAULT_LOOKUP_LIMIT}"
+                    }
+                },
+                "required": ["query"]
+            }
+        ),
+        types.Tool(
+            name="get_server_stats",
+            description="查看報價單生成服務的佇列狀態與統計資訊",
+            inputSchema={
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
+        ),
+        types.Tool(
+            name="search_quotes",
+            description="搜尋已生成的歷史報價單",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "quote_number": {
+                        "type": "string",
+                        "description": "報價單號前綴，如 Q-2024"
+                    },
+                    "recipient": {
+                        "type": "string",
+                        "description": "收件人 (部分符合)"
+                    },
+                    "date_from": {
+                        "type": "string",
+                        "description": "報價日期起 (YYYY/MM/DD)"
+                    },
+                    "date_to": {
+                        "type": "string",
+                        "description": "報價日期迄 (YYYY/MM/DD)"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": f"最多返回筆數，預設 {DEFAULT_SEARCH_LIMIT}"
+                    }
+                },
+                "required": []
+            }
+        ),
+        types.Tool(
+            name="get_quote",
+            description="取得歷史報價單的文件路徑與原始數據，不需重新生成",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "id": {
+                        "type": "integer",
+                        "description": "歷史紀錄 id (由 generate_quote_docs 或 search_quotes 取得)"
+                    },
+                    "quote_number": {
+                        "type": "string",
+                        "description": "報價單號，返回該單號最新的一筆"
+                    }
+                },
+                "required": []
+            }
         )
     ]
 
@@ -0,0 +1,152 @@
+import os
+import gc
+import time
+import threading
+import tracemalloc
+
+# psutil 為選用依賴，未安裝時改讀 /proc/self/statm
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 記憶體追蹤與上限設定，可透過環境變數調整
+DEFAULT_TRACKING = os.environ.get("QUOTE_MEMORY_TRACKING", "0").lower() in ("1", "true", "yes")
+DEFAULT_LIMIT_MB = float(os.environ.get("QUOTE_MEMORY_LIMIT_MB", "0"))
+
+# 單份報價單的粗估成本 (依實測 RSS 增量：模板約 3 MB，每個項目約 12 KB)
+ESTIMATE_BASE_BYTES = 4 * 1024 * 1024
+ESTIMATE_PER_ITEM_BYTES = 12 * 1024
+
+# 使用中的追蹤數；由本模組啟動的 tracemalloc 在最後一個追蹤結束時停止，
+# 避免一次追蹤後整個程序都承擔追蹤成本 (程序外部啟動的追蹤不會被停止)
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_started_tracing = False
+
+class MemoryBudgetExceeded(Exception):
+    """預估記憶體用量超過上限"""
+
+def current_rss():
+    """
+    取得目前程序的常駐記憶體 (bytes)
+
+    無法取得時返回 None
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def estimate_quote_bytes(quote):
+    """依項目數粗估單份報價單生成所需的記憶體"""
+    details = quote.get("details") if isinstance(quote, dict) else None
+    count = len(details) if isinstance(details, list) else 0
+    return ESTIMATE_BASE_BYTES + ESTIMATE_PER_ITEM_BYTES * count
+
+class MemoryBudget:
+    """
+    每份報價單的記憶體追蹤與上限檢查
+
+    參數:
+    tracking -- 是否以 tracemalloc 與 RSS 記錄每份報價單的用量
+    limit_mb -- 記憶體上限 (MB)，0 表示不限制
+    """
+
+    def __init__(self, tracking=DEFAULT_TRACKING, limit_mb=DEFAULT_LIMIT_MB):
+        self.tracking = tracking
+        self.limit_bytes = int(limit_mb * 1024 * 1024) if limit_mb else 0
+        self.records = []
+        self._observed_peak = 0
+        self._tracing = False
+
+    @property
+    def active(self):
+        """是否啟用追蹤或上限"""
+        return self.tracking or self.limit_bytes > 0
+
+    def check(self, quote, label=""):
+        """
+        生成前檢查預估用量，超過上限時立即拋出 MemoryBudgetExceeded
+
+        預估值取項目數粗估與本批已觀測到的單份峰值中較大者
+        """
+        if not self.limit_bytes:
+            return
+        rss = current_rss()
+        if rss is None:
+            return
+        estimate = max(estimate_quote_bytes(quote), self._observed_peak)
+        if rss + estimate > self.limit_bytes:
+            raise MemoryBudgetExceeded(
+                f"{label} 預估需要 {estimate / 1048576:.1f} MB，"
+                f"目前已使用 {rss / 1048576:.1f} MB，超過上限 {self.limit_bytes / 1048576:.0f} MB"
+            )
+
+    def check_batch(self, quotes):
+        """批次開始前以最大的報價單檢查一次，避免做到一半才失敗"""
+        if not self.limit_bytes or not quotes:
+            return
+        largest = max(range(len(quotes)), key=lambda i: estimate_quote_bytes(quotes[i]))
+        self.check(quotes[largest], f"quote[{largest}]")
+
+    def begin(self, index, quote_number):
+        """
+        開始記錄單份報價單的記憶體峰值與耗時
+
+        未啟用追蹤時返回 None；tracemalloc 為全程序共用，
+        多個工作並發時峰值為近似值
+
+        返回:
+        傳給 end() 的記錄起點
+        """
+        if not self.tracking:
+            return None
+        if not self._tracing:
+            global _tracing_users, _started_tracing
+            with _tracing_lock:
+                _tracing_users += 1
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _started_tracing = True
+            self._tracing = True
+        tracemalloc.reset_peak()
+        return (index, quote_number, current_rss(), time.perf_counter())
+
+    def end(self, token):
+        """結束記錄並將結果加入 records"""
+        if token is None:
+            return
+        index, quote_number, rss_before, start = token
+        _, peak = tracemalloc.get_traced_memory()
+        rss_after = current_rss()
+        rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        self._observed_peak = max(self._observed_peak, peak, rss_delta or 0)
+        self.records.append({
+            "index": index,
+            "quoteNumber": quote_number,
+            "python_peak_kb": peak // 1024,
+            "rss_mb": round(rss_after / 1048576, 1) if rss_after is not None else None,
+            "rss_delta_kb": rss_delta // 1024 if rss_delta is not None else None,
+            "seconds": round(time.perf_counter() - start, 3),
+        })
+
+    def finish(self):
+        """批次結束時呼叫，停止本模組為追蹤而啟動的 tracemalloc (其他批次仍在追蹤時保留)"""
+        if not self._tracing:
+            return
+        global _tracing_users, _started_tracing
+        with _tracing_lock:
+            _tracing_users -= 1
+            if _tracing_users == 0 and _started_tracing:
+                tracemalloc.stop()
+                _started_tracing = False
+        self._tracing = False
+
+    def release(self):
+        """報價單之間回收 Document 物件留下的循環參照"""
+        if self.active:
+            gc.collect()
@@ -0,0 +1,418 @@
+import os
+import io
+import sys
+import copy
+import json
+import time
+import zipfile
+import argparse
+import posixpath
+import tempfile
+import statistics
+from lxml import etree
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+CT_NS = "http://schemas.openxmlformats.org/package/2006/content-types"
+OFFICE_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/"
+CONTENT_TYPES_PART = "[Content_Types].xml"
+DOCUMENT_PART = "word/document.xml"
+
+# 不影響版面的部件 (關聯類型): 自訂 XML、網頁設定與文件屬性
+REMOVABLE_RELTYPES = {
+    OFFICE_REL + "customXml": "custom XML",
+    OFFICE_REL + "webSettings": "webSettings",
+}
+METADATA_RELTYPES = {
+    OFFICE_REL + "extended-properties": "docProps/app",
+    "http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties": "docProps/core",
+}
+
+# 引用樣式、編號與字型的內容部件
+CONTENT_PART_PREFIXES = ("word/document", "word/footnotes", "word/endnotes", "word/header", "word/footer", "word/comments")
+STYLE_REFERENCES = ("pStyle", "rStyle", "tblStyle", "numStyleLink", "styleLink")
+FONT_ATTRIBUTES = ("ascii", "hAnsi", "eastAsia", "cs")
+
+# 範例報價單的項目數
+SAMPLE_ITEMS = 12
+
+def w(tag):
+    return f"{{{W_NS}}}{tag}"
+
+def _parse(data):
+    return etree.fromstring(data)
+
+def _serialize(root):
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+def _rels_part_for(name):
+    """部件的關聯檔路徑，例如 word/document.xml -> word/_rels/document.xml.rels"""
+    directory, filename = posixpath.split(name)
+    return posixpath.join(directory, "_rels", f"{filename}.rels")
+
+def _source_of_rels(rels_name):
+    """關聯檔所屬的部件路徑 (套件關聯返回空字串)"""
+    directory, filename = posixpath.split(rels_name)
+    return posixpath.join(posixpath.dirname(directory), filename[:-len(".rels")])
+
+def _resolve_target(source, target):
+    """將關聯的相對目標轉為套件內路徑"""
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source), target))
+
+def _content_parts(parts):
+    return [name for name in parts if name.startswith(CONTENT_PART_PREFIXES) and name.endswith(".xml")]
+
+class TemplatePackage:
+    """
+    以部件為單位修改 docx 模板
+
+    參數:
+    data -- docx 檔案內容
+    """
+
+    def __init__(self, data):
+        with zipfile.ZipFile(io.BytesIO(data)) as source:
+            self.order = source.namelist()
+            self.parts = {name: source.read(name) for name in self.order}
+
+    def to_bytes(self):
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as target:
+            for name in self.order:
+                if name in self.parts:
+                    target.writestr(name, self.parts[name])
+        return output.getvalue()
+
+    def relationships(self):
+        """返回 (關聯檔, 關聯類型, 目標部件) 列表 (不含外部連結)"""
+        found = []
+        for rels_name in [name for name in self.parts if name.endswith(".rels")]:
+            root = _parse(self.parts[rels_name])
+            for rel in root.findall(f"{{{REL_NS}}}Relationship"):
+                if rel.get("TargetMode") == "External":
+                    continue
+                found.append((rels_name, rel.get("Type"), _resolve_target(_source_of_rels(rels_name), rel.get("Target"))))
+        return found
+
+    def drop_part(self, name):
+        """
+        移除部件、指向它的關聯與內容類型宣告，並一併移除只由它引用的部件
+
+        返回:
+        int -- 移除的位元組數
+        """
+        if name not in self.parts:
+            return 0
+        removed = len(self.parts.pop(name))
+        rels_name = _rels_part_for(name)
+        children = []
+        if rels_name in self.parts:
+            root = _parse(self.parts[rels_name])
+            children = [_resolve_target(name, rel.get("Target")) for rel in root if rel.get("TargetMode") != "External"]
+            removed += len(self.parts.pop(rels_name))
+
+        # 移除其他關聯檔中指向此部件的關聯
+        for other in [part for part in self.parts if part.endswith(".rels")]:
+            root = _parse(self.parts[other])
+            source = _source_of_rels(other)
+            stale = [rel for rel in root if _resolve_target(source, rel.get("Target")) == name]
+            if stale:
+                for rel in stale:
+                    root.remove(rel)
+                before = len(self.parts[other])
+                self.parts[other] = _serialize(root)
+                removed += before - len(self.parts[other])
+
+        types = _parse(self.parts[CONTENT_TYPES_PART])
+        for override in types.findall(f"{{{CT_NS}}}Override"):
+            if override.get("PartName") == "/" + name:
+                types.remove(override)
+        before = len(self.parts[CONTENT_TYPES_PART])
+        self.parts[CONTENT_TYPES_PART] = _serialize(types)
+        removed += before - len(self.parts[CONTENT_TYPES_PART])
+
+        # 子部件若已沒有其他引用一併移除 (例如 customXml 的 itemProps)
+        referenced = {target for _, _, target in self.relationships()}
+        for child in children:
+            if child not in referenced:
+                removed += self.drop_part(child)
+        return removed
+
+    def drop_relationship_targets(self, reltypes):
+        """移除指定關聯類型指向的部件，返回移除的位元組數"""
+        removed = 0
+        for _, reltype, target in self.relationships():
+            if reltype in reltypes:
+                removed += self.drop_part(target)
+        return removed
+
+    def edit_xml(self, name, edit):
+        """以 edit(root) 修改 XML 部件，返回減少的位元組數"""
+        if name not in self.parts:
+            return 0
+        root = _parse(self.parts[name])
+        edit(root)
+        before = len(self.parts[name])
+        self.parts[name] = _serialize(root)
+        return before - len(self.parts[name])
+
+def strip_revision_marks(root):
+    """移除 rsid 修訂識別碼與拼字檢查標記，兩者都只供 Word 編輯時使用"""
+    for element in root.iter():
+        for attr in [key for key in element.attrib if key.startswith(f"{{{W_NS}}}rsid")]:
+            del element.attrib[attr]
+    for element in list(root.iter(w("rsid"), w("rsids"), w("proofErr"))):
+        element.getparent().remove(element)
+
+def used_style_ids(package):
+    """內容部件與編號定義引用的樣式 id"""
+    used = set()
+    for name in _content_parts(package.parts) + ["word/numbering.xml"]:
+        if name not in package.parts:
+            continue
+        root = _parse(package.parts[name])
+        for tag in STYLE_REFERENCES:
+            used.update(element.get(w("val")) for element in root.iter(w(tag)))
+    return used
+
+def strip_unused_styles(root, used):
+    """
+    移除未使用的樣式與 latentStyles
+
+    保留被引用的樣式、各類型的預設樣式與它們的 basedOn 鏈；
+    保留的樣式中指向已移除樣式的 next / link 一併移除
+    """
+    latent = root.find(w("latentStyles"))
+    if latent is not None:
+        root.remove(latent)
+
+    styles = {style.get(w("styleId")): style for style in root.findall(w("style"))}
+    keep = set()
+    pending = [style_id for style_id, style in styles.items() if style.get(w("default")) in ("1", "true")]
+    pending += [style_id for style_id in used if style_id in styles]
+    while pending:
+        style_id = pending.pop()
+        if style_id in keep:
+            continue
+        keep.add(style_id)
+        for tag in ("basedOn",) + STYLE_REFERENCES:
+            for element in styles[style_id].iter(w(tag)):
+                if element.get(w("val")) in styles:
+                    pending.append(element.get(w("val")))
+
+    for style_id, style in styles.items():
+        if style_id not in keep:
+            root.remove(style)
+            continue
+        for tag in ("next", "link"):
+            element = style.find(w(tag))
+            if element is not None and element.get(w("val")) not in keep:
+                style.remove(element)
+
+def strip_unused_numbering(package):
+    """移除未被引用的編號定義 (w:num 及只由它們使用的 w:abstractNum)"""
+    used = set()
+    for name in _content_parts(package.parts) + ["word/styles.xml"]:
+        if name in package.parts:
+            root = _parse(package.parts[name])
+            used.update(element.get(w("val")) for element in root.iter(w("numId")))
+
+    def edit(root):
+        abstract_ids = set()
+        for num in root.findall(w("num")):
+            if num.get(w("numId")) in used:
+                abstract_ids.add(num.find(w("abstractNumId")).get(w("val")))
+            else:
+                root.remove(num)
+        for abstract in root.findall(w("abstractNum")):
+            if abstract.get(w("abstractNumId")) not in abstract_ids:
+                root.remove(abstract)
+    return package.edit_xml("word/numbering.xml", edit)
+
+def used_font_names(package):
+    """內容、樣式、編號與佈景主題引用的字型名稱"""
+    names = set()
+    for name in _content_parts(package.parts) + ["word/styles.xml", "word/numbering.xml"]:
+        if name not in package.parts:
+            continue
+        root = _parse(package.parts[name])
+        for fonts in root.iter(w("rFonts")):
+            names.update(fonts.get(w(attr)) for attr in FONT_ATTRIBUTES)
+    for name in package.parts:
+        if name.startswith("word/theme/"):
+            root = _parse(package.parts[name])
+            names.update(element.get("typeface") for element in root.iter() if element.get("typeface"))
+    names.discard(None)
+    return names
+
+def strip_unused_fonts(package):
+    """移除字型表中未被引用的字型宣告 (內嵌字型的字型保留)"""
+    used = used_font_names(package)
+
+    def edit(root):
+        for font in root.findall(w("font")):
+            embedded = any(child.tag.startswith(w("embed")) for child in font)
+            if font.get(w("name")) not in used and not embedded:
+                root.remove(font)
+    return package.edit_xml("word/fontTable.xml", edit)
+
+def optimize_template(data, keep_metadata=False):
+    """
+    精簡模板: 移除未使用的樣式、latentStyles、未使用的編號與字型、修訂識別碼、
+    自訂 XML、網頁設定與文件屬性，保留所有影響版面的內容
+
+    參數:
+    data -- 原始 docx 內容
+    keep_metadata -- 是否保留 docProps 文件屬性
+
+    返回:
+    tuple -- (精簡後的 docx 內容, 各步驟減少的位元組數字典 (未壓縮))
+    """
+    package = TemplatePackage(data)
+    savings = {}
+    savings["custom XML / webSettings"] = package.drop_relationship_targets(REMOVABLE_RELTYPES)
+    if not keep_metadata:
+        savings["docProps"] = package.drop_relationship_targets(METADATA_RELTYPES)
+
+    removed = 0
+    for name in [name for name in package.parts if name.startswith("word/") and name.endswith(".xml")]:
+        removed += package.edit_xml(name, strip_revision_marks)
+    savings["rsid / proofErr"] = removed
+
+    used = used_style_ids(package)
+    savings["styles / latentStyles"] = package.edit_xml("word/styles.xml", lambda root: strip_unused_styles(root, used))
+    savings["numbering"] = strip_unused_numbering(package)
+    savings["fontTable"] = strip_unused_fonts(package)
+    return package.to_bytes(), savings
+
+def sample_quotes(count):
+    """建立效能比較用的範例報價單"""
+    quotes = []
+    for n in range(count):
+        details = [
+            {"category": f"類別{i % 3}", "items": f"項目 {i + 1}", "unit": 1000 * (i + 1), "quantity": 1 + i % 2, "amount": 1000 * (i + 1) * (1 + i % 2)}
+            for i in range(SAMPLE_ITEMS)
+        ]
+        subtotal = sum(item["amount"] for item in details)
+        quotes.append({
+            "header": {
+                "quoteNumber": f"Q-SLIM-{n + 1:04d}", "Title": "模板精簡測試", "recipient": "測試客戶",
+                "date": "2024/01/01", "start_date": "2024/01/01", "end_date": "2024/02/01",
+            },
+            "details": details,
+            "total_without_tax": subtotal,
+            "tax_rate": round(subtotal * 0.05),
+            "total_with_tax": subtotal + round(subtotal * 0.05),
+        })
+    return {"quotes": quotes}
+
+def _normalized_document(path):
+    """輸出文檔的 document.xml (移除 rsid 與拼字標記後) 供比較"""
+    with zipfile.ZipFile(path) as source:
+        root = _parse(source.read(DOCUMENT_PART))
+    strip_revision_marks(root)
+    return etree.tostring(root)
+
+def benchmark(template_paths, data, rounds, output_root):
+    """
+    以各模板生成範例報價單，每輪輪流使用各模板以避免先後順序影響計時
+
+    參數:
+    template_paths -- 要比較的模板路徑列表
+    data -- 範例報價單數據
+    rounds -- 計時的生成輪數
+    output_root -- 輸出目錄，各模板寫入其下的子目錄 (由呼叫端負責刪除)
+
+    返回:
+    list -- 各模板的每份報價單平均位元組數、最佳一輪的每份毫秒數與輸出路徑
+    """
+    from generate_quote_docs import QuoteRenderer
+
+    renderers = [
+        QuoteRenderer(template_path=path, output_dir=os.path.join(output_root, str(n)), log=lambda message: None)
+        for n, path in enumerate(template_paths)
+    ]
+    # 第一輪包含編譯渲染計畫與載入模板，不列入計時
+    results = [{"paths": renderer.render(copy.deepcopy(data)), "timings": []} for renderer in renderers]
+    for _ in range(rounds):
+        for renderer, result in zip(renderers, results):
+            start = time.perf_counter()
+            result["paths"] = renderer.render(copy.deepcopy(data))
+            result["timings"].append((time.perf_counter() - start) / len(result["paths"]))
+    return [
+        {
+            "bytes": statistics.mean(os.path.getsize(path) for path in result["paths"]),
+            "ms": min(result["timings"]) * 1000,
+            "paths": result["paths"],
+        }
+        for result in results
+    ]
+
+def _change(before, after):
+    """以百分比表示變化，例如 -36.8%"""
+    return f"{(after - before) / before * 100:+.1f}%" if before else "-"
+
+def main():
+    """精簡報價單模板並比較生成的文檔大小與耗時"""
+    default_template = os.path.join(os.path.dirname(os.path.abspath(__file__)), "報價單.docx")
+    parser = argparse.ArgumentParser(description="精簡報價單模板，移除不影響版面的樣式、編號與中繼資料")
+    parser.add_argument("template", nargs="?", default=default_template, help="模板檔案路徑")
+    parser.add_argument("--output", help="精簡後的模板路徑 (預設為 <模板>.slim.docx)")
+    parser.add_argument("--keep-metadata", action="store_true", help="保留 docProps 文件屬性")
+    parser.add_argument("--quotes", type=int, default=20, help="比較用的範例報價單數 (0 為不比較)")
+    parser.add_argument("--rounds", type=int, default=3, help="比較的生成輪數 (取最佳一輪)")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出結果")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.template):
+        print(f"找不到模板檔案: {args.template}")
+        sys.exit(1)
+    output = args.output or os.path.splitext(args.template)[0] + ".slim.docx"
+
+    with open(args.template, "rb") as f:
+        original = f.read()
+    slim, savings = optimize_template(original, keep_metadata=args.keep_metadata)
+    with open(output, "wb") as f:
+        f.write(slim)
+
+    result = {
+        "template": args.template,
+        "output": output,
+        "template_bytes": len(original),
+        "slim_bytes": len(slim),
+        "uncompressed_savings": savings,
+    }
+    if args.quotes > 0:
+        data = sample_quotes(args.quotes)
+        # 比較用的輸出只在比較期間保留
+        with tempfile.TemporaryDirectory(prefix="quote_slim_") as output_root:
+            before, after = benchmark([args.template, output], data, args.rounds, output_root)
+            identical = all(_normalized_document(a) == _normalized_document(b) for a, b in zip(before["paths"], after["paths"]))
+        result["per_quote"] = {
+            "bytes_before": round(before["bytes"]),
+            "bytes_after": round(after["bytes"]),
+            "ms_before": round(before["ms"], 2),
+            "ms_after": round(after["ms"], 2),
+            "document_identical": identical,
+        }
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+
+    print(f"已寫入精簡模板: {output}")
+    print(f"模板大小: {len(original):,} → {len(slim):,} bytes ({_change(len(original), len(slim))})")
+    print("各步驟移除的內容 (未壓縮):")
+    for step, removed in savings.items():
+        print(f"- {step}: {removed:,} bytes")
+    if "per_quote" in result:
+        stats = result["per_quote"]
+        print(f"每份報價單 ({args.quotes} 份，{args.rounds} 輪取最佳):")
+        print(f"- 文檔大小: {stats['bytes_before']:,} → {stats['bytes_after']:,} bytes ({_change(stats['bytes_before'], stats['bytes_after'])})")
+        print(f"- 生成耗時: {stats['ms_before']} → {stats['ms_after']} ms ({_change(stats['ms_before'], stats['ms_after'])})")
+        print("- 內文與原模板的輸出" + ("相同 (忽略 rsid 與拼字標記)" if stats["document_identical"] else "不同，請檢查精簡後的模板"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+import os
+import csv
+import bisect
+import difflib
+import heapq
+import logging
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from quote_pricing import compute_totals, round_half_up, to_number
+from quote_variants import TOTAL_FIELDS
+from line_items import has_items_file
+
+# 價目表位置，可透過環境變數調整 (CSV 或 SQLite)
+CATALOG_PATH = os.environ.get("QUOTE_CATALOG_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.csv")
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+SQLITE_TABLE = "catalog"
+
+# 價目表在伺服器處理請求時載入，訊息走 logging 以免寫入 STDIO 伺服器的 stdout
+logger = logging.getLogger("price-catalog")
+
+DEFAULT_LOOKUP_LIMIT = 5
+# 模糊比對的最低相似度；自動填入時要求更高的相似度，避免填入錯誤的單價
+FUZZY_CUTOFF = 0.6
+AUTOFILL_CUTOFF = 0.85
+# 模糊比對時以二字組相似度 (Dice 係數) 挑出的候選數
+FUZZY_CANDIDATES = 50
+# 模糊比對時最多展開的倒排列表項目總數，常見字組的列表超出此上限時略過
+FUZZY_SCAN_LIMIT = int(os.environ.get("QUOTE_CATALOG_FUZZY_SCAN", "5000"))
+
+# 標題列可使用的中文欄名
+COLUMN_ALIASES = {
+    "項目": "items",
+    "名稱": "items",
+    "單價": "unit",
+    "價格": "unit",
+    "類別": "category",
+}
+
+def normalize_name(name):
+    """正規化項目名稱: 全形轉半形、不分大小寫、合併空白"""
+    return " ".join(unicodedata.normalize("NFKC", str(name)).casefold().split())
+
+def _bigrams(text):
+    """字元二字組 (中文項目名稱短，二字組比三字組更能區分)"""
+    if len(text) < 2:
+        return {text}
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+def _read_csv_rows(path):
+    """讀取 CSV 價目表，返回欄位字典列表"""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None) or []
+        fields = [COLUMN_ALIASES.get(name.strip(), name.strip().lower()) for name in header]
+        return [dict(zip(fields, row)) for row in reader]
+
+def _read_sqlite_rows(path):
+    """讀取 SQLite 價目表的 catalog 資料表"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute(f"SELECT * FROM {SQLITE_TABLE}").fetchall()
+    finally:
+        conn.close()
+    return [{COLUMN_ALIASES.get(key, key.lower()): row[key] for key in row.keys()} for row in rows]
+
+class PriceCatalog:
+    """
+    記憶體內的價目表索引
+
+    以正規化名稱建立字典 (精確查詢) 與排序後的名稱列表 (以 bisect 做前綴查詢)，
+    兩者都不需走訪整個價目表；模糊查詢先以二字組倒排索引挑出候選 (展開的列表長度有上限)，再以 difflib 排序
+
+    參數:
+    entries -- 價目項目列表，每項至少包含 items 與 unit，可另含 category
+    source -- 價目表來源路徑 (僅供顯示)
+    """
+
+    def __init__(self, entries, source=None):
+        self.source = source
+        self._entries = {}
+        for entry in entries:
+            name = str(entry.get("items") or "").strip()
+            unit = to_number(entry.get("unit"))
+            if not name or unit is None:
+                continue
+            # 同名項目以後出現的為準
+            self._entries[normalize_name(name)] = {
+                "items": name,
+                "unit": int(unit) if unit.is_integer() else unit,
+                "category": str(entry.get("category") or "").strip(),
+            }
+        self._keys = sorted(self._entries)
+        self._bigram_index = None
+        self._index_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @classmethod
+    def load(cls, path):
+        """從 CSV 或 SQLite 檔案載入價目表"""
+        if path.lower().endswith(SQLITE_EXTENSIONS):
+            rows = _read_sqlite_rows(path)
+        else:
+            rows = _read_csv_rows(path)
+        return cls(rows, source=path)
+
+    def exact(self, name):
+        """精確查詢 (正規化後相同)，找不到時返回 None"""
+        return self._entries.get(normalize_name(name))
+
+    def prefix(self, prefix, limit=DEFAULT_LOOKUP_LIMIT):
+        """返回名稱以 prefix 開頭的項目 (依名稱排序)"""
+        key = normalize_name(prefix)
+        if not key:
+            return []
+        start = bisect.bisect_left(self._keys, key)
+        results = []
+        for name in self._keys[start:start + limit]:
+            if not name.startswith(key):
+                break
+            results.append(self._entries[name])
+        return results
+
+    def _get_bigram_index(self):
+        """第一次模糊查詢時才建立二字組倒排索引"""
+        if self._bigram_index is None:
+            with self._index_lock:
+                if self._bigram_index is None:
+                    index = {}
+                    for name in self._keys:
+                        for gram in _bigrams(name):
+                            index.setdefault(gram, []).append(name)
+                    self._bigram_index = index
+        return self._bigram_index
+
+    @staticmethod
+    def _dice(grams, candidate):
+        """查詢二字組與候選名稱的 Dice 係數"""
+        candidate_grams = _bigrams(candidate)
+        return 2 * len(grams & candidate_grams) / (len(grams) + len(candidate_grams))
+
+    def fuzzy(self, name, limit=DEFAULT_LOOKUP_LIMIT, cutoff=FUZZY_CUTOFF):
+        """
+        模糊查詢
+
+        返回:
+        list -- (項目, 相似度) 列表，依相似度由高到低
+        """
+        key = normalize_name(name)
+        if not key:
+            return []
+        index = self._get_bigram_index()
+        grams = _bigrams(key)
+        # 由少見的二字組開始收集候選，常見字組的倒排列表可達價目表的一成以上，
+        # 全部展開等於走訪整個價目表；至少展開一個非空的列表，確保仍有候選
+        counts = Counter()
+        scanned = 0
+        for names in sorted((index.get(gram, ()) for gram in grams), key=len):
+            if scanned and scanned + len(names) > FUZZY_SCAN_LIMIT:
+                break
+            counts.update(names)
+            scanned += len(names)
+        # 以部分計數挑出較多候選，再依完整的共同二字組數重新計算 Dice 係數；
+        # 只依共同二字組數量排序會偏向含有常見字組的長名稱，因此以長度正規化
+        shortlist = heapq.nlargest(FUZZY_CANDIDATES * 4, counts, key=counts.__getitem__)
+        candidates = heapq.nlargest(
+            FUZZY_CANDIDATES, shortlist,
+            key=lambda candidate: self._dice(grams, candidate)
+        )
+        matcher = difflib.SequenceMatcher(b=key)
+        scored = []
+        for candidate in candidates:
+            matcher.set_seq1(candidate)
+            score = matcher.ratio()
+            if score >= cutoff:
+                scored.append((score, candidate))
+        scored.sort(key=lambda pair: (-pair[0], pair[1]))
+        return [(self._entries[candidate], round(score, 3)) for score, candidate in scored[:limit]]
+
+    def lookup(self, name, limit=DEFAULT_LOOKUP_LIMIT):
+        """
+        依序以精確、前綴、模糊方式查詢，返回第一種有結果的方式
+
+        返回:
+        dict -- match ('exact'、'prefix'、'fuzzy' 或 None) 與 results (含 score 的項目列表)
+        """
+        entry = self.exact(name)
+        if entry is not None:
+            return {"match": "exact", "results": [{**entry, "score": 1.0}]}
+        entries = self.prefix(name, limit)
+        if entries:
+            return {"match": "prefix", "results": [{**entry, "score": None} for entry in entries]}
+        matches = self.fuzzy(name, limit)
+        if matches:
+            return {"match": "fuzzy", "results": [{**entry, "score": score} for entry, score in matches]}
+        return {"match": None, "results": []}
+
+    def resolve(self, name):
+        """
+        自動填入用的查詢: 精確相符、唯一的前綴相符或高相似度的模糊相符
+
+        返回:
+        tuple -- (項目, 比對方式)，找不到可靠的結果時為 (None, None)
+        """
+        entry = self.exact(name)
+        if entry is not None:
+            return entry, "exact"
+        entries = self.prefix(name, 2)
+        if len(entries) == 1:
+            return entries[0], "prefix"
+        matches = self.fuzzy(name, 1, AUTOFILL_CUTOFF)
+        if matches:
+            return matches[0][0], "fuzzy"
+        return None, None
+
+# 已載入的價目表 (路徑 -> (mtime, size, catalog))
+_catalog_cache = {}
+_catalog_lock = threading.Lock()
+
+def get_catalog(path=None):
+    """
+    取得價目表，同一檔案只載入一次，檔案變更後重新載入
+
+    返回:
+    PriceCatalog -- 價目表，檔案不存在時返回 None
+    """
+    path = path or CATALOG_PATH
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    with _catalog_lock:
+        cached = _catalog_cache.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        catalog = PriceCatalog.load(path)
+        _catalog_cache[path] = (stat.st_mtime_ns, stat.st_size, catalog)
+        logger.info(f"已載入價目表 {path}: {len(catalog)} 項")
+        return catalog
+
+def _is_missing(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+def _fill_items(items, path, catalog, record_base, filled, missing):
+    """
+    補上單一項目列表中缺少的單價與金額
+
+    參數:
+    items -- 項目列表 (直接修改)
+    path -- 項目列表在報價單中的路徑，例如 details 或 variants[0].extra_details
+    catalog -- PriceCatalog 物件
+    record_base -- 每筆記錄共用的 index 與 quoteNumber
+    filled -- 已填入記錄的列表 (直接附加)
+    missing -- 找不到記錄的列表 (直接附加)
+
+    返回:
+    bool -- 是否補上任何項目
+    """
+    changed = False
+    for n, item in enumerate(items):
+        if not isinstance(item, dict) or not (_is_missing(item.get("unit")) or _is_missing(item.get("amount"))):
+            continue
+        record = {**record_base, "path": f"{path}[{n}]", "items": item.get("items", "")}
+        unit = to_number(item.get("unit"))
+        match = None
+        if unit is None:
+            entry, match = catalog.resolve(item.get("items", "")) if item.get("items") else (None, None)
+            if entry is None:
+                missing.append(record)
+                continue
+            unit = entry["unit"]
+            item["unit"] = unit
+            record["catalog_items"] = entry["items"]
+            if _is_missing(item.get("category")) and entry["category"]:
+                item["category"] = entry["category"]
+        if _is_missing(item.get("quantity")):
+            item["quantity"] = 1
+        if _is_missing(item.get("amount")):
+            item["amount"] = round_half_up(unit * (to_number(item["quantity"]) or 0))
+        record.update({"match": match, "unit": item["unit"], "amount": item["amount"]})
+        filled.append(record)
+        changed = True
+    return changed
+
+def fill_missing_prices(quotes, catalog):
+    """
+    以價目表補上項目缺少的單價與金額
+
+    只處理缺少 unit 或 amount 的項目，已提供的值不會被覆寫；補上任何項目且報價單
+    沒有指定合計欄位時依項目重新計算合計；由項目檔提供項目的報價單不處理。
+    在展開方案之前呼叫，方案的 details 與 extra_details 一併補上，展開時各方案的
+    合計即依補上後的項目計算 (生成與驗證都依此順序)
+
+    參數:
+    quotes -- 標準格式 (展開前) 的報價單列表 (直接修改)
+    catalog -- PriceCatalog 物件
+
+    返回:
+    tuple -- (已填入列表, 找不到的列表)，每筆包含 index、quoteNumber、path 與 items；
+             已填入的另含 match、catalog_items、unit 與 amount
+    """
+    filled, missing = [], []
+    for idx, quote in enumerate(quotes):
+        if not isinstance(quote, dict) or has_items_file(quote):
+            continue
+        quote_number = quote.get("header", {}).get("quoteNumber", "") if isinstance(quote.get("header"), dict) else ""
+        record_base = {"index": idx, "quoteNumber": quote_number}
+        if isinstance(quote.get("details"), list):
+            changed = _fill_items(quote["details"], "details", catalog, record_base, filled, missing)
+            if changed and not any(field in quote for field in TOTAL_FIELDS):
+                quote.update(compute_totals(quote["details"], quote.get("discount", 0)))
+
+        # 方案的合計在展開時依項目重新計算，這裡只補項目
+        variants = quote.get("variants")
+        if not isinstance(variants, list):
+            continue
+        for v, variant in enumerate(variants):
+            if not isinstance(variant, dict) or has_items_file(variant):
+                continue
+            for key in ("details", "extra_details"):
+                if isinstance(variant.get(key), list):
+                    _fill_items(variant[key], f"variants[{v}].{key}", catalog, record_base, filled, missing)
+    return filled, missing
+
+def summarize_fills(filled, missing):
+    """將價目表填入結果整理為給使用者閱讀的文字"""
+    lines = [f"已從價目表補上 {len(filled)} 個項目的單價或金額" + (f"，{len(missing)} 個項目找不到" if missing else "")]
+    for record in filled:
+        source = f" ← {record['catalog_items']} ({record['match']})" if record.get("catalog_items") else ""
+        lines.append(f"- quote[{record['index']}] {record['path']} {record['items']}{source}: 單價 {record['unit']}，金額 {record['amount']}")
+    for record in missing:
+        lines.append(f"- quote[{record['index']}] {record['path']} {record['items']}: 價目表中找不到")
+    return "\n".join(lines)
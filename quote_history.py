@@ -0,0 +1,214 @@
+import os
+import re
+import json
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# 歷史紀錄設定，可透過環境變數調整
+HISTORY_ENABLED = os.environ.get("QUOTE_HISTORY", "1").lower() in ("1", "true", "yes")
+HISTORY_DIR = os.environ.get("QUOTE_HISTORY_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "history")
+DEFAULT_SEARCH_LIMIT = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quotes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    quote_number TEXT NOT NULL,
+    recipient TEXT,
+    title TEXT,
+    quote_date TEXT,
+    created_at TEXT NOT NULL,
+    total_without_tax REAL,
+    discount REAL,
+    tax REAL,
+    total_with_tax REAL,
+    sha256 TEXT,
+    file_path TEXT,
+    archive_path TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_quotes_quote_number ON quotes (quote_number);
+CREATE INDEX IF NOT EXISTS idx_quotes_recipient ON quotes (recipient);
+CREATE INDEX IF NOT EXISTS idx_quotes_quote_date ON quotes (quote_date);
+"""
+
+def normalize_date(date_str):
+    """將 YYYY/MM/DD 或 YYYY-MM-DD 轉為 YYYY-MM-DD，無法辨識時原樣返回"""
+    if not date_str:
+        return ""
+    match = re.match(r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})', str(date_str))
+    if not match:
+        return str(date_str)
+    year, month, day = match.groups()
+    return f"{year}-{int(month):02d}-{int(day):02d}"
+
+class QuoteHistory:
+    """
+    以 SQLite 保存已生成報價單的歷史紀錄
+
+    每份報價單記錄標準化後的數據、合計金額與輸出位置，並依 quoteNumber、
+    recipient 與報價日期建立索引；生成的文檔以 SHA-256 命名另存一份到
+    歷史目錄，不受 temp/ 清理影響，相同內容只保存一次
+
+    參數:
+    history_dir -- 歷史目錄 (資料庫為 quotes.db，文檔存於 files/)
+    """
+
+    def __init__(self, history_dir=HISTORY_DIR):
+        self.history_dir = history_dir
+        self.db_path = os.path.join(history_dir, "quotes.db")
+        self.files_dir = os.path.join(history_dir, "files")
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self):
+        """開啟資料庫連線，結束時提交並關閉 (每次呼叫各自連線，可在多個工作執行緒中使用)"""
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    os.makedirs(self.files_dir, exist_ok=True)
+                    conn = sqlite3.connect(self.db_path, timeout=30)
+                    try:
+                        # WAL 模式讓查詢不被寫入阻塞
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        conn.executescript(SCHEMA)
+                    finally:
+                        conn.close()
+                    self._initialized = True
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _archive(self, file_path, digest):
+        """以 SHA-256 命名保存文檔副本 (沿用原副檔名)，已存在時直接沿用"""
+        extension = os.path.splitext(file_path)[1] or ".docx"
+        archive_path = os.path.join(self.files_dir, digest[:2], f"{digest}{extension}")
+        if not os.path.exists(archive_path):
+            os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+            tmp_path = f"{archive_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            shutil.copyfile(file_path, tmp_path)
+            os.replace(tmp_path, archive_path)
+        return archive_path
+
+    def record(self, quotes, rendered):
+        """
+        記錄一次生成的結果
+
+        參數:
+        quotes -- 標準化後的報價單列表
+        rendered -- 生成報告中的 rendered 列表 (index、path、sha256)
+
+        返回:
+        list -- 新增紀錄的 id
+        """
+        created_at = datetime.now().isoformat(timespec="seconds")
+        rows = []
+        for entry in rendered:
+            quote = quotes[entry["index"]]
+            header = quote.get("header", {})
+            archive_path = self._archive(entry["path"], entry["sha256"])
+            rows.append((
+                header.get("quoteNumber", ""),
+                header.get("recipient", ""),
+                header.get("Title", ""),
+                normalize_date(header.get("start_date", "")),
+                created_at,
+                quote.get("total_without_tax"),
+                quote.get("discount"),
+                quote.get("tax_rate"),
+                quote.get("total_with_tax"),
+                entry["sha256"],
+                entry["path"],
+                archive_path,
+                json.dumps(quote, ensure_ascii=False),
+            ))
+
+        ids = []
+        with self._connect() as conn:
+            for row in rows:
+                cursor = conn.execute(
+                    "INSERT INTO quotes (quote_number, recipient, title, quote_date, created_at, "
+                    "total_without_tax, discount, tax, total_with_tax, sha256, file_path, archive_path, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    row,
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def search(self, quote_number=None, recipient=None, date_from=None, date_to=None, limit=DEFAULT_SEARCH_LIMIT):
+        """
+        搜尋歷史報價單，最新的在前
+
+        參數:
+        quote_number -- 報價單號前綴
+        recipient -- 收件人 (部分符合)
+        date_from -- 報價日期起 (含)
+        date_to -- 報價日期迄 (含)
+        limit -- 最多返回筆數
+
+        返回:
+        list -- 紀錄摘要字典列表 (不含完整數據)
+        """
+        conditions, params = [], []
+        if quote_number:
+            # GLOB 前綴比對可使用 quote_number 索引
+            conditions.append("quote_number GLOB ?")
+            params.append(_escape_glob(quote_number) + "*")
+        if recipient:
+            conditions.append("recipient LIKE ? ESCAPE '\\'")
+            params.append("%" + _escape_like(recipient) + "%")
+        if date_from:
+            conditions.append("quote_date >= ?")
+            params.append(normalize_date(date_from))
+        if date_to:
+            conditions.append("quote_date <= ?")
+            params.append(normalize_date(date_to))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(int(limit))
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, quote_number, recipient, title, quote_date, created_at, total_with_tax, sha256, archive_path "
+                f"FROM quotes {where} ORDER BY id DESC LIMIT ?",
+                params,
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, record_id=None, quote_number=None):
+        """
+        取得單筆歷史紀錄 (含標準化數據)
+
+        指定 quote_number 時返回該單號最新的一筆
+
+        返回:
+        dict -- 紀錄內容，找不到時返回 None
+        """
+        with self._connect() as conn:
+            if record_id is not None:
+                row = conn.execute("SELECT * FROM quotes WHERE id = ?", (int(record_id),)).fetchone()
+            elif quote_number:
+                row = conn.execute(
+                    "SELECT * FROM quotes WHERE quote_number = ? ORDER BY id DESC LIMIT 1", (quote_number,)
+                ).fetchone()
+            else:
+                raise ValueError("必須指定 id 或 quote_number")
+        if row is None:
+            return None
+        record = dict(row)
+        record["data"] = json.loads(record["data"])
+        return record
+
+def _escape_like(value):
+    """跳脫 LIKE 樣式中的特殊字元"""
+    return str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _escape_glob(value):
+    """跳脫 GLOB 樣式中的特殊字元"""
+    return str(value).replace("[", "[[]").replace("*", "[*]").replace("?", "[?]")
@@ -0,0 +1,78 @@
+import os
+import json
+import glob
+from concurrent.futures import ThreadPoolExecutor
+
+# 平行讀取 JSON 文件的執行緒數
+DEFAULT_READ_WORKERS = int(os.environ.get("QUOTE_READ_WORKERS", "8"))
+
+def is_multi_file_path(path):
+    """判斷路徑是否為目錄或 glob 樣式"""
+    return os.path.isdir(path) or glob.has_magic(path)
+
+def expand_input_paths(path):
+    """
+    將輸入路徑展開為 JSON 文件列表
+
+    參數:
+    path -- 單一文件、目錄 (讀取其中所有 .json) 或 glob 樣式
+
+    返回:
+    list -- 排序後的文件路徑
+    """
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "*.json")))
+    if glob.has_magic(path):
+        return sorted(p for p in glob.glob(path, recursive=True) if os.path.isfile(p))
+    return [path] if os.path.isfile(path) else []
+
+def extract_quotes(data):
+    """
+    從單一文件的內容取出報價單列表
+
+    支援 {"quotes": [...]}、單一報價單 (含 header) 與報價單陣列
+    """
+    if isinstance(data, dict):
+        if isinstance(data.get("quotes"), list):
+            return data["quotes"]
+        if isinstance(data.get("quotes"), dict):
+            return [data["quotes"]]
+        if "header" in data:
+            return [data]
+    if isinstance(data, list) and all(isinstance(q, dict) for q in data):
+        return data
+    raise ValueError("文件內容必須包含 'quotes' 列表或單一報價單 (含 'header')")
+
+def _read_quote_file(path):
+    """讀取並解析單一 JSON 文件，返回 (報價單列表, 錯誤訊息)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return extract_quotes(data), None
+    except Exception as e:
+        return [], str(e)
+
+def load_quote_files(paths, max_workers=DEFAULT_READ_WORKERS):
+    """
+    以執行緒池平行讀取多個 JSON 文件並合併為單一批次
+
+    單一文件失敗不影響其他文件，合併順序與 paths 相同
+
+    參數:
+    paths -- 文件路徑列表
+    max_workers -- 執行緒數
+
+    返回:
+    tuple -- ({"quotes": [...]}, 錯誤列表 [{"file": 路徑, "error": 訊息}])
+    """
+    quotes, errors = [], []
+    if not paths:
+        return {"quotes": quotes}, errors
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+        for path, (file_quotes, error) in zip(paths, executor.map(_read_quote_file, paths)):
+            if error is not None:
+                errors.append({"file": path, "error": error})
+            else:
+                quotes.extend(file_quotes)
+    return {"quotes": quotes}, errors
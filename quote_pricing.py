@@ -0,0 +1,212 @@
+import os
+from decimal import Decimal, ROUND_HALF_UP
+
+# 營業稅率
+TAX_RATE = 0.05
+# 金額比對容許誤差 (元)
+TOLERANCE = 1
+
+# 價格檢查模式: off 不檢查、flag 只回報、correct 自動修正
+PRICING_MODES = ("off", "flag", "correct")
+DEFAULT_PRICING_MODE = os.environ.get("QUOTE_PRICING_MODE", "flag")
+
+def round_half_up(value):
+    """四捨五入為整數 (避免 Python round 的銀行家捨入)"""
+    return int(Decimal(str(value)).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+def to_number(value):
+    """
+    將欄位值轉為數字
+
+    接受 int/float 與含千分位逗點的字串，無法轉換時返回 None
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.replace(",", "").strip())
+        except ValueError:
+            return None
+    return None
+
+_NAN = float("nan")
+_NUMERIC_TYPES = (int, float)
+
+def _field(item, key):
+    """讀取項目數值欄位，缺漏或無法轉換時為 NaN (數字型別直接通過)"""
+    value = item.get(key)
+    if type(value) in _NUMERIC_TYPES:
+        return value
+    value = to_number(value)
+    return _NAN if value is None else value
+
+def _checked_details(quotes):
+    """
+    返回各報價單要核對的項目
+
+    由項目檔 (items_file_path) 提供項目的報價單在生成時串流寫入並累計合計，
+    不在此預先讀取，因此不核對
+    """
+    # line_items 依賴本模組的計算函數，延遲匯入避免循環匯入 (每批只匯入一次)
+    from line_items import ITEMS_FILE_FIELD
+    return [[] if quote.get(ITEMS_FILE_FIELD) else quote.get("details") or [] for quote in quotes]
+
+def _flatten(checked):
+    """將批次內所有項目攤平成欄位陣列，並記錄所屬報價單索引"""
+    quote_index, units, quantities, amounts = [], [], [], []
+    for idx, details in enumerate(checked):
+        for item in details:
+            if not isinstance(item, dict):
+                continue
+            quote_index.append(idx)
+            units.append(_field(item, "unit"))
+            quantities.append(_field(item, "quantity"))
+            amounts.append(_field(item, "amount"))
+    return quote_index, units, quantities, amounts
+
+def _compute_batch(quotes, quote_index, units, quantities, amounts):
+    """
+    計算項目金額與各報價單合計
+
+    項目欄位須逐項從 dict 讀出，攤平的成本已與計算本身相當，
+    改用 NumPy 向量化在十萬個項目時也沒有可量測的差異，因此以純 Python 計算
+    """
+    line_totals, line_bad = [], []
+    subtotals = [0.0] * len(quotes)
+    for idx, unit, qty, amount in zip(quote_index, units, quantities, amounts):
+        # NaN 不等於自身，用來判斷缺漏欄位
+        line_total = unit * qty
+        if line_total != line_total:
+            line_total = amount if amount == amount else 0.0
+        line_totals.append(line_total)
+        line_bad.append(amount != amount or abs(line_total - amount) >= TOLERANCE)
+        subtotals[idx] += line_total
+
+    taxes, totals, discount_pct = [], [], []
+    for quote, subtotal in zip(quotes, subtotals):
+        discount = to_number(quote.get("discount")) or 0.0
+        taxable = subtotal - discount
+        tax = float(round_half_up(max(taxable, 0) * TAX_RATE))
+        taxes.append(tax)
+        totals.append(taxable + tax)
+        discount_pct.append(discount / subtotal * 100 if subtotal > 0 else 0.0)
+    return line_totals, line_bad, subtotals, taxes, totals, discount_pct
+
+def reconcile_quotes(quotes, mode=DEFAULT_PRICING_MODE):
+    """
+    批次核對報價單的項目金額、小計、稅金與總計
+
+    對整批報價單的所有項目一次計算 單價 × 數量、各報價單小計、
+    折扣百分比與 5% 稅金，並與輸入值比對
+
+    參數:
+    quotes -- 標準格式的報價單列表
+    mode -- 'off'、'flag' (只回報差異) 或 'correct' (以計算值覆寫)
+
+    返回:
+    tuple -- (各報價單計算結果列表, 差異列表)
+             計算結果包含 subtotal、discount_percentage、tax、total；
+             差異每筆包含 index、quoteNumber、field、expected、actual
+    """
+    if mode not in PRICING_MODES:
+        raise ValueError(f"未知的價格檢查模式: {mode}，可用模式: {', '.join(PRICING_MODES)}")
+    if mode == "off" or not quotes:
+        return [], []
+
+    checked = _checked_details(quotes)
+    quote_index, units, quantities, amounts = _flatten(checked)
+    line_totals, line_bad, subtotals, taxes, totals, discount_pct = _compute_batch(quotes, quote_index, units, quantities, amounts)
+
+    issues = []
+
+    def flag(idx, field, expected, actual):
+        issues.append({
+            "index": idx,
+            "quoteNumber": quotes[idx].get("header", {}).get("quoteNumber", ""),
+            "field": field,
+            "expected": round_half_up(expected),
+            "actual": actual,
+        })
+
+    # 逐項比對金額 (全部相符時略過走訪)
+    if any(line_bad):
+        pos = 0
+        for idx, details in enumerate(checked):
+            for n, item in enumerate(details):
+                if not isinstance(item, dict):
+                    continue
+                if line_bad[pos]:
+                    flag(idx, f"details[{n}].amount", line_totals[pos], item.get("amount"))
+                    if mode == "correct":
+                        item["amount"] = round_half_up(line_totals[pos])
+                pos += 1
+
+    # 比對各報價單合計 (沒有項目的報價單無從核算，沿用輸入值)
+    has_lines = set(quote_index)
+    for idx, quote in enumerate(quotes):
+        if idx not in has_lines:
+            continue
+        expected = {
+            "total_without_tax": subtotals[idx],
+            "tax_rate": taxes[idx],
+            "total_with_tax": totals[idx],
+        }
+        for field, value in expected.items():
+            actual = to_number(quote.get(field))
+            if actual is None or abs(actual - value) >= TOLERANCE:
+                flag(idx, field, value, quote.get(field))
+                if mode == "correct":
+                    quote[field] = round_half_up(value)
+
+    totals_list = [
+        {
+            "subtotal": round_half_up(subtotals[idx]),
+            "discount_percentage": round_half_up(discount_pct[idx]),
+            "tax": round_half_up(taxes[idx]),
+            "total": round_half_up(totals[idx]),
+        }
+        for idx in range(len(quotes))
+    ]
+    return totals_list, issues
+
+def summarize_issues(issues, mode):
+    """將差異列表整理為給使用者閱讀的文字"""
+    action = "已自動修正" if mode == "correct" else "請確認"
+    lines = [f"價格核對發現 {len(issues)} 處差異 ({action}):"]
+    for issue in issues:
+        lines.append(
+            f"- quote[{issue['index']}] {issue['quoteNumber']} {issue['field']}: "
+            f"輸入 {issue['actual']}，計算值 {issue['expected']}"
+        )
+    return "\n".join(lines)
+
+def compute_totals(details, discount=0):
+    """
+    依項目金額計算報價單合計
+
+    參數:
+    details -- 項目列表
+    discount -- 折扣金額
+
+    返回:
+    dict -- total_without_tax、tax_rate (稅額) 與 total_with_tax
+    """
+    subtotal = sum(to_number(item.get("amount")) or 0.0 for item in details if isinstance(item, dict))
+    return totals_from_subtotal(subtotal, discount)
+
+def totals_from_subtotal(subtotal, discount=0):
+    """
+    依小計與折扣計算 5% 稅金與總計
+
+    返回:
+    dict -- total_without_tax、tax_rate (稅額) 與 total_with_tax
+    """
+    taxable = subtotal - (to_number(discount) or 0.0)
+    tax = round_half_up(max(taxable, 0) * TAX_RATE)
+    return {
+        "total_without_tax": round_half_up(subtotal),
+        "tax_rate": tax,
+        "total_with_tax": round_half_up(taxable + tax),
+    }
@@ -0,0 +1,114 @@
+import os
+import io
+import re
+import time
+import pstats
+import logging
+import cProfile
+import threading
+
+# 效能分析設定，可透過環境變數調整
+PROFILE_ENABLED = os.environ.get("QUOTE_PROFILE", "0").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.environ.get("QUOTE_PROFILE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+PROFILE_TOP_N = int(os.environ.get("QUOTE_PROFILE_TOP", "20"))
+# 取樣式分析器 (選用)，目前支援 pyinstrument
+PROFILE_SAMPLER = os.environ.get("QUOTE_PROFILE_SAMPLER", "")
+
+# 分析在伺服器工作執行緒中進行，STDIO 模式下 stdout 是 JSON-RPC 通道，訊息一律走 logging
+logger = logging.getLogger("quote-profiling")
+
+# 生成在多個工作執行緒中並行，Python 3.12 起同時只能有一個 cProfile 啟用，
+# 第二個分析器會引發 ValueError，因此分析以鎖保護，忙碌時改為不分析直接執行
+_profile_lock = threading.Lock()
+
+def make_profile_id(request_id):
+    """以時間戳與 MCP 請求 id 組成分析結果的檔名"""
+    safe_id = re.sub(r'[^A-Za-z0-9_-]', '', str(request_id)) if request_id is not None else ""
+    now = time.time()
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}_{safe_id or 'local'}"
+
+def _start_sampler():
+    """啟動取樣式分析器，未設定或未安裝時返回 None"""
+    if PROFILE_SAMPLER != "pyinstrument":
+        return None
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        logger.warning("未安裝 pyinstrument，略過取樣式分析")
+        return None
+    sampler = Profiler()
+    sampler.start()
+    return sampler
+
+def profile_call(profile_id, func, *args, **kwargs):
+    """
+    以 cProfile (及選用的取樣式分析器) 執行函數並寫出分析結果
+
+    在 PROFILE_DIR 下寫出:
+    <profile_id>.prof -- 可用 snakeviz / pstats 開啟的原始資料
+    <profile_id>.txt -- 依累計時間排序的前 N 個熱點函數
+    <profile_id>.html -- 取樣式分析結果 (啟用 pyinstrument 時)
+
+    同一時間只分析一個呼叫；已有分析進行中 (或其他分析工具已啟用) 時，
+    func 照常執行但不分析，以免生成因分析器衝突而失敗
+
+    參數:
+    profile_id -- 分析結果的檔名
+    func -- 要分析的函數
+
+    返回:
+    tuple -- (func 的返回值, 分析結果資訊字典；未分析時為 None)
+    """
+    if not _profile_lock.acquire(blocking=False):
+        logger.warning(f"另一個效能分析進行中，本次生成不分析: {profile_id}")
+        return func(*args, **kwargs), None
+    try:
+        return _profile_locked(profile_id, func, *args, **kwargs)
+    finally:
+        _profile_lock.release()
+
+def _profile_locked(profile_id, func, *args, **kwargs):
+    """持有 _profile_lock 時執行 profile_call 的實際分析"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base_path = os.path.join(PROFILE_DIR, profile_id)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # 例如除錯器或覆蓋率工具已佔用分析掛鉤
+        logger.warning(f"無法啟動 cProfile ({e})，本次生成不分析: {profile_id}")
+        return func(*args, **kwargs), None
+
+    sampler = _start_sampler()
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - start
+        if sampler is not None:
+            sampler.stop()
+
+        # 即使生成失敗也保留分析結果，方便追查
+        profiler.dump_stats(base_path + ".prof")
+        buffer = io.StringIO()
+        stats = pstats.Stats(profiler, stream=buffer)
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+        summary = buffer.getvalue()
+        with open(base_path + ".txt", 'w', encoding='utf-8') as f:
+            f.write(summary)
+
+        info = {
+            "id": profile_id,
+            "seconds": round(elapsed, 3),
+            "prof_path": base_path + ".prof",
+            "summary_path": base_path + ".txt",
+            "summary": summary,
+        }
+        if sampler is not None:
+            with open(base_path + ".html", 'w', encoding='utf-8') as f:
+                f.write(sampler.output_html())
+            info["sampler_path"] = base_path + ".html"
+        logger.info(f"已寫出效能分析結果: {base_path}.prof ({elapsed:.3f} 秒)")
+
+    return result, info
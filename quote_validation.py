@@ -0,0 +1,287 @@
+import os
+import re
+import copy
+from quote_pricing import reconcile_quotes, to_number
+from quote_variants import expand_variant
+from line_items import ITEMS_FILE_FIELD, iter_line_items
+
+# 生成時必須提供的 header 欄位 (其餘欄位有預設值)
+REQUIRED_HEADER_FIELDS = ("quoteNumber", "Title", "recipient", "start_date", "end_date")
+DATE_FIELDS = ("start_date", "end_date")
+ITEM_NUMERIC_FIELDS = ("unit", "quantity", "amount")
+TOTAL_NUMERIC_FIELDS = ("total_without_tax", "discount", "tax_rate", "total_with_tax")
+
+DATE_PATTERN = re.compile(r'^\d{4}/\d{2}/\d{2}$')
+ISO_DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+PHONE_PATTERN = re.compile(r'^[\d\-+() #]+$')
+
+class ValidationCollector:
+    """
+    收集整批報價單的錯誤與警告
+
+    每筆診斷包含報價單索引 (輸入中的位置)、報價單號、欄位路徑與說明
+    """
+
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+
+    def add(self, level, index, path, message, quote_number=""):
+        target = self.errors if level == "error" else self.warnings
+        target.append({"index": index, "quoteNumber": quote_number, "path": path, "message": message})
+
+    def error(self, index, path, message, quote_number=""):
+        self.add("error", index, path, message, quote_number)
+
+    def warning(self, index, path, message, quote_number=""):
+        self.add("warning", index, path, message, quote_number)
+
+def _check_header(collector, idx, header, path, quote_number, required=True):
+    """檢查 header 欄位 (方案的 header 只覆寫部分欄位，不檢查必填)"""
+    if not isinstance(header, dict):
+        collector.error(idx, path, f"header 必須是字典格式，實際類型: {type(header).__name__}", quote_number)
+        return
+    if required:
+        for field in REQUIRED_HEADER_FIELDS:
+            value = header.get(field)
+            if value is None or (isinstance(value, str) and not value.strip()):
+                collector.error(idx, f"{path}.{field}", "缺少必填欄位", quote_number)
+    number = header.get("quoteNumber")
+    if isinstance(number, str) and number and not number.startswith("Q-"):
+        collector.warning(idx, f"{path}.quoteNumber", "報價單號應以 'Q-' 開頭", quote_number)
+    for field in DATE_FIELDS:
+        value = header.get(field)
+        if value and not (isinstance(value, str) and (DATE_PATTERN.match(value) or ISO_DATE_PATTERN.match(value))):
+            collector.warning(idx, f"{path}.{field}", f"日期格式應為 YYYY/MM/DD，實際為 {value!r}", quote_number)
+    contact = header.get("companyContact")
+    if contact and not (isinstance(contact, str) and PHONE_PATTERN.match(contact)):
+        collector.warning(idx, f"{path}.companyContact", f"companyContact 應為電話號碼，實際為 {contact!r}", quote_number)
+
+def _check_number(collector, idx, path, value, quote_number, required=False):
+    """檢查數字欄位：無法轉換為錯誤，含逗點等格式的文字為警告"""
+    if value is None:
+        if required:
+            collector.error(idx, path, "缺少數字欄位", quote_number)
+        return
+    if to_number(value) is None:
+        collector.error(idx, path, f"必須是數字，實際為 {value!r}", quote_number)
+    elif isinstance(value, str):
+        collector.warning(idx, path, f"數字欄位不應含逗點或其他格式符號: {value!r}", quote_number)
+
+def _check_details(collector, idx, details, path, quote_number):
+    """檢查項目列表"""
+    if not isinstance(details, list):
+        collector.error(idx, path, f"必須是列表，實際類型: {type(details).__name__}", quote_number)
+        return
+    for n, item in enumerate(details):
+        item_path = f"{path}[{n}]"
+        if not isinstance(item, dict):
+            collector.error(idx, item_path, f"項目必須是字典格式，實際類型: {type(item).__name__}", quote_number)
+            continue
+        if not item.get("items"):
+            collector.error(idx, f"{item_path}.items", "缺少項目名稱", quote_number)
+        for field in ITEM_NUMERIC_FIELDS:
+            _check_number(collector, idx, f"{item_path}.{field}", item.get(field), quote_number, required=field == "amount")
+
+def _check_items_file(collector, idx, path_value, path, quote_number):
+    """檢查項目檔是否存在且標題列可辨識 (只讀取到第一個項目)"""
+    if not isinstance(path_value, str) or not os.path.isfile(path_value):
+        collector.error(idx, path, f"找不到項目檔: {path_value}", quote_number)
+        return
+    try:
+        next(iter_line_items(path_value), None)
+    except Exception as e:
+        collector.error(idx, path, str(e), quote_number)
+
+def _check_quote(collector, idx, quote):
+    """檢查單一 (展開前的) 報價單結構，返回可展開的方案列表"""
+    path = f"quotes[{idx}]"
+    if not isinstance(quote, dict):
+        collector.error(idx, path, f"報價單必須是字典格式，實際類型: {type(quote).__name__}")
+        return None
+    header = quote.get("header")
+    quote_number = header.get("quoteNumber", "") if isinstance(header, dict) else ""
+    _check_header(collector, idx, header, f"{path}.header", quote_number)
+    if quote.get(ITEMS_FILE_FIELD):
+        _check_items_file(collector, idx, quote[ITEMS_FILE_FIELD], f"{path}.{ITEMS_FILE_FIELD}", quote_number)
+    elif not quote.get("details") and not quote.get("variants"):
+        collector.warning(idx, f"{path}.details", "報價單沒有任何項目", quote_number)
+    _check_details(collector, idx, quote.get("details", []), f"{path}.details", quote_number)
+    for field in TOTAL_NUMERIC_FIELDS:
+        _check_number(collector, idx, f"{path}.{field}", quote.get(field), quote_number)
+
+    variants = quote.get("variants")
+    if not variants:
+        return []
+    if not isinstance(variants, list):
+        collector.error(idx, f"{path}.variants", f"必須是列表，實際類型: {type(variants).__name__}", quote_number)
+        return None
+    valid = []
+    for n, variant in enumerate(variants):
+        variant_path = f"{path}.variants[{n}]"
+        if not isinstance(variant, dict):
+            collector.error(idx, variant_path, f"方案必須是字典格式，實際類型: {type(variant).__name__}", quote_number)
+            continue
+        if "header" in variant:
+            _check_header(collector, idx, variant["header"], f"{variant_path}.header", quote_number, required=False)
+        for key in ("details", "extra_details"):
+            if key in variant:
+                _check_details(collector, idx, variant[key], f"{variant_path}.{key}", quote_number)
+        for field in TOTAL_NUMERIC_FIELDS:
+            _check_number(collector, idx, f"{variant_path}.{field}", variant.get(field), quote_number)
+        valid.append((n, variant))
+    return valid
+
+def _issue_path(origin, quotes, field):
+    """將價格核對差異的欄位對應回輸入中的路徑"""
+    idx, n = origin
+    base = f"quotes[{idx}]"
+    if n is None:
+        return f"{base}.{field}"
+    variant = quotes[idx]["variants"][n]
+    variant_path = f"{base}.variants[{n}]"
+    match = re.match(r'details\[(\d+)\]\.(\w+)$', field)
+    if not match:
+        return f"{variant_path}.{field}" if field in variant else f"{base}.{field}"
+    k, name = int(match.group(1)), match.group(2)
+    if "details" in variant:
+        return f"{variant_path}.details[{k}].{name}"
+    base_count = len(quotes[idx].get("details") or [])
+    if k < base_count:
+        return f"{base}.details[{k}].{name}"
+    return f"{variant_path}.extra_details[{k - base_count}].{name}"
+
+def _diagnostic_order(entry):
+    """診斷的排序鍵: 整批的問題在最前，其餘依報價單索引"""
+    return -1 if entry["index"] is None else entry["index"]
+
+def validate_quotes(quotes, max_quotes=None):
+    """
+    一次檢查整批報價單，不載入模板也不生成文檔
+
+    依序進行結構與必填欄位檢查、展開多方案、檢查報價單號重複，
+    最後以 flag 模式核對項目金額與合計；所有問題一次回報
+
+    參數:
+    quotes -- 標準化後的報價單列表 (standardize_input_data 的 quotes)
+    max_quotes -- 單次生成的報價單數上限 (可選)
+
+    返回:
+    dict -- valid、quotes (輸入份數)、rendered (展開後份數)、errors 與 warnings；
+            每筆診斷包含 index、quoteNumber、path 與 message
+    """
+    collector = ValidationCollector()
+    expanded, origins = [], []
+    for idx, quote in enumerate(quotes):
+        variants = _check_quote(collector, idx, quote)
+        if variants is None:
+            continue
+        if not isinstance(quote.get("header"), dict) or not isinstance(quote.get("details", []), list):
+            continue
+        if not variants:
+            expanded.append(quote)
+            origins.append((idx, None))
+            continue
+        for n, variant in variants:
+            try:
+                expanded.append(expand_variant(quote, variant, n + 1))
+                origins.append((idx, n))
+            except Exception as e:
+                collector.error(idx, f"quotes[{idx}].variants[{n}]", f"無法展開方案: {str(e)}")
+
+    if max_quotes and len(expanded) > max_quotes:
+        collector.error(None, "quotes", f"展開後共 {len(expanded)} 份報價單，超過單次上限 {max_quotes}，請分批送出")
+
+    # 相同單號會輸出到同一個檔案
+    seen = {}
+    for quote, (idx, n) in zip(expanded, origins):
+        number = quote["header"].get("quoteNumber")
+        if not number:
+            continue
+        if number in seen:
+            path = f"quotes[{idx}].header.quoteNumber" if n is None else f"quotes[{idx}].variants[{n}].header.quoteNumber"
+            collector.error(idx, path, f"報價單號與 quotes[{seen[number]}] 重複，輸出檔案會互相覆蓋", number)
+        else:
+            seen[number] = idx
+
+    # 只核對結構正確的報價單 (核對會修改數據，使用副本)
+    checkable = [
+        (quote, origin) for quote, origin in zip(expanded, origins)
+        if all(isinstance(item, dict) for item in quote.get("details") or [])
+    ]
+    _, issues = reconcile_quotes(copy.deepcopy([quote for quote, _ in checkable]), "flag")
+    reported = {entry["path"] for entry in collector.errors}
+    for issue in issues:
+        origin = checkable[issue["index"]][1]
+        path = _issue_path(origin, quotes, issue["field"])
+        # 已回報為格式錯誤的欄位不再重複回報金額不符
+        if path in reported:
+            continue
+        collector.error(origin[0], path, f"金額不符: 輸入 {issue['actual']}，計算值 {issue['expected']}", issue["quoteNumber"])
+
+    # 依報價單順序排列 (整批的問題在最前)
+    return {
+        "valid": not collector.errors,
+        "quotes": len(quotes),
+        "rendered": len(expanded),
+        "errors": sorted(collector.errors, key=_diagnostic_order),
+        "warnings": sorted(collector.warnings, key=_diagnostic_order),
+    }
+
+def summarize_validation(result):
+    """將驗證結果整理為給使用者閱讀的文字"""
+    if result["valid"] and not result["warnings"]:
+        return f"驗證通過: {result['quotes']} 份報價單 (展開後 {result['rendered']} 份)，沒有發現問題"
+    status = "驗證通過" if result["valid"] else "驗證失敗"
+    lines = [
+        f"{status}: {result['quotes']} 份報價單 (展開後 {result['rendered']} 份)，"
+        f"{len(result['errors'])} 個錯誤、{len(result['warnings'])} 個警告"
+    ]
+    for label, entries in (("錯誤", result["errors"]), ("警告", result["warnings"])):
+        if entries:
+            lines.append(f"{label}:")
+            for entry in entries:
+                number = f" ({entry['quoteNumber']})" if entry["quoteNumber"] else ""
+                lines.append(f"- {entry['path']}{number}: {entry['message']}")
+    return "\n".join(lines)
+
+def validate_input(data, max_quotes=None, catalog=None):
+    """
+    以與 generate_docs 相同的標準化流程處理原始輸入後驗證整批報價單
+
+    參數:
+    data -- 原始輸入數據 (不會被修改)
+    max_quotes -- 單次生成的報價單數上限 (可選)
+    catalog -- 價目表 (可選)，指定時與生成相同，在展開方案前先補上項目 (含方案項目)
+               缺少的單價與金額再驗證
+
+    返回:
+    dict -- 與 validate_quotes 相同的驗證結果
+    """
+    # 延遲匯入，避免只需要驗證規則時載入 Word 生成模組
+    from generate_quote_docs import standardize_input_data
+
+    try:
+        standardized = standardize_input_data(copy.deepcopy(data))
+    except Exception as e:
+        standardized, error = None, f"無法將輸入數據轉換為標準格式: {str(e)}"
+    else:
+        error = None
+        if not isinstance(standardized, dict):
+            error = f"輸入數據必須是字典格式，實際類型: {type(standardized).__name__}"
+        elif "quotes" not in standardized:
+            error = "輸入數據缺少 'quotes' 字段"
+        elif not isinstance(standardized["quotes"], list) or not standardized["quotes"]:
+            error = "'quotes' 必須是非空列表"
+    if error is not None:
+        return {
+            "valid": False,
+            "quotes": 0,
+            "rendered": 0,
+            "errors": [{"index": None, "quoteNumber": "", "path": "quotes", "message": error}],
+            "warnings": [],
+        }
+    if catalog is not None:
+        from price_catalog import fill_missing_prices
+        fill_missing_prices(standardized["quotes"], catalog)
+    return validate_quotes(standardized["quotes"], max_quotes)
@@ -0,0 +1,88 @@
+import copy
+from quote_pricing import compute_totals
+from line_items import has_items_file
+
+# 方案可覆寫的合計欄位，全部未指定且項目或折扣有變動時依項目重新計算
+TOTAL_FIELDS = ("total_without_tax", "tax_rate", "total_with_tax")
+
+def variant_count(quote):
+    """單一報價單展開後的份數"""
+    if isinstance(quote, dict) and isinstance(quote.get("variants"), list) and quote["variants"]:
+        return len(quote["variants"])
+    return 1
+
+def count_rendered_quotes(quotes):
+    """展開方案後實際要生成的報價單數"""
+    return sum(variant_count(quote) for quote in quotes)
+
+def expand_variant(base, variant, number):
+    """
+    以共用基底與單一方案的覆寫內容組成完整報價單
+
+    參數:
+    base -- 共用的報價單 (含 header、details 等)
+    variant -- 方案覆寫內容: name、header (部分欄位)、details (取代)、
+               extra_details (附加)，其餘欄位直接覆寫
+    number -- 方案序號 (從 1 開始)，未指定報價單號時附加在基底單號後
+
+    返回:
+    dict -- 標準格式的報價單
+    """
+    quote = {key: copy.deepcopy(value) for key, value in base.items() if key != "variants"}
+    header_overrides = variant.get("header") or {}
+    header = quote["header"]
+    header.update(copy.deepcopy(header_overrides))
+
+    # 各方案輸出不同檔名
+    if "quoteNumber" not in header_overrides:
+        header["quoteNumber"] = f"{header.get('quoteNumber', 'unknown')}-{number}"
+    name = variant.get("name")
+    if name and "Title" not in header_overrides:
+        header["Title"] = f"{header['Title']} - {name}" if header.get("Title") else name
+
+    if "details" in variant:
+        quote["details"] = copy.deepcopy(variant["details"])
+    if variant.get("extra_details"):
+        quote["details"] = list(quote.get("details") or []) + copy.deepcopy(variant["extra_details"])
+
+    for key, value in variant.items():
+        if key not in ("name", "header", "details", "extra_details"):
+            quote[key] = copy.deepcopy(value)
+
+    # 由項目檔提供項目時，合計在生成時串流累計，這裡不重新計算
+    changed = any(key in variant for key in ("details", "extra_details", "discount"))
+    if changed and not any(field in variant for field in TOTAL_FIELDS) and not has_items_file(quote):
+        quote.update(compute_totals(quote["details"], quote.get("discount", 0)))
+    return quote
+
+def expand_variants(quotes):
+    """
+    展開含 variants 的報價單
+
+    參數:
+    quotes -- 標準格式的報價單列表，其中的報價單可帶 variants 列表
+
+    返回:
+    tuple -- (展開後的報價單列表, 方案組列表)
+             方案組為同一基底展開出的報價單索引列表，生成時共用基底文檔
+    """
+    expanded, groups = [], []
+    for idx, quote in enumerate(quotes):
+        variants = quote.get("variants") if isinstance(quote, dict) else None
+        if not variants:
+            if isinstance(quote, dict) and "variants" in quote:
+                quote = {key: value for key, value in quote.items() if key != "variants"}
+            expanded.append(quote)
+            continue
+        if not isinstance(variants, list):
+            raise ValueError(f"quote[{idx}].variants 必須是列表")
+
+        group = []
+        for n, variant in enumerate(variants):
+            if not isinstance(variant, dict):
+                raise ValueError(f"quote[{idx}].variants[{n}] 必須是字典格式，實際類型: {type(variant)}")
+            group.append(len(expanded))
+            expanded.append(expand_variant(quote, variant, n + 1))
+        if len(group) > 1:
+            groups.append(group)
+    return expanded, groups
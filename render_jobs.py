@@ -0,0 +1,141 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("render-jobs")
+
+# 佇列上限與逾時設定，可透過環境變數調整
+DEFAULT_MAX_QUEUE_DEPTH = int(os.environ.get("QUOTE_MAX_QUEUE_DEPTH", "16"))
+DEFAULT_RENDER_WORKERS = int(os.environ.get("QUOTE_RENDER_WORKERS", "2"))
+DEFAULT_JOB_TIMEOUT = float(os.environ.get("QUOTE_JOB_TIMEOUT", "300"))
+
+class RenderJobRejected(Exception):
+    """佇列已滿，拒絕新的生成工作"""
+
+class RenderJobTimeout(Exception):
+    """生成工作超過期限"""
+
+class RenderJob:
+    """
+    單一生成工作的取消狀態
+
+    取消事件與期限由工作執行緒在報價單之間檢查
+    """
+
+    def __init__(self, job_id, timeout):
+        self.job_id = job_id
+        self.deadline = time.monotonic() + timeout
+        self.cancel_event = threading.Event()
+
+    def remaining(self):
+        """距離期限剩餘的秒數"""
+        return max(0.0, self.deadline - time.monotonic())
+
+    def should_cancel(self):
+        """是否應中止 (已取消或已逾時)"""
+        return self.cancel_event.is_set() or time.monotonic() > self.deadline
+
+class RenderQueue:
+    """
+    有上限的生成工作佇列
+
+    參數:
+    max_depth -- 排隊加執行中的工作上限，超過時立即拒絕
+    workers -- 同時執行的工作數
+    job_timeout -- 每個工作的期限 (秒)，包含排隊時間
+    """
+
+    def __init__(self, max_depth=DEFAULT_MAX_QUEUE_DEPTH, workers=DEFAULT_RENDER_WORKERS, job_timeout=DEFAULT_JOB_TIMEOUT):
+        self.max_depth = max_depth
+        self.workers = workers
+        self.job_timeout = job_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="quote-render")
+        self._slots = None
+        self._next_id = 0
+        self.queued = 0
+        self.running = 0
+        self.stats = {"completed": 0, "failed": 0, "rejected": 0, "timed_out": 0, "cancelled": 0}
+
+    def snapshot(self):
+        """返回目前佇列狀態與累計統計"""
+        return {
+            "max_depth": self.max_depth,
+            "workers": self.workers,
+            "job_timeout": self.job_timeout,
+            "queued": self.queued,
+            "running": self.running,
+            **self.stats,
+        }
+
+    async def submit(self, func, *args, **kwargs):
+        """
+        提交生成工作並等待結果
+
+        func 會以 should_cancel 關鍵字參數收到取消檢查函數；
+        呼叫端被取消 (例如 MCP 取消通知) 時，排隊中的工作直接移除，
+        執行中的工作會在下一個報價單邊界中止
+
+        參數:
+        func -- 在工作執行緒中執行的函數
+
+        返回:
+        func 的返回值
+        """
+        if self.queued + self.running >= self.max_depth:
+            self.stats["rejected"] += 1
+            raise RenderJobRejected(f"生成佇列已滿 ({self.max_depth})，請稍後再試")
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+        self._next_id += 1
+        job = RenderJob(self._next_id, self.job_timeout)
+        call = functools.partial(func, *args, should_cancel=job.should_cancel, **kwargs)
+
+        # 排隊等待可用的執行槽
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), job.remaining())
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            raise RenderJobTimeout(f"生成工作 #{job.job_id} 排隊超過 {self.job_timeout} 秒")
+        except asyncio.CancelledError:
+            self.stats["cancelled"] += 1
+            logger.info(f"生成工作 #{job.job_id} 在排隊中被取消")
+            raise
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        future = asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+        def _release(finished):
+            self.running -= 1
+            self._slots.release()
+            # 呼叫端已離開時由此取回例外，避免未取回例外的警告
+            if not finished.cancelled():
+                finished.exception()
+
+        # 執行槽在執行緒真正結束後才釋放，避免取消後超額執行
+        future.add_done_callback(_release)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), job.remaining())
+        except asyncio.TimeoutError:
+            job.cancel_event.set()
+            self.stats["timed_out"] += 1
+            raise RenderJobTimeout(f"生成工作 #{job.job_id} 超過 {self.job_timeout} 秒")
+        except asyncio.CancelledError:
+            job.cancel_event.set()
+            self.stats["cancelled"] += 1
+            logger.info(f"生成工作 #{job.job_id} 已取消，將於報價單邊界中止")
+            raise
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+
+        self.stats["completed"] += 1
+        return result
@@ -0,0 +1,223 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import logging
+import argparse
+import threading
+from docx import Document
+from docx.oxml import parse_xml
+from lxml import etree
+
+# 渲染計畫格式版本，格式變更時遞增以強制重新編譯
+PLAN_VERSION = 1
+PLAN_SUFFIX = ".plan.json"
+
+# 項目表格相關的佔位符，不參與一般欄位替換
+ITEM_PLACEHOLDERS = ["{#items}", "{/items}", "{category}", "{items}", "{unit}", "{quantity}", "{amount}"]
+ITEM_TABLE_KEYWORDS = ["類別", "項目", "單價", "數量", "金額"]
+
+PLACEHOLDER_PATTERN = re.compile(r'{([^{}]+)}')
+
+# 計畫在伺服器生成途中載入，訊息走 logging 以免寫入 STDIO 伺服器的 stdout
+logger = logging.getLogger("render-plan")
+
+# 已載入的渲染計畫 (模板路徑 -> (mtime, size, plan))，多個執行緒同時生成時以鎖保護
+_plan_cache = {}
+_plan_lock = threading.Lock()
+
+def plan_path_for(template_path):
+    """渲染計畫存放在模板旁，例如 報價單.docx.plan.json"""
+    return template_path + PLAN_SUFFIX
+
+def template_sha256(template_path):
+    """計算模板內容的 SHA-256"""
+    with open(template_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def _is_replaceable(text):
+    """段落是否含有一般欄位佔位符 (與生成時的替換條件一致)"""
+    if any(skip in text for skip in ITEM_PLACEHOLDERS):
+        return False
+    return bool(PLACEHOLDER_PATTERN.search(text))
+
+def compile_render_plan(template_path):
+    """
+    分析模板並編譯為渲染計畫
+
+    渲染計畫記錄:
+    - 所有佔位符名稱與其所在的表格儲存格段落、內文段落位置
+    - 項目表格索引、欄數、表頭與各欄對應的欄位
+    - 項目行原型 (已套用格式的空白項目行 XML)，生成時直接複製
+
+    參數:
+    template_path -- 模板檔案路徑
+
+    返回:
+    dict -- 可序列化為 JSON 的渲染計畫
+    """
+    # 延遲匯入以避免與 generate_quote_docs 循環匯入
+    from generate_quote_docs import build_item_row_prototype
+
+    doc = Document(template_path)
+    placeholders = set()
+    table_locations = []
+    tables_info = []
+    item_table = None
+    seen = set()
+
+    for t, table in enumerate(doc.tables):
+        table_placeholders = set()
+        for r, row in enumerate(table.rows):
+            for c, cell in enumerate(row.cells):
+                for p, paragraph in enumerate(cell.paragraphs):
+                    matches = [m.strip() for m in PLACEHOLDER_PATTERN.findall(paragraph.text)]
+                    table_placeholders.update(matches)
+                    # 合併儲存格會在 row.cells 中重複出現，只記錄一次
+                    if paragraph._p in seen:
+                        continue
+                    seen.add(paragraph._p)
+                    if _is_replaceable(paragraph.text):
+                        table_locations.append([t, r, c, p])
+        placeholders.update(table_placeholders)
+
+        is_item_table = False
+        if len(table.rows) > 0 and item_table is None:
+            headers = [cell.text.strip() for cell in table.rows[0].cells]
+            if any(keyword in " ".join(headers).lower() for keyword in ITEM_TABLE_KEYWORDS):
+                is_item_table = True
+                # 範例行中的佔位符決定各欄對應的欄位
+                fields = []
+                if len(table.rows) > 1:
+                    for cell in table.rows[1].cells:
+                        match = PLACEHOLDER_PATTERN.search(cell.text)
+                        fields.append(match.group(1).strip() if match else None)
+                prototype = build_item_row_prototype(table)
+                etree.cleanup_namespaces(prototype)
+                item_table = {
+                    "index": t,
+                    "columns": len(prototype.tc_lst),
+                    "header": headers,
+                    "fields": fields,
+                    "row_prototype": etree.tostring(prototype, encoding="unicode"),
+                }
+
+        tables_info.append({
+            "rows": len(table.rows),
+            "columns": len(table.rows[0].cells) if len(table.rows) > 0 else 0,
+            "placeholders": sorted(table_placeholders),
+            "is_item_table": is_item_table,
+        })
+
+    paragraph_locations = []
+    for i, paragraph in enumerate(doc.paragraphs):
+        matches = [m.strip() for m in PLACEHOLDER_PATTERN.findall(paragraph.text)]
+        placeholders.update(matches)
+        if _is_replaceable(paragraph.text):
+            paragraph_locations.append(i)
+
+    return {
+        "version": PLAN_VERSION,
+        "template": os.path.basename(template_path),
+        "template_sha256": template_sha256(template_path),
+        "placeholders": sorted(placeholders),
+        "table_locations": table_locations,
+        "paragraph_locations": paragraph_locations,
+        "item_table": item_table,
+        "tables_info": tables_info,
+    }
+
+def save_render_plan(plan, template_path):
+    """以暫存檔加替換的方式寫入渲染計畫，避免並發程序讀到寫一半的檔案"""
+    path = plan_path_for(template_path)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(plan, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+def load_render_plan(template_path):
+    """
+    載入模板的渲染計畫
+
+    依序使用程序內快取、模板旁的計畫檔，內容雜湊不符或版本過舊時重新編譯並寫回
+
+    參數:
+    template_path -- 模板檔案路徑
+
+    返回:
+    dict -- 渲染計畫
+    """
+    stat = os.stat(template_path)
+    with _plan_lock:
+        cached = _plan_cache.get(template_path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        # 在鎖內編譯，同一模板只會被一個執行緒編譯與寫回
+        plan = _load_or_compile_plan(template_path)
+        _plan_cache[template_path] = (stat.st_mtime_ns, stat.st_size, plan)
+        return plan
+
+def _load_or_compile_plan(template_path):
+    """讀取模板旁的計畫檔，內容雜湊不符或版本過舊時重新編譯並寫回"""
+    digest = template_sha256(template_path)
+    plan = None
+    path = plan_path_for(template_path)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                plan = json.load(f)
+            if plan.get("version") != PLAN_VERSION or plan.get("template_sha256") != digest:
+                logger.info(f"渲染計畫已過期，重新編譯: {path}")
+                plan = None
+        except (OSError, ValueError) as e:
+            logger.warning(f"讀取渲染計畫失敗，重新編譯: {e}")
+            plan = None
+
+    if plan is None:
+        plan = compile_render_plan(template_path)
+        try:
+            save_render_plan(plan, template_path)
+            logger.info(f"已寫入渲染計畫: {path}")
+        except OSError as e:
+            # 模板目錄不可寫時仍可使用記憶體中的計畫
+            logger.warning(f"寫入渲染計畫失敗: {e}")
+    return plan
+
+def plan_template_info(plan):
+    """將渲染計畫轉為 analyze_template 相容的模板資訊"""
+    return {
+        "placeholders": set(plan["placeholders"]),
+        "tables_info": [dict(info, placeholders=set(info["placeholders"])) for info in plan["tables_info"]],
+        "item_table_index": plan["item_table"]["index"] if plan["item_table"] else -1,
+    }
+
+def plan_row_prototype(plan):
+    """解析渲染計畫中的項目行原型，沒有項目表格時返回 None"""
+    if not plan.get("item_table"):
+        return None
+    return parse_xml(plan["item_table"]["row_prototype"])
+
+def main():
+    """重新編譯模板的渲染計畫"""
+    default_template = os.path.join(os.path.dirname(os.path.abspath(__file__)), "報價單.docx")
+    parser = argparse.ArgumentParser(description="編譯報價單模板的渲染計畫")
+    parser.add_argument("template", nargs="?", default=default_template, help="模板檔案路徑")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.template):
+        print(f"找不到模板檔案: {args.template}")
+        sys.exit(1)
+
+    plan = compile_render_plan(args.template)
+    path = save_render_plan(plan, args.template)
+    print(f"已編譯渲染計畫: {path}")
+    print(f"佔位符: {len(plan['placeholders'])} 個")
+    print(f"表格佔位符位置: {len(plan['table_locations'])} 處，段落佔位符位置: {len(plan['paragraph_locations'])} 處")
+    if plan["item_table"]:
+        item_table = plan["item_table"]
+        print(f"項目表格: 索引 {item_table['index']}，{item_table['columns']} 欄，欄位 {item_table['fields']}")
+
+if __name__ == "__main__":
+    main()
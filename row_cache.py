@@ -0,0 +1,91 @@
+import os
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from lxml import etree
+
+# 行片段快取容量 (行數)，設為 0 停用
+DEFAULT_ROW_CACHE_SIZE = int(os.environ.get("QUOTE_ROW_CACHE_SIZE", "2048"))
+
+def row_layout_key(prototype):
+    """
+    以行原型的 XML 內容識別表格版面
+
+    相同模板的項目行原型內容相同，不同模板或不同行型 (如分組的首行與延續行) 則不同
+    """
+    return hashlib.sha1(etree.tostring(prototype)).hexdigest()
+
+class RowFragmentCache:
+    """
+    已填好文字的項目行 XML 片段的 LRU 快取
+
+    以 (表格版面, 各欄文字) 為鍵保存完成的 w:tr，常見的標準項目 (主機、維護、設計套組等)
+    再次出現時直接複製快取的片段，不需重新設置每個單元格的文字；
+    可在多個生成執行緒間共用
+
+    參數:
+    max_size -- 最多保存的行數，0 為停用
+    """
+
+    def __init__(self, max_size=DEFAULT_ROW_CACHE_SIZE):
+        self.max_size = max_size
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def get(self, layout, values):
+        """
+        取得快取的行片段副本
+
+        返回:
+        lxml 元素 -- 可直接加入表格的 w:tr，未命中時返回 None
+        """
+        key = (layout, tuple(values))
+        with self._lock:
+            tr = self._rows.get(key)
+            if tr is None:
+                self.misses += 1
+                return None
+            self._rows.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(tr)
+
+    def put(self, layout, values, tr):
+        """保存行片段的副本，超過容量時移除最久未使用的項目"""
+        key = (layout, tuple(values))
+        fragment = copy.deepcopy(tr)
+        with self._lock:
+            self._rows[key] = fragment
+            self._rows.move_to_end(key)
+            while len(self._rows) > self.max_size:
+                self._rows.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """清空快取與統計"""
+        with self._lock:
+            self._rows.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def snapshot(self):
+        """返回快取的統計資訊"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._rows),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+# 整個程序共用的快取
+row_fragment_cache = RowFragmentCache()
@@ -0,0 +1,165 @@
+import os
+import sys
+import sqlite3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import price_catalog
+from price_catalog import PriceCatalog, fill_missing_prices, get_catalog, normalize_name, summarize_fills
+
+ENTRIES = [
+    {"items": "網站設計套組", "unit": "30000", "category": "設計"},
+    {"items": "主機代管（年約）", "unit": 12000, "category": "維運"},
+    {"items": "主機代管（月約）", "unit": 1200, "category": "維運"},
+    {"items": "SEO 優化", "unit": 8000.5},
+    {"items": "無單價", "unit": "洽詢"},
+    {"items": "", "unit": 100},
+]
+
+
+def make_catalog():
+    return PriceCatalog(ENTRIES)
+
+
+def test_entries_without_name_or_price_are_skipped():
+    catalog = make_catalog()
+    assert len(catalog) == 4
+    assert catalog.exact("網站設計套組")["unit"] == 30000
+    assert catalog.exact("無單價") is None
+
+
+def test_later_duplicates_win():
+    catalog = PriceCatalog([{"items": "設計", "unit": 1}, {"items": "設計", "unit": 2}])
+    assert catalog.exact("設計")["unit"] == 2
+
+
+def test_exact_lookup_ignores_width_and_case():
+    assert normalize_name("ＳＥＯ　 優化") == "seo 優化"
+    assert make_catalog().exact("ｓｅｏ 優化")["unit"] == 8000.5
+
+
+def test_prefix_lookup_is_sorted_and_limited():
+    catalog = make_catalog()
+    names = [entry["items"] for entry in catalog.prefix("主機代管")]
+    assert names == ["主機代管（年約）", "主機代管（月約）"]
+    assert len(catalog.prefix("主機代管", limit=1)) == 1
+    assert catalog.prefix("網頁") == []
+    assert catalog.prefix("  ") == []
+
+
+def test_fuzzy_lookup_finds_typos():
+    matches = make_catalog().fuzzy("網站設記套組")
+    assert matches[0][0]["items"] == "網站設計套組"
+    assert 0.6 <= matches[0][1] < 1
+
+
+def test_fuzzy_lookup_respects_cutoff():
+    assert make_catalog().fuzzy("完全無關的名稱") == []
+
+
+def test_fuzzy_scan_limit_still_expands_one_list(monkeypatch):
+    monkeypatch.setattr(price_catalog, "FUZZY_SCAN_LIMIT", 1)
+    matches = make_catalog().fuzzy("網站設記套組")
+    assert matches and matches[0][0]["items"] == "網站設計套組"
+
+
+def test_lookup_reports_match_kind():
+    catalog = make_catalog()
+    assert catalog.lookup("網站設計套組")["match"] == "exact"
+    assert catalog.lookup("主機")["match"] == "prefix"
+    assert catalog.lookup("網站設記套組")["match"] == "fuzzy"
+    assert catalog.lookup("完全無關的名稱") == {"match": None, "results": []}
+
+
+def test_resolve_only_accepts_reliable_matches():
+    catalog = make_catalog()
+    assert catalog.resolve("網站設計套組")[1] == "exact"
+    assert catalog.resolve("網站")[1] == "prefix"
+    # 前綴相符不只一項時不自動選擇
+    assert catalog.resolve("主機代管") == (None, None)
+    # 相似度低於自動填入門檻時不採用
+    assert catalog.resolve("網站設記") == (None, None)
+
+
+def test_fill_missing_prices():
+    quotes = [{
+        "header": {"quoteNumber": "Q-1"},
+        "details": [
+            {"items": "網站設計套組"},
+            {"items": "網站", "quantity": 2},
+            {"items": "SEO 優化", "unit": 5000, "quantity": 3, "amount": 15000},
+            {"items": "客製功能", "unit": 1000, "quantity": 4},
+            {"items": "不存在的項目", "quantity": 1},
+        ],
+    }]
+    filled, missing = fill_missing_prices(quotes, make_catalog())
+    details = quotes[0]["details"]
+
+    assert details[0] == {"items": "網站設計套組", "unit": 30000, "category": "設計", "quantity": 1, "amount": 30000}
+    assert details[1]["amount"] == 60000
+    # 已提供的值不會被覆寫，有單價時只補金額
+    assert details[2]["amount"] == 15000
+    assert details[3]["amount"] == 4000 and "category" not in details[3]
+    assert [record["path"] for record in filled] == ["details[0]", "details[1]", "details[3]"]
+    assert [record["match"] for record in filled] == ["exact", "prefix", None]
+    assert [record["path"] for record in missing] == ["details[4]"]
+    # 沒有指定合計欄位時依補上後的項目重新計算
+    assert quotes[0]["total_without_tax"] == 30000 + 60000 + 15000 + 4000
+
+    text = summarize_fills(filled, missing)
+    assert "補上 3 個項目" in text and "1 個項目找不到" in text
+
+
+def test_fill_keeps_given_totals_and_skips_items_files():
+    quotes = [
+        {"details": [{"items": "網站設計套組"}], "total_without_tax": 1},
+        {"details": [{"items": "網站設計套組"}], "items_file_path": "items.csv"},
+    ]
+    fill_missing_prices(quotes, make_catalog())
+    assert quotes[0]["total_without_tax"] == 1
+    assert "unit" not in quotes[1]["details"][0]
+
+
+def test_fill_variant_lines():
+    quotes = [{
+        "header": {"quoteNumber": "Q-1"},
+        "details": [{"items": "SEO 優化", "unit": 8000, "quantity": 1, "amount": 8000}],
+        "variants": [
+            {"name": "A", "details": [{"items": "網站設計套組"}]},
+            {"name": "B", "extra_details": [{"items": "主機代管（月約）", "quantity": 12}]},
+        ],
+    }]
+    filled, missing = fill_missing_prices(quotes, make_catalog())
+    assert [record["path"] for record in filled] == ["variants[0].details[0]", "variants[1].extra_details[0]"]
+    assert quotes[0]["variants"][1]["extra_details"][0]["amount"] == 14400
+    # 基底項目未變動，不為基底加上合計
+    assert "total_without_tax" not in quotes[0]
+
+
+def test_load_csv_with_chinese_headers(tmp_path):
+    path = tmp_path / "catalog.csv"
+    path.write_text("項目,單價,類別\n網站設計套組,30000,設計\n", encoding="utf-8-sig")
+    catalog = PriceCatalog.load(str(path))
+    assert catalog.exact("網站設計套組") == {"items": "網站設計套組", "unit": 30000, "category": "設計"}
+
+
+def test_load_sqlite(tmp_path):
+    path = str(tmp_path / "catalog.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE catalog (items TEXT, unit REAL, category TEXT)")
+    conn.execute("INSERT INTO catalog VALUES ('主機代管', 12000, '維運')")
+    conn.commit()
+    conn.close()
+    assert PriceCatalog.load(path).exact("主機代管")["unit"] == 12000
+
+
+def test_get_catalog_reloads_changed_file(tmp_path):
+    path = tmp_path / "catalog.csv"
+    path.write_text("items,unit\n設計,100\n", encoding="utf-8")
+    first = get_catalog(str(path))
+    assert get_catalog(str(path)) is first
+
+    path.write_text("items,unit\n設計,200\n開發,300\n", encoding="utf-8")
+    second = get_catalog(str(path))
+    assert second is not first and second.exact("設計")["unit"] == 200
+    assert get_catalog(str(tmp_path / "missing.csv")) is None
@@ -0,0 +1,54 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import quote_profiling
+from quote_profiling import profile_call
+
+
+def test_concurrent_profiled_calls_both_complete(tmp_path, monkeypatch):
+    """兩個同時進行的分析呼叫都應完成，其中一個寫出分析結果"""
+    monkeypatch.setattr(quote_profiling, "PROFILE_DIR", str(tmp_path))
+    barrier = threading.Barrier(2, timeout=30)
+    outcomes = {}
+
+    def work(name):
+        # 兩個呼叫都在 func 內會合，確保分析期間彼此重疊
+        barrier.wait()
+        return name
+
+    def run(name):
+        try:
+            outcomes[name] = profile_call(f"p-{name}", work, name)
+        except Exception as e:
+            outcomes[name] = e
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert [outcomes[name][0] for name in ("a", "b")] == ["a", "b"]
+    infos = [outcomes[name][1] for name in ("a", "b") if outcomes[name][1] is not None]
+    assert len(infos) == 1
+    assert os.path.exists(infos[0]["prof_path"])
+
+
+def test_profile_call_releases_lock_after_failure(tmp_path, monkeypatch):
+    """func 失敗時仍寫出分析結果並釋放鎖，下一次呼叫可正常分析"""
+    monkeypatch.setattr(quote_profiling, "PROFILE_DIR", str(tmp_path))
+
+    def fail():
+        raise RuntimeError("boom")
+
+    try:
+        profile_call("p-fail", fail)
+    except RuntimeError:
+        pass
+    assert os.path.exists(os.path.join(str(tmp_path), "p-fail.prof"))
+
+    result, info = profile_call("p-ok", lambda: 42)
+    assert result == 42 and info["id"] == "p-ok"
@@ -0,0 +1,100 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_quote_docs
+from generate_quote_docs import QuoteRenderer
+
+
+def make_data(quote_number):
+    return {
+        "quotes": [{
+            "header": {"quoteNumber": quote_number, "customerName": "測試客戶"},
+            "details": [{"items": "網站設計", "unit": 1000, "quantity": 2, "amount": 2000}],
+        }]
+    }
+
+
+def run_overlapping(first, second, first_dir, second_dir, snapshot):
+    """first 寫出檔案後暫停，second 在此期間完成生成；snapshot 在 second 寫出檔案時呼叫"""
+    written = threading.Event()
+    second_done = threading.Event()
+
+    def hold_after_writing(step, message, progress=None, result=None):
+        if step == 'completed':
+            written.set()
+            second_done.wait(30)
+
+    def record_when_written(step, message, progress=None, result=None):
+        if step == 'completed':
+            snapshot()
+
+    first.progress_callback = hold_after_writing
+    second.progress_callback = record_when_written
+    first_paths = []
+    thread = threading.Thread(target=lambda: first_paths.extend(first.render(make_data("Q-FIRST"), first_dir)))
+    thread.start()
+    try:
+        assert written.wait(30)
+        second_paths = second.render(make_data("Q-SECOND"), second_dir)
+    finally:
+        second_done.set()
+        thread.join(30)
+    return first_paths, second_paths
+
+
+def test_overlapping_renders_keep_each_others_outputs(tmp_path):
+    """第一份生成寫出檔案後、結束前，第二份生成在同一目錄開始並完成，兩份輸出都應保留"""
+    first = QuoteRenderer(log=lambda message: None)
+    second = QuoteRenderer(log=lambda message: None)
+    first_paths, second_paths = run_overlapping(first, second, str(tmp_path), str(tmp_path), lambda: None)
+
+    assert len(first_paths) == 1 and len(second_paths) == 1
+    for path in first_paths + second_paths:
+        assert os.path.exists(path)
+
+
+def test_cleanup_after_renders_finish(tmp_path):
+    """沒有其他進行中的生成時，仍會清除目錄中先前的輸出"""
+    renderer = QuoteRenderer(output_dir=str(tmp_path), log=lambda message: None)
+    old_paths = renderer.render(make_data("Q-OLD"))
+    new_paths = renderer.render(make_data("Q-NEW"))
+
+    assert not os.path.exists(old_paths[0])
+    assert os.path.exists(new_paths[0])
+
+
+def test_concurrent_renderers_share_active_output_count(tmp_path):
+    """兩個渲染器同時寫入同一目錄時各自登記，結束後登記全部移除"""
+    key = os.path.abspath(str(tmp_path))
+    counts = []
+    first = QuoteRenderer(log=lambda message: None)
+    second = QuoteRenderer(log=lambda message: None)
+
+    run_overlapping(first, second, str(tmp_path), str(tmp_path),
+                    lambda: counts.append(generate_quote_docs._active_outputs[key]))
+
+    assert counts == [2]
+    assert key not in generate_quote_docs._active_outputs
+
+
+def test_concurrent_renderers_in_separate_directories(tmp_path):
+    """兩個渲染器同時寫入不同目錄時登記互不影響"""
+    first_dir, second_dir = str(tmp_path / "first"), str(tmp_path / "second")
+    first_key, second_key = os.path.abspath(first_dir), os.path.abspath(second_dir)
+    snapshots = []
+    first = QuoteRenderer(log=lambda message: None)
+    second = QuoteRenderer(log=lambda message: None)
+
+    first_paths, second_paths = run_overlapping(
+        first, second, first_dir, second_dir,
+        lambda: snapshots.append((generate_quote_docs._active_outputs[first_key], generate_quote_docs._active_outputs[second_key])),
+    )
+
+    assert snapshots == [(1, 1)]
+    assert first_key not in generate_quote_docs._active_outputs
+    assert second_key not in generate_quote_docs._active_outputs
+    assert os.path.dirname(first_paths[0]) == first_dir
+    assert os.path.dirname(second_paths[0]) == second_dir
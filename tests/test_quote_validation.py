@@ -0,0 +1,185 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_quote_docs
+from generate_quote_docs import QuoteRenderer
+from price_catalog import PriceCatalog
+from quote_validation import summarize_validation, validate_input, validate_quotes
+
+HEADER = {
+    "quoteNumber": "Q-100",
+    "Title": "網站專案",
+    "recipient": "測試客戶",
+    "start_date": "2024/01/01",
+    "end_date": "2024/01/31",
+}
+
+
+def catalog():
+    return PriceCatalog([{"items": "主機代管", "unit": 12000, "category": "維運"}])
+
+
+def variant_data():
+    """基底項目已有金額，第二個方案的附加項目只能由價目表定價"""
+    return {
+        "quotes": [{
+            "header": dict(HEADER),
+            "details": [{"items": "網站設計", "unit": 30000, "quantity": 1, "amount": 30000}],
+            "total_without_tax": 30000,
+            "tax_rate": 1500,
+            "total_with_tax": 31500,
+            "variants": [
+                {"name": "基本"},
+                {"name": "進階", "extra_details": [{"items": "主機代管", "quantity": 2}]},
+            ],
+        }]
+    }
+
+
+def test_variant_line_priced_by_catalog_validates():
+    result = validate_input(variant_data(), catalog=catalog())
+    assert result["valid"], result["errors"]
+    assert result["rendered"] == 2
+
+
+def test_variant_line_without_catalog_is_an_error():
+    result = validate_input(variant_data())
+    paths = [entry["path"] for entry in result["errors"]]
+    assert "quotes[0].variants[1].extra_details[0].amount" in paths
+
+
+def test_render_agrees_with_validation_for_catalog_priced_variant(tmp_path, monkeypatch):
+    monkeypatch.setattr(generate_quote_docs, "get_catalog", lambda path=None: catalog())
+    renderer = QuoteRenderer(output_dir=str(tmp_path), log=lambda message: None)
+    report = {}
+    paths = renderer.render(variant_data(), fill_from_catalog=True, report=report)
+
+    assert len(paths) == 2
+    assert report["pricing_issues"] == []
+    assert [record["path"] for record in report["catalog_fills"]] == ["variants[1].extra_details[0]"]
+    assert report["catalog_missing"] == []
+
+
+def make_quote(number="Q-100", **fields):
+    quote = {
+        "header": {**HEADER, "quoteNumber": number},
+        "details": [{"items": "網站設計", "unit": 30000, "quantity": 1, "amount": 30000}],
+        "total_without_tax": 30000,
+        "tax_rate": 1500,
+        "total_with_tax": 31500,
+    }
+    quote.update(fields)
+    return quote
+
+
+def paths(entries):
+    return [entry["path"] for entry in entries]
+
+
+def test_valid_batch_has_no_diagnostics():
+    result = validate_quotes([make_quote("Q-1"), make_quote("Q-2")])
+    assert result == {"valid": True, "quotes": 2, "rendered": 2, "errors": [], "warnings": []}
+    assert summarize_validation(result).startswith("驗證通過")
+
+
+def test_missing_required_header_fields():
+    quote = make_quote()
+    del quote["header"]["recipient"]
+    quote["header"]["Title"] = "  "
+    result = validate_quotes([quote])
+    assert not result["valid"]
+    assert paths(result["errors"]) == ["quotes[0].header.Title", "quotes[0].header.recipient"]
+
+
+def test_header_format_warnings():
+    quote = make_quote("100")
+    quote["header"].update({"start_date": "2024.01.01", "companyContact": "請來電"})
+    result = validate_quotes([quote])
+    assert result["valid"]
+    assert paths(result["warnings"]) == [
+        "quotes[0].header.quoteNumber", "quotes[0].header.start_date", "quotes[0].header.companyContact",
+    ]
+
+
+def test_iso_dates_are_accepted():
+    quote = make_quote()
+    quote["header"].update({"start_date": "2024-01-01", "end_date": "2024-01-31"})
+    assert validate_quotes([quote])["warnings"] == []
+
+
+def test_item_number_checks():
+    quote = make_quote(details=[
+        {"items": "網站設計", "unit": "30,000", "quantity": 1, "amount": 30000},
+        {"items": "", "unit": 100, "quantity": "二", "amount": 200},
+        {"items": "主機", "unit": 100, "quantity": 1},
+    ])
+    result = validate_quotes([quote])
+    errors = paths(result["errors"])
+    assert "quotes[0].details[1].items" in errors
+    assert "quotes[0].details[1].quantity" in errors
+    assert "quotes[0].details[2].amount" in errors
+    assert "quotes[0].details[0].unit" in paths(result["warnings"])
+
+
+def test_format_error_is_not_reported_again_as_mismatch():
+    quote = make_quote(details=[{"items": "網站設計", "unit": 30000, "quantity": 1, "amount": "很多"}])
+    errors = paths(validate_quotes([quote])["errors"])
+    assert errors.count("quotes[0].details[0].amount") == 1
+
+
+def test_amount_mismatch_is_reported():
+    quote = make_quote(details=[{"items": "網站設計", "unit": 30000, "quantity": 2, "amount": 30000}])
+    result = validate_quotes([quote])
+    assert "quotes[0].details[0].amount" in paths(result["errors"])
+
+
+def test_duplicate_quote_numbers():
+    result = validate_quotes([make_quote("Q-1"), make_quote("Q-1")])
+    assert [(entry["index"], entry["path"]) for entry in result["errors"]] == [(1, "quotes[1].header.quoteNumber")]
+
+
+def test_variant_numbers_clash_with_other_quotes():
+    base = make_quote("Q-1", variants=[{"name": "A"}, {"name": "B"}])
+    result = validate_quotes([base, make_quote("Q-1-2")])
+    assert paths(result["errors"]) == ["quotes[1].header.quoteNumber"]
+    assert result["rendered"] == 3
+
+
+def test_mismatch_in_variant_maps_to_variant_path():
+    quote = make_quote("Q-1", variants=[
+        {"name": "A", "extra_details": [{"items": "後台", "unit": 100, "quantity": 2, "amount": 100}]},
+        {"name": "B", "details": [{"items": "前台", "unit": 100, "quantity": 1, "amount": 50}]},
+    ])
+    errors = paths(validate_quotes([quote])["errors"])
+    assert "quotes[0].variants[0].extra_details[0].amount" in errors
+    assert "quotes[0].variants[1].details[0].amount" in errors
+
+
+def test_max_quotes_counts_expanded_variants():
+    quote = make_quote("Q-1", variants=[{"name": "A"}, {"name": "B"}, {"name": "C"}])
+    result = validate_quotes([quote], max_quotes=2)
+    assert result["errors"][0]["index"] is None
+    assert result["errors"][0]["path"] == "quotes"
+
+
+def test_invalid_structures():
+    result = validate_quotes(["not a quote", make_quote(variants="A"), make_quote(variants=[1])])
+    assert paths(result["errors"]) == ["quotes[0]", "quotes[1].variants", "quotes[2].variants[0]"]
+
+
+def test_missing_items_file(tmp_path):
+    quote = make_quote(items_file_path=str(tmp_path / "missing.csv"))
+    assert paths(validate_quotes([quote])["errors"]) == ["quotes[0].items_file_path"]
+
+
+def test_validate_input_rejects_bad_top_level():
+    assert validate_input({"quotes": []})["errors"][0]["message"] == "'quotes' 必須是非空列表"
+    assert not validate_input({"other": 1})["valid"]
+
+
+def test_validate_input_does_not_modify_input():
+    data = variant_data()
+    validate_input(data, catalog=catalog())
+    assert "unit" not in data["quotes"][0]["variants"][1]["extra_details"][0]
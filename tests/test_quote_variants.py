@@ -0,0 +1,136 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_quote_docs import QuoteRenderer
+from quote_variants import count_rendered_quotes, expand_variant, expand_variants, variant_count
+
+
+def make_base(**fields):
+    base = {
+        "header": {"quoteNumber": "Q-1", "Title": "APP 開發", "recipient": "測試客戶"},
+        "details": [{"category": "開發", "items": "會員系統", "unit": 30000, "quantity": 1, "amount": 30000}],
+        "total_without_tax": 30000,
+        "discount": 0,
+        "tax_rate": 1500,
+        "total_with_tax": 31500,
+        "notes": "備註",
+    }
+    base.update(fields)
+    return base
+
+
+def test_variant_counts():
+    assert variant_count(make_base()) == 1
+    assert variant_count(make_base(variants=[])) == 1
+    assert variant_count(make_base(variants=[{}, {}])) == 2
+    assert count_rendered_quotes([make_base(), make_base(variants=[{}, {}, {}])]) == 4
+
+
+def test_unchanged_variant_keeps_base_and_numbers_it():
+    quote = expand_variant(make_base(variants=[{}]), {"name": "基礎"}, 1)
+    assert "variants" not in quote
+    assert quote["header"]["quoteNumber"] == "Q-1-1"
+    assert quote["header"]["Title"] == "APP 開發 - 基礎"
+    assert quote["total_with_tax"] == 31500
+
+
+def test_header_overrides_win_over_generated_values():
+    variant = {"name": "進階", "header": {"quoteNumber": "Q-9", "Title": "自訂標題"}}
+    quote = expand_variant(make_base(), variant, 2)
+    assert quote["header"]["quoteNumber"] == "Q-9"
+    assert quote["header"]["Title"] == "自訂標題"
+    assert quote["header"]["recipient"] == "測試客戶"
+
+
+def test_name_without_base_title():
+    base = make_base()
+    del base["header"]["Title"]
+    assert expand_variant(base, {"name": "豪華"}, 3)["header"]["Title"] == "豪華"
+
+
+def test_extra_details_append_and_recompute_totals():
+    extra = [{"items": "後台", "unit": 20000, "quantity": 1, "amount": 20000}]
+    quote = expand_variant(make_base(), {"extra_details": extra}, 1)
+    assert [item["items"] for item in quote["details"]] == ["會員系統", "後台"]
+    assert (quote["total_without_tax"], quote["tax_rate"], quote["total_with_tax"]) == (50000, 2500, 52500)
+
+
+def test_details_replace_and_discount_recomputes_totals():
+    details = [{"items": "簡易版", "unit": 10000, "quantity": 1, "amount": 10000}]
+    quote = expand_variant(make_base(), {"details": details, "discount": 1000}, 1)
+    assert [item["items"] for item in quote["details"]] == ["簡易版"]
+    assert quote["discount"] == 1000
+    # 未稅小計不含折扣，稅額與總計依折扣後金額計算
+    assert (quote["total_without_tax"], quote["tax_rate"], quote["total_with_tax"]) == (10000, 450, 9450)
+
+
+def test_given_totals_are_not_recomputed():
+    extra = [{"items": "後台", "unit": 20000, "quantity": 1, "amount": 20000}]
+    quote = expand_variant(make_base(), {"extra_details": extra, "total_with_tax": 1}, 1)
+    assert quote["total_with_tax"] == 1
+    assert quote["total_without_tax"] == 30000
+
+
+def test_other_fields_are_overridden():
+    assert expand_variant(make_base(), {"notes": "方案備註"}, 1)["notes"] == "方案備註"
+
+
+def test_items_file_quotes_keep_totals():
+    base = make_base(items_file_path="items.csv")
+    quote = expand_variant(base, {"discount": 500}, 1)
+    assert quote["total_without_tax"] == 30000
+
+
+def test_expanded_variants_do_not_share_data_with_base():
+    base = make_base()
+    quote = expand_variant(base, {"header": {"Title": "新標題"}}, 1)
+    quote["details"][0]["items"] = "已修改"
+    quote["header"]["recipient"] = "已修改"
+    assert base["details"][0]["items"] == "會員系統"
+    assert base["header"] == make_base()["header"]
+
+
+def test_expand_variants_groups():
+    quotes = [
+        make_base(variants=[{"name": "A"}, {"name": "B"}]),
+        make_base(variants=[]),
+        make_base(variants=[{"name": "C"}]),
+        make_base(),
+    ]
+    expanded, groups = expand_variants(quotes)
+    assert len(expanded) == 5
+    # 只有一個方案時不成組
+    assert groups == [[0, 1]]
+    assert "variants" not in expanded[2]
+    assert expanded[3]["header"]["quoteNumber"] == "Q-1-1"
+
+
+def test_expand_variants_rejects_bad_variants():
+    with pytest.raises(ValueError, match=r"quote\[0\]\.variants 必須是列表"):
+        expand_variants([make_base(variants="A")])
+    with pytest.raises(ValueError, match=r"quote\[0\]\.variants\[1\]"):
+        expand_variants([make_base(variants=[{}, "B"])])
+
+
+def test_shared_base_render_matches_flat_render(tmp_path):
+    """以共用基底生成的方案與逐份生成展開後的報價單，輸出完全相同"""
+    variants = [
+        {"name": "基礎"},
+        {"name": "進階", "extra_details": [{"category": "加值", "items": "後台", "unit": 20000, "quantity": 1, "amount": 20000}]},
+        {"name": "豪華", "details": [{"category": "開發", "items": "完整系統", "unit": 80000, "quantity": 1, "amount": 80000}], "discount": 5000},
+    ]
+    grouped_data = {"quotes": [make_base(variants=variants)]}
+    flat_data = {"quotes": expand_variants(grouped_data["quotes"])[0]}
+
+    renderer = QuoteRenderer(log=lambda message: None)
+    grouped = renderer.render(grouped_data, str(tmp_path / "grouped"), deterministic=True)
+    flat = renderer.render(flat_data, str(tmp_path / "flat"), deterministic=True)
+
+    assert [os.path.basename(path) for path in grouped] == [os.path.basename(path) for path in flat]
+    for grouped_path, flat_path in zip(grouped, flat):
+        with open(grouped_path, "rb") as a, open(flat_path, "rb") as b:
+            assert a.read() == b.read()